@@ -0,0 +1,97 @@
+"""
+Benchmark of serving a widget through the Django handler and its
+middleware, compared with the widget dispatcher.
+
+Run from the repository root::
+
+    $ python benchmarks/bench_dispatch.py
+"""
+
+import os
+import sys
+import timeit
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings
+settings.configure(
+    DATABASES={'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }},
+    INSTALLED_APPS=[
+        'django.contrib.auth',
+        'django.contrib.contenttypes',
+        'django.contrib.sessions',
+        'django.contrib.messages',
+    ],
+    MIDDLEWARE_CLASSES=[
+        'django.middleware.common.CommonMiddleware',
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.middleware.csrf.CsrfViewMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'django.contrib.messages.middleware.MessageMiddleware',
+    ],
+    ROOT_URLCONF=__name__,
+    GECKOBOARD_API_KEY='abc',
+)
+
+try:
+    from django.conf.urls import url
+except ImportError:
+    from django.conf.urls.defaults import url  # Django < 1.4
+from django.core.handlers.wsgi import WSGIHandler
+
+from django_geckoboard.decorators import number_widget
+from django_geckoboard.registry import register_widget
+from django_geckoboard.wsgi import WidgetDispatcher
+
+
+REQUESTS = 5000
+
+
+@number_widget
+def comments(request):
+    return (10, 5)
+
+urlpatterns = [
+    url(r'^geckoboard/comments/$', comments),
+]
+
+register_widget('comments', comments)
+
+
+def call(application):
+    environ = {
+        'PATH_INFO': '/geckoboard/comments/',
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+        'CONTENT_LENGTH': '8',
+        'HTTP_AUTHORIZATION': 'Basic YWJjOlg=',
+        'wsgi.input': BytesIO(b'format=2'),
+    }
+    setup_testing_defaults(environ)
+    def start_response(status, headers):
+        assert status.startswith('200')
+    return b''.join(application(environ, start_response))
+
+
+def main():
+    django = WSGIHandler()
+    dispatcher = WidgetDispatcher(django)
+    assert call(django) == call(dispatcher)
+    results = []
+    for name, application in (('Django handler', django),
+            ('Widget dispatcher', dispatcher)):
+        seconds = min(timeit.repeat(lambda: call(application),
+                number=REQUESTS, repeat=3))
+        per_request = seconds / REQUESTS * 1e6
+        results.append(per_request)
+        print("%-20s %8.1f us per request" % (name, per_request))
+    print("%-20s %8.1f us per request" % ("Saved", results[0] - results[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Benchmark of the histogram decorator binning a million samples.
+
+Run from the repository root::
+
+    $ python benchmarks/bench_histogram.py
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings
+settings.configure()
+
+from django_geckoboard import decorators
+from django_geckoboard.decorators import histogram
+
+
+SAMPLES = 1000000
+
+
+def main():
+    samples = [random.lognormvariate(3, 1) for i in range(SAMPLES)]
+    if decorators.numpy is not None:
+        array = decorators.numpy.asarray(samples)
+    cases = [
+        ('fixed, list', histogram(bins=50), lambda: samples),
+        ('fixed, iterator', histogram(bins=50, range=(0, 500)),
+                lambda: iter(samples)),
+        ('log, list', histogram(bins=50, binning='log'), lambda: samples),
+        ('quantile, list', histogram(bins=50, binning='quantile'),
+                lambda: samples),
+    ]
+    if decorators.numpy is not None:
+        cases.append(('fixed, array', histogram(bins=50), lambda: array))
+    print("%d samples, NumPy %s" % (SAMPLES,
+            decorators.numpy is not None and "available" or "not installed"))
+    for name, decorator, get_samples in cases:
+        seconds = min(timeit.repeat(
+                lambda: decorator._convert_view_result(get_samples()),
+                number=1, repeat=3))
+        print("%-20s %8.1f ms" % (name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark of the map decorator clustering a million points.
+
+Run from the repository root::
+
+    $ python benchmarks/bench_map.py
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from django.conf import settings
+settings.configure()
+
+from django_geckoboard import decorators
+from django_geckoboard.decorators import map_widget
+
+
+POINTS = 1000000
+
+
+def main():
+    points = [(random.uniform(-60, 70), random.uniform(-180, 180))
+            for i in range(POINTS)]
+    cases = [
+        ('grid, list', map_widget(cell_size=2.0), lambda: points),
+        ('grid, iterator', map_widget(cell_size=2.0), lambda: iter(points)),
+        ('geohash, list', map_widget(clustering='geohash', precision=3),
+                lambda: points),
+    ]
+    if decorators.numpy is not None:
+        array = decorators.numpy.asarray(points)
+        cases.append(('grid, array', map_widget(cell_size=2.0),
+                lambda: array))
+    print("%d points, NumPy %s" % (POINTS,
+            decorators.numpy is not None and "available" or "not installed"))
+    for name, decorator, get_points in cases:
+        seconds = min(timeit.repeat(
+                lambda: decorators._render_json(
+                    decorator._convert_view_result(get_points())),
+                number=1, repeat=3))
+        data = decorator._convert_view_result(get_points())
+        print("%-20s %8.1f ms  %d clusters" % (name, seconds * 1000,
+                len(data['points']['point'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -237,6 +237,22 @@ comments per day over the last four weeks (including today)::
             "Comments",
         )
 
+The example above fetches every comment.  The
+``django_geckoboard.series.time_series`` function lets the database do
+the bucketing and counting instead, in a single query, and returns a
+tuple ready for the decorator::
+
+    from django_geckoboard.series import time_series
+
+    @line_chart
+    def comment_trend(request):
+        return time_series(Comment.objects.all(), 'submit_date',
+                granularity='day', window=29)
+
+Buckets without rows get a value of 0.  Supported granularities are
+*hour*, *day*, *week* and *month*.  Pass an ``aggregate`` such as
+``Sum('amount')`` to aggregate something other than the row count.
+
 
 ``geck_o_meter``
 ----------------
@@ -298,6 +314,53 @@ vs. anonymous users::
         }
 
 
+``leaderboard``
+---------------
+
+Render a *Leaderboard* widget.
+
+The decorated view must return an iterable over tuples *(label, value)*.
+The *k* entries (default 10) with the highest values are shown, or the
+lowest values if the *ascending* option is set.  The top entries are
+selected in a single pass with a bounded heap, so the view can return a
+QuerySet iterator without sorting it.  With the *rank_changes* option
+each entry also gets its rank in the previous ranking, which is kept in
+the Django cache.  For example, to show the ten customers with the most
+orders::
+
+    from django.db.models import Count
+    from django_geckoboard.decorators import leaderboard
+
+    @leaderboard(k=10, rank_changes=True)
+    def top_customers(request):
+        return Order.objects.values_list('customer') \\
+                .annotate(Count('id')).iterator()
+
+
+``map_widget``
+--------------
+
+Render a *Map* widget.
+
+The decorated view must return an iterable over tuples *(latitude,
+longitude)*, or a NumPy array with those two columns.  Points are
+aggregated into clusters on a grid of *cell_size* degrees (default 1),
+or with ``clustering='geohash'`` into geohash cells of *precision*
+characters (default 3).  Each cluster is plotted at the mean position of
+its points, sized relative to the largest cluster.  At most *max_points*
+clusters (default 500) are plotted, so the payload size does not depend
+on the number of points.  For example, to plot the orders of the last
+day::
+
+    from django_geckoboard.decorators import map_widget
+
+    @map_widget(cell_size=0.5, color='ff8800')
+    def recent_orders(request):
+        since = datetime.now() - timedelta(days=1)
+        return Order.objects.filter(created__gte=since) \\
+                .values_list('latitude', 'longitude').iterator()
+
+
 ``Bullet Graph``
 ----------
 
@@ -340,6 +403,625 @@ To create a bullet graph of the number of users:
                }
 
 
+
+``histogram``
+-------------
+
+Render the distribution of a set of samples as a *Line chart* widget.
+
+The decorated view must return the samples, as a list, an iterator or a
+NumPy array of numbers.  The decorator options *bins* (default 10) and
+*binning* determine the bins: ``'fixed'`` (the default) for bins of
+equal width, ``'log'`` for bins of equal width on a log scale and
+``'quantile'`` for bins containing roughly the same number of samples.
+Set *range* to a tuple *(min, max)* to fix the binned range; samples
+outside it are not counted.  For example, to show the distribution of
+order amounts::
+
+    from django_geckoboard.decorators import histogram
+
+    @histogram(bins=20, binning='log', range=(1, 10000))
+    def order_amounts(request):
+        return Order.objects.values_list('amount', flat=True).iterator()
+
+If NumPy is installed, binning is vectorized.  When a range is given,
+fixed and log bins are counted in chunks, so iterators are not loaded
+into memory.
+
+
+Widget options
+==============
+
+All decorators can also be called with keyword options, which returns a
+configured decorator::
+
+    @number_widget(profile_rate=0.01)
+    def user_count(request):
+        ...
+
+
+Profiling slow widgets
+----------------------
+
+The ``profile_rate`` option profiles the given fraction of requests
+using cProfile.  Use ``profile_threshold`` to keep only profiles of
+requests that take at least that many seconds; a request over the
+threshold also causes the next few requests of the widget to be
+profiled, so setting only a threshold is enough to catch widgets that
+become slow::
+
+    @line_chart(profile_threshold=2.0)
+    def comment_trend(request):
+        ...
+
+Profiles are written to the directory set in ``GECKOBOARD_PROFILE_DIR``
+(by default a directory in the system temporary directory), named after
+the widget view and the requested format.  At most
+``profile_max_files`` profiles (default 10) are kept per widget and
+format.  Load them using the ``pstats`` module.
+
+
+Computation deadlines
+---------------------
+
+If a widget view may be slow, for example because the database is under
+load, use the ``deadline`` option to give it a time budget in seconds::
+
+    @number_widget(deadline=5)
+    def user_count(request):
+        ...
+
+The view is run in a background thread.  If it does not finish within
+the deadline, the last successfully rendered payload of the widget is
+returned immediately, with an ``X-Geckoboard-Stale`` header containing
+its age in seconds.  The view keeps running and stores its payload for
+the next request when it finishes.  If there is no previous payload, the
+request waits for the view.  Payloads are stored in the Django cache for
+``GECKOBOARD_PAYLOAD_TIMEOUT`` seconds (default one day).
+
+
+Circuit breakers
+----------------
+
+When a data source of a widget is down, every poll re-runs a view that
+fails.  The ``circuit_breaker`` option stops calling the view after a
+number of failures::
+
+    @rag_widget(circuit_breaker={'failures': 5, 'window': 60,
+                                 'reset_timeout': 30})
+    def comments(request):
+        ...
+
+When the view raises an exception (or exceeds its ``deadline``)
+``failures`` times within ``window`` seconds, the circuit opens.  While
+it is open the view is not called; the last successfully rendered
+payload is returned instead, or a 503 response if there is none.  The
+response has an ``X-Geckoboard-Circuit`` header containing the circuit
+state.  After ``reset_timeout`` seconds a single request is let through
+to probe the view; if it succeeds the circuit closes again.  Pass
+``True`` to use the defaults shown above.
+
+Set ``'shared': True`` to keep the circuit state in the Django cache, so
+that all workers share it.  Use
+``django_geckoboard.circuitbreaker.breaker_stats()`` to get the state of
+all circuit breakers for monitoring.
+
+
+Concurrency limits
+------------------
+
+A single slow widget polled by many dashboards at once can occupy all
+worker threads.  The ``max_concurrency`` option limits the number of
+concurrent calls of the view in a process::
+
+    @line_chart(max_concurrency=2, max_queue=4, queue_timeout=5)
+    def comment_trend(request):
+        ...
+
+Up to ``max_queue`` further requests (default 0) wait at most
+``queue_timeout`` seconds for a free slot.  Requests that find the queue
+full or time out get the last successfully rendered payload, or a 503
+response if there is none, with an ``X-Geckoboard-Rejected`` header.
+Use ``django_geckoboard.bulkheads.bulkhead_stats()`` to get the active
+calls, queue depth and rejection counters of all widgets.
+
+
+Shared-memory payload cache
+---------------------------
+
+The ``cache_timeout`` option caches the rendered payload of a widget
+for the given number of seconds in a memory-mapped file that is shared
+by all worker processes on the host::
+
+    @pie_chart(cache_timeout=60)
+    def user_types(request):
+        ...
+
+The first worker that renders the widget stores the payload and all
+other workers serve it until it expires, without recomputing it or
+querying an external cache.  Payloads are cached per format and URL
+arguments.  The file is divided into ``GECKOBOARD_SHARED_CACHE_SLOTS``
+slots (default 256) of ``GECKOBOARD_SHARED_CACHE_SLOT_SIZE`` bytes
+(default 65536); payloads that do not fit in a slot are not cached and
+the least recently used payloads are evicted when the cache is full.
+The file is created in ``/dev/shm`` (or the system temporary directory),
+with a name specific to the Django project and the user, unless
+``GECKOBOARD_SHARED_CACHE_PATH`` is set.  If the file cannot be opened,
+a warning is logged and payloads are not cached.
+
+A fixed timeout recomputes widgets that rarely change too often and
+serves stale data for fast-moving ones.  With the ``adaptive_cache``
+option the timeout is adapted to each widget::
+
+    @number_widget(adaptive_cache={'min_timeout': 5, 'max_timeout': 600})
+    def signups(request):
+        ...
+
+Every recomputation measures its duration and compares the payload
+with the previous one.  The timeout is set to half the expected time
+between changes (``staleness``, default 0.5) and doubles while the
+payload does not change.  If recomputing on every poll would keep a
+worker busy more than ``max_load`` of the time (default 0.1), the
+timeout is raised until it does not.  The timeout starts at
+``cache_timeout``, if set, and stays between ``min_timeout`` and
+``max_timeout``.  Use ``django_geckoboard.refresh.ttl_stats()`` to see
+the timeout chosen for each widget, the reason for it and the measured
+cost, change rate and poll interval.
+
+
+Recording and replaying widget results
+--------------------------------------
+
+The ``record_rate`` option records the given fraction of view results
+of a widget, before conversion, together with the XML and JSON payloads
+rendered from them::
+
+    @funnel(record_rate=0.01)
+    def signups(request):
+        ...
+
+A background thread renders the records and appends them to a corpus
+file per widget in the directory set in ``GECKOBOARD_RECORD_DIR``, up
+to ``GECKOBOARD_RECORD_MAX_BYTES`` bytes per widget (default 1 MB).
+Records are pickles, so the directory must only be writable by trusted
+users; the default is a subdirectory of the system temporary directory
+that is private to the current user.  View results that are QuerySets or iterators,
+or contain them or more than 10000 items, are not recorded, as that
+would evaluate or consume them in the request; only the converted data
+of their widgets is recorded.  Lookups of the snapshot history, stored
+leaderboard rankings and approximate counts made by the conversion are
+recorded too, and replayed instead of reading or changing the database
+and cache.  The ``geckoboard_replay`` management command
+replays the corpus through the conversion and rendering code, reports
+records that render differently from the recording and the time spent
+per widget and, on Python 3, the peak memory allocated::
+
+    ./manage.py geckoboard_replay --save=report-1.2.json
+    ./manage.py geckoboard_replay --baseline=report-1.1.json
+
+Use ``--baseline`` with a report saved by another version of
+django-geckoboard to see how the changes between versions affect real
+widget data.
+
+
+Serving widgets without middleware
+----------------------------------
+
+A Geckoboard poll routed through Django runs the complete middleware
+stack (sessions, authentication, CSRF protection, messages) and URL
+resolution before it reaches the widget view, although the widget only
+checks the API key and renders its data.  The WSGI application in
+``django_geckoboard.wsgi`` serves registered widgets directly and
+passes all other requests on to Django.  In your ``wsgi.py``::
+
+    from django.core.wsgi import get_wsgi_application
+    from django_geckoboard.registry import register_widget
+    from django_geckoboard.wsgi import WidgetDispatcher
+
+    from myapp.widgets import comment_count
+
+    register_widget('comments', comment_count)
+    application = WidgetDispatcher(get_wsgi_application(),
+            prefix='/geckoboard/')
+
+The widget is now served at ``/geckoboard/comments/``, with the same
+API key check, formats and widget options as the decorated view.  The
+``request_started`` and ``request_finished`` signals are still sent, so
+database connections are closed as usual.  Run
+``benchmarks/bench_dispatch.py`` to measure the overhead saved per
+request.
+
+
+Background refresh on multiple nodes
+------------------------------------
+
+Widgets with the ``refresh_interval`` option are recomputed in the
+background by the ``geckoboard_refresh`` management command, and
+requests are served the stored payload while it is at most two
+intervals old.  The widgets must be registered, for example in the
+URLconf, which the command imports::
+
+    from django_geckoboard.registry import register_widget
+
+    @line_chart(refresh_interval=60)
+    def orders_per_day(request):
+        ...
+
+    register_widget('orders', orders_per_day)
+
+Run the command on every application node::
+
+    ./manage.py geckoboard_refresh
+
+The nodes share the work through leases in the ``RefreshLease`` table
+(so add ``django_geckoboard`` to ``INSTALLED_APPS`` and run ``migrate``,
+or ``syncdb`` before Django 1.7) of the ``GECKOBOARD_LEASE_DATABASE``
+database (default 'default').  Every node records a heartbeat and each widget is assigned
+to one of the live nodes by consistent hashing, so a widget is computed
+by one node at a time and adding or removing a node moves only the
+widgets of that node.  A node refreshes a widget only while it holds
+its lease; widgets that are overdue because their node is busy are
+stolen by other nodes, and the widgets of a node that stopped sending
+heartbeats are reassigned to the remaining nodes.  A widget whose view
+fails is retried after its refresh interval.  The payloads are stored
+in the Django cache, which must be shared by the nodes, and the node
+clocks must be synchronized.
+
+
+Read replicas and statement timeouts
+------------------------------------
+
+Dashboard queries should not add load to the primary database.  The
+``using`` option routes every ORM read made by the view, and by the
+conversion of a lazy QuerySet it returns, to another database alias;
+writes still go to the database chosen by your other routers::
+
+    @pie_chart(using='replica', statement_timeout=2)
+    def user_types(request):
+        ...
+
+Set ``GECKOBOARD_DATABASE`` to route all widgets.  The routing is done
+by ``django_geckoboard.routing.WidgetRouter``, which is added in front
+of your ``DATABASE_ROUTERS`` and is only active in the thread running
+the view; queries with an explicit ``using()`` and raw cursors from
+``django.db.connection`` are not routed.  The ``statement_timeout``
+option aborts statements of the view that run longer than the given
+number of seconds, using ``statement_timeout`` on PostgreSQL,
+``max_execution_time`` on MySQL (SELECT statements only) and a progress
+handler on SQLite.  The view then raises a ``DatabaseError``, which can
+trip the ``circuit_breaker``.
+
+
+Query budgets
+-------------
+
+Widget views easily regress into dozens of queries, for example a pie
+chart that counts per category in a loop.  The ``max_queries`` option
+counts and times the queries made while the widget is computed and
+reports computations that need more::
+
+    @pie_chart(max_queries=3)
+    def user_types(request):
+        ...
+
+A statement that is repeated with different parameters
+``query_repeat_threshold`` times (default 5) is reported as a likely
+N+1 query.  Violations are logged, unless ``query_budget_action`` or the
+``GECKOBOARD_QUERY_BUDGET_ACTION`` setting is 'warn', which issues a
+``QueryBudgetWarning``, or 'raise', which raises
+``QueryBudgetExceeded`` and is useful in tests.  Use
+``track_queries=True`` to count queries without a budget, and
+``django_geckoboard.querycount.query_stats()`` to get the query count,
+total SQL time and repeated statements of each widget.  Queries are
+intercepted with ``execute_wrapper`` on Django 2.0 and newer and with
+the debug cursor on older versions.
+
+
+Snapshot history
+----------------
+
+With the ``snapshot_interval`` option, the converted data of a widget is
+stored in the ``WidgetSnapshot`` model at most every that many seconds.
+A *number_widget* with the ``compare_to`` option then only needs to
+return the current value; the previous value is the one stored that
+many seconds ago::
+
+    @number_widget(snapshot_interval=300, compare_to=24 * 60 * 60)
+    def user_count(request):
+        return User.objects.count()
+
+A view taking URL arguments has a separate history for each set of
+arguments; ``snapshot_key(name, args, kwargs)`` in
+``django_geckoboard.snapshots`` returns the key to pass in place of the
+widget for one of them.
+
+The history of a *number_widget* or *geck_o_meter* also feeds a line
+chart without querying the data again::
+
+    from django_geckoboard.series import snapshot_series
+
+    @line_chart
+    def user_count_today(request):
+        return snapshot_series(user_count, window=24 * 60 * 60, points=48)
+
+Run the ``geckoboard_prune_snapshots`` management command periodically
+to keep the history small.  The ``GECKOBOARD_SNAPSHOT_RETENTION``
+setting lists ``(age, resolution)`` tiers in seconds: snapshots up to
+a tier's age are averaged into one snapshot per resolution (0 keeps all
+snapshots), and snapshots older than the last tier are deleted.  The default keeps a
+day of raw snapshots, a week of hourly and a year of daily averages.
+Snapshots are stored in the ``GECKOBOARD_SNAPSHOT_DATABASE`` database
+(default 'default').
+
+
+Approximate counts
+------------------
+
+Exact counts of tables with hundreds of millions of rows take seconds,
+while a *number_widget* only shows a few significant digits.  With the
+``approximate_count`` option, the view can return QuerySets, whose
+counts are estimated and rounded to two significant digits::
+
+    @number_widget(approximate_count=True)
+    def event_count(request):
+        return Event.objects.all()
+
+Counts of whole tables are read from the planner statistics of the
+database (``sqlite_stat1`` after ``ANALYZE`` on SQLite, ``pg_class`` on
+PostgreSQL and ``information_schema.TABLES`` on MySQL).  Filtered
+QuerySets on models with an integer primary key are counted on random
+primary key ranges covering about ``sample_size`` rows.  Tables
+estimated to have fewer rows than ``threshold`` are counted exactly.
+Pass a dictionary to set ``threshold``, ``sample_size`` or ``digits``,
+or use the ``GECKOBOARD_APPROXIMATE_COUNT_THRESHOLD`` (default 100000)
+and ``GECKOBOARD_APPROXIMATE_COUNT_SAMPLE_SIZE`` (default 10000)
+settings.  ``django_geckoboard.approx.approximate_count`` returns the
+estimate together with the bounds of its 95% confidence interval.
+
+
+Distinct counts
+---------------
+
+Counting unique visitors with ``COUNT(DISTINCT ...)`` on every poll
+reads the whole event table.  A ``DistinctCounter`` keeps HyperLogLog
+sketches of the distinct values per time bucket instead, using
+``2 ** precision`` bytes per bucket (4 KB and 1.6% standard error by
+default)::
+
+    from django_geckoboard.hyperloglog import DistinctCounter, \
+            distinct_count_widget
+
+    visitors = DistinctCounter('visitors', bucket_size=60 * 60)
+
+    def track_visitor(request):
+        visitors.add(request.session.session_key)
+
+    unique_visitors = distinct_count_widget(visitors, 24 * 60 * 60)
+
+Values are added to sketches in the process and written with
+``visitors.flush()``, for example from a periodic task, to the Django
+cache or, with ``storage='database'``, to the ``DistinctSketch`` model.
+``distinct_count_widget`` returns a *number_widget* view showing the
+distinct count of the last period next to that of the period before;
+``visitors.counts(period)`` returns the same tuple for your own views.
+
+
+Percentile gauges
+-----------------
+
+A *geck_o_meter* showing the 95th percentile response time would have
+to read and sort every sample.  A ``QuantileTracker`` keeps a t-digest
+per time bucket instead, a sketch of about 2 KB that estimates any
+quantile to within 0.1% in rank::
+
+    from django_geckoboard.tdigest import QuantileTracker, quantile_widget
+
+    response_times = QuantileTracker('response_time', bucket_size=60)
+
+    def track_response(duration):
+        response_times.add(duration)
+
+    p95_response_time = quantile_widget(response_times, 0.95, 15 * 60,
+            minimum=0, maximum=2)
+
+Values are added to digests in the process and moved to the Django
+cache with ``response_times.flush()``, for example from a periodic
+task.  Processes flushing the same bucket take turns using a lock in
+the cache, so no values are lost.  ``quantile_widget`` returns a *geck_o_meter* view for a quantile
+of the last period; ``response_times.gauge(0.95, period)`` returns the
+same ``(value, min, max)`` tuple for your own views, with the smallest
+and largest values of the period as default minimum and maximum.
+Digests are merged with ``TDigest.merge``, so the quantiles of any
+number of buckets are computed in constant time per bucket.
+
+
+Parallel queries
+----------------
+
+A *rag_widget* or *funnel* view typically runs a few independent, slow
+queries one after another.  Add them to a ``Parallel`` set to run them
+concurrently, so that the view takes as long as the slowest query::
+
+    from django_geckoboard.parallel import Parallel
+
+    @rag_widget
+    def ticket_counts(request):
+        queries = Parallel()
+        queries.add('red', Ticket.objects.filter(priority='high').count)
+        queries.add('amber', Ticket.objects.filter(priority='medium').count)
+        queries.add('green', Ticket.objects.filter(priority='low').count)
+        red, amber, green = queries.run()
+        return ((red, 'High'), (amber, 'Medium'), (green, 'Low'))
+
+``run()`` returns the results in the order the sub-computations were
+added and ``run_dict()`` returns them by name.  They run on a pool of
+``GECKOBOARD_PARALLEL_WORKERS`` threads (default 8) shared by all
+widgets, and on the thread of the view, with at most ``max_workers``
+threads per set.  Each thread has its own database connections, which
+are routed to the database of the widget and closed when a pool thread
+is done.  Queries and allocations on pool threads count against the
+query and memory budgets of the widget.
+
+
+Data providers
+--------------
+
+Widgets on the same dashboard often show different views of the same
+data.  Declare the expensive computation once as a data provider and
+let the widgets declare the providers they use, which are passed to the
+views as keyword arguments::
+
+    from django_geckoboard.providers import provider
+
+    @provider(ttl=60)
+    def user_types():
+        return dict(User.objects.values_list('type')
+                .annotate(Count('pk')).order_by())
+
+    @number_widget(providers=[user_types])
+    def user_count(request, user_types):
+        return sum(user_types.values())
+
+    @pie_chart(providers={'types': 'user_types'})
+    def user_type_chart(request, types):
+        return [(count, name) for name, count in types.items()]
+
+A provider is computed on demand, when a widget using it is computed,
+and its value is reused for ``ttl`` seconds; concurrent requests wait
+for a single computation.  Providers can use other providers with
+``depends=['name', ...]``, and ``shared=True`` keeps the value in the
+Django cache for all workers.  In the background refresh loop, each
+provider is computed at most once per cycle; use
+``django_geckoboard.providers.refresh_cycle()`` for the same behavior
+in your own code.  ``provider_stats()`` reports the computations, cache
+hits and consuming widgets of each provider.
+
+
+Event stream
+------------
+
+Self-hosted wallboards can receive the payloads of registered widgets
+over one Server-Sent Events connection instead of polling every widget.
+Map the ``widget_events`` view to a URL::
+
+    from django_geckoboard.sse import widget_events
+
+    urlpatterns = patterns('',
+        url(r'^geckoboard/events/$', widget_events),
+    )
+
+and subscribe with the comma-separated registry paths of the widgets::
+
+    var events = new EventSource('/geckoboard/events/?widgets=users,sales');
+    events.addEventListener('users', function (event) {
+        render(JSON.parse(event.data));
+    });
+
+Each event is named after the widget path and carries the JSON payload,
+or the XML payload with ``format=1``.  The widgets subscribed to are
+computed in a background thread of the process every
+``refresh_interval`` seconds, or every ``GECKOBOARD_SSE_INTERVAL``
+seconds (default 10), once for all clients, and a payload is only sent
+when it changed.  A keepalive comment is sent every
+``GECKOBOARD_SSE_KEEPALIVE`` seconds (default 15).  Every open stream
+occupies a worker thread of the WSGI server, so serve the stream from a
+threaded server, outside middleware that buffers responses.  The stream
+needs Django 1.5 or newer.
+
+
+Memory budgets
+--------------
+
+Views that load whole tables into Python or build large intermediate
+lists can make a worker's memory grow with every refresh.  The
+``max_memory`` option measures, with ``tracemalloc``, the memory
+allocated while the widget is computed and reports computations whose
+peak allocation exceeds that many bytes::
+
+    @line_chart(max_memory=8 * 1024 * 1024)
+    def signups(request):
+        ...
+
+The peak and net allocations are measured separately for the view, the
+conversion of its result and the rendering of the payload.  Violations
+are handled like query budget violations: they are logged, unless
+``memory_budget_action`` or the ``GECKOBOARD_MEMORY_BUDGET_ACTION``
+setting is 'warn', which issues a ``MemoryBudgetWarning``, or 'raise',
+which raises ``MemoryBudgetExceeded``.  Use ``track_memory=True`` to
+measure allocations without a budget, ``memory_stats()`` to get the
+measurements of each widget and ``memory_report()`` for a table of the
+widgets with the highest peaks, all from ``django_geckoboard.memory``.
+
+Tracing allocations slows down the computation and counts the
+allocations of all threads, so enable it in tests or on a single worker.
+Budgets are not checked for computations that overlap another tracked
+computation, in another thread or nested through data providers, as
+they share a single peak.  Measurements need Python 3.4 or newer;
+per-phase peaks and budgets need Python 3.9.
+
+
+Log file tails
+--------------
+
+Text and RAG widgets often show what an application log says.  A
+``FileTail`` from ``django_geckoboard.tail`` remembers the byte offset
+it read a file up to, so each poll reads only the lines appended since
+the previous one, instead of scanning the whole file::
+
+    from django_geckoboard.tail import FileTail
+
+    app_log = FileTail('/var/log/app.log', pattern='ERROR', max_lines=5,
+            counters={'errors': 'ERROR', 'warnings': 'WARNING'})
+
+    @text_widget
+    def recent_errors(request):
+        return [(line, TEXT_WARN) for line in app_log.lines()]
+
+    @rag_widget
+    def log_levels(request):
+        counts = app_log.counts()
+        return ((counts['errors'], 'Errors'),
+                (counts['warnings'], 'Warnings'), (None, None))
+
+``lines()`` returns the most recent lines matching ``pattern``, newest
+first, and ``counts()`` the number of lines matching each counter since
+the tail was created.  The lines and counts are kept per process, so
+with several worker processes each one reads the file and counts the
+lines it saw itself.  A rotated log file is read to its end before the
+new file is followed, and a truncated file is read again from its
+beginning.  Use ``backlog`` to read at most that many bytes of an
+existing file the first time, or pass a ``checkpoint`` saved from
+another tail to resume where it stopped.
+
+
+Datasets
+========
+
+Besides custom widgets, Geckoboard can show data pushed to the
+`Datasets API`_.  The ``django_geckoboard.datasets`` module defines
+datasets from Django models and streams QuerySet rows to Geckoboard::
+
+    from django_geckoboard.datasets import DatasetsClient, QuerySetDataset
+
+    client = DatasetsClient()
+    orders = QuerySetDataset('shop.orders', Order.objects.all(),
+            fields=['id', 'amount', 'created', 'updated'],
+            updated_field='updated', unique_by=['id'])
+    orders.push(client)   # replace all data
+    orders.sync(client)   # send rows updated since the last sync
+
+The dataset schema is derived from the model fields.  Rows are read in
+chunks using ``QuerySet.iterator`` and sent in requests of the maximum
+size allowed by the API over a single connection, so memory use does
+not depend on the number of rows.  The high-water mark of the
+``updated_field`` used by ``sync`` is stored in the ``DatasetState``
+model; pass ``since`` to ``sync`` to send the rows updated after
+another value.  The
+client uses the ``GECKOBOARD_DATASETS_API_KEY`` setting, which is the
+account API key and not the widget key set in ``GECKOBOARD_API_KEY``.
+
+.. _`Datasets API`: https://developer.geckoboard.com/
+
 .. _`Geckoboard API`: http://geckoboard.zendesk.com/forums/207979-geckoboard-api
 """
 
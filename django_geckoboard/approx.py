@@ -0,0 +1,183 @@
+"""
+Approximate row counts for number widgets.
+
+Exact counts of very large tables take seconds, while a dashboard only
+shows a few significant digits.  The row count of a whole table is read
+from the planner statistics of the database, and the count of a filtered
+QuerySet is estimated from a sample of primary key ranges.  Small tables
+are counted exactly.
+"""
+
+import math
+import random
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Min, Q
+
+
+DEFAULT_THRESHOLD = 100000
+DEFAULT_SAMPLE_SIZE = 10000
+
+# Number of primary key ranges a sample is spread over.
+SAMPLE_RANGES = 10
+
+# Normal quantile of the reported error bounds (95% confidence).
+Z = 1.96
+
+INTEGER_FIELDS = ('AutoField', 'BigAutoField', 'BigIntegerField',
+        'IntegerField', 'PositiveIntegerField', 'SmallIntegerField')
+
+
+class Count(namedtuple('Count', 'value error method')):
+    """
+    A row count.  `value` is the (estimated) count and `error` the
+    half-width of its 95% confidence interval, or `None` if unknown.
+    `method` is 'exact', 'statistics' or 'sample'.
+    """
+
+    @property
+    def exact(self):
+        return self.method == 'exact'
+
+
+def approximate_count(queryset, threshold=None, sample_size=None):
+    """
+    Return the `Count` of the rows of a QuerySet.
+
+    QuerySets without filters are counted from the planner statistics
+    (``sqlite_stat1`` after ``ANALYZE`` on SQLite, ``pg_class`` on
+    PostgreSQL and ``information_schema.TABLES`` on MySQL).  Filtered
+    QuerySets on models with an integer primary key are counted on a
+    sample of about `sample_size` rows (default the
+    ``GECKOBOARD_APPROXIMATE_COUNT_SAMPLE_SIZE`` setting or 10000).
+    Tables estimated to have fewer rows than `threshold` (default the
+    ``GECKOBOARD_APPROXIMATE_COUNT_THRESHOLD`` setting or 100000) and
+    QuerySets that cannot be estimated are counted exactly.
+    """
+    if threshold is None:
+        threshold = getattr(settings,
+                'GECKOBOARD_APPROXIMATE_COUNT_THRESHOLD', DEFAULT_THRESHOLD)
+    if sample_size is None:
+        sample_size = getattr(settings,
+                'GECKOBOARD_APPROXIMATE_COUNT_SAMPLE_SIZE',
+                DEFAULT_SAMPLE_SIZE)
+    query = queryset.query
+    if query.distinct or query.low_mark or query.high_mark is not None:
+        return _exact(queryset)
+    total = table_estimate(queryset.model, queryset.db)
+    if total is not None and total < threshold:
+        return _exact(queryset)
+    if not query.where.children and total is not None:
+        return Count(int(total), None, 'statistics')
+    if queryset.model._meta.pk.get_internal_type() not in INTEGER_FIELDS:
+        return _exact(queryset)
+    return _sample_count(queryset, total, threshold, sample_size)
+
+
+def table_estimate(model, using='default'):
+    """
+    Return the number of rows of the table of a model according to the
+    planner statistics of the database, or `None` if there are none.
+    """
+    connection = connections[using]
+    vendor = getattr(connection, 'vendor', None)
+    table = model._meta.db_table
+    cursor = connection.cursor()
+    if vendor == 'sqlite':
+        cursor.execute("SELECT 1 FROM sqlite_master "
+                "WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if cursor.fetchone() is None:
+            return None  # ANALYZE was never run
+        cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s",
+                [table])
+        # The first number of each row is the number of table rows, or
+        # of index entries, which is the same for complete indexes.
+        counts = [int(row[0].split()[0]) for row in cursor.fetchall()
+                if row[0]]
+        return counts and max(counts) or None
+    if vendor == 'postgresql':
+        # The planner scales the tuple density of the last ANALYZE to
+        # the current number of pages.
+        cursor.execute("SELECT reltuples, relpages, "
+                "pg_relation_size(oid) / current_setting('block_size')::int "
+                "FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(table)])
+        row = cursor.fetchone()
+        if row is None or row[0] < 0:
+            return None  # never analyzed
+        reltuples, relpages, pages = row
+        if relpages > 0:
+            return int(reltuples / relpages * pages)
+        return int(reltuples)
+    if vendor == 'mysql':
+        cursor.execute("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [table])
+        row = cursor.fetchone()
+        if row is None or row[0] is None:
+            return None
+        return int(row[0])
+    return None
+
+
+def round_significant(value, digits=2):
+    """Round a number to `digits` significant digits."""
+    if not value:
+        return value
+    magnitude = int(math.floor(math.log10(abs(value))))
+    rounded = round(float(value), digits - 1 - magnitude)
+    if rounded.is_integer():
+        return int(rounded)
+    return rounded
+
+
+def _exact(queryset):
+    return Count(queryset.count(), 0, 'exact')
+
+def _sample_count(queryset, total, threshold, sample_size):
+    """
+    Estimate the count of a filtered QuerySet from the rows in random
+    primary key ranges covering about `sample_size` rows.
+    """
+    model = queryset.model
+    rows = model._default_manager.using(queryset.db)
+    pk_name = model._meta.pk.name
+    bounds = rows.aggregate(low=Min(pk_name), high=Max(pk_name))
+    low, high = bounds['low'], bounds['high']
+    if low is None:
+        return Count(0, 0, 'exact')
+    span = high - low + 1
+    measured = total is None
+    if measured:
+        total = span  # assume a dense key until measured
+    if total < threshold or span <= sample_size:
+        return _exact(queryset)
+    width = int(span * sample_size / float(total) / SAMPLE_RANGES)
+    width = min(max(width, 1), span)
+    starts = sorted(random.randint(low, high - width + 1)
+            for i in range(SAMPLE_RANGES))
+    ranges = []
+    for start in starts:
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = start + width  # merge overlapping ranges
+        else:
+            ranges.append([start, start + width])
+    sample = Q()
+    for start, end in ranges:
+        sample |= Q(pk__gte=start, pk__lt=end)
+    if measured:
+        # Without statistics, the density of the matching rows in the
+        # sampled key ranges is extrapolated to the whole key range.
+        matched = queryset.filter(sample).count()
+        scale = span / float(sum(end - start for start, end in ranges))
+        return Count(int(round(matched * scale)),
+                int(math.ceil(Z * math.sqrt(matched) * scale)), 'sample')
+    sampled = rows.filter(sample).count()
+    if not sampled:
+        return _exact(queryset)
+    matched = queryset.filter(sample).count()
+    ratio = matched / float(sampled)
+    error = Z * total * math.sqrt(ratio * (1 - ratio) / sampled)
+    return Count(int(round(ratio * total)), int(math.ceil(error)), 'sample')
@@ -0,0 +1,94 @@
+"""
+Background computation of widget payloads.
+"""
+
+import logging
+import sys
+import threading
+
+from django.db import connections
+
+from django_geckoboard.bulkheads import BulkheadFull
+
+
+logger = logging.getLogger('django_geckoboard')
+
+_running = {}
+_running_lock = threading.Lock()
+
+
+class Computation(object):
+    """
+    A function call running in a background thread.
+
+    Database connections opened by the thread are closed when the call
+    finishes.
+    """
+
+    def __init__(self, key, func):
+        self.key = key
+        self._func = func
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._thread = threading.Thread(target=self._run,
+                name='geckoboard-%s' % key)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the computation to finish.  Return whether it did
+        finish within `timeout` seconds.
+        """
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+    def get(self):
+        """Return the result of the finished computation, or re-raise
+        the exception raised by the computation, with its traceback."""
+        if self._exc_info is not None:
+            _reraise(*self._exc_info)
+        return self._result
+
+    def _run(self):
+        try:
+            self._result = self._func()
+        except BulkheadFull:
+            # Rejected calls are expected under load, not failures.
+            self._exc_info = sys.exc_info()
+        except Exception:
+            logger.exception("Background computation of %s failed",
+                    self.key)
+            self._exc_info = sys.exc_info()
+        finally:
+            for connection in connections.all():
+                connection.close()
+            with _running_lock:
+                if _running.get(self.key) is self:
+                    del _running[self.key]
+            self._done.set()
+
+
+def run_in_background(key, func):
+    """
+    Run `func` in a background thread and return the `Computation`.  If
+    a computation with the same key is still running, it is returned
+    instead of starting a new one.
+    """
+    with _running_lock:
+        computation = _running.get(key)
+        if computation is None:
+            computation = Computation(key, func)
+            _running[key] = computation
+            computation.start()
+    return computation
+
+
+if sys.version_info[0] < 3:
+    exec("def _reraise(tp, value, tb):\n    raise tp, value, tb\n")
+else:
+    def _reraise(tp, value, tb):
+        raise value.with_traceback(tb)
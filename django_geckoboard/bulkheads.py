@@ -0,0 +1,115 @@
+"""
+Per-widget concurrency limits (bulkheads).
+"""
+
+import threading
+import time
+
+
+_bulkheads = {}
+_bulkheads_lock = threading.Lock()
+
+
+class BulkheadFull(Exception):
+    """
+    Raised when a view cannot be run because its bulkhead is full.
+    """
+
+
+class Bulkhead(object):
+    """
+    Limits the number of concurrent calls of a widget view in a process.
+
+    At most `max_concurrency` calls run at the same time.  Up to
+    `max_queue` further calls wait for a free slot, for at most
+    `timeout` seconds.  Calls that find the queue full or time out
+    waiting raise `BulkheadFull`.
+    """
+
+    def __init__(self, name, max_concurrency, max_queue=0, timeout=None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._condition = threading.Condition(threading.Lock())
+        self._active = 0
+        self._waiting = 0
+        self._max_waiting = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._completed = 0
+
+    def acquire(self):
+        """Wait for a free slot, or raise `BulkheadFull`."""
+        with self._condition:
+            if self._active < self.max_concurrency and not self._waiting:
+                self._active += 1
+                return
+            if self._waiting >= self.max_queue:
+                self._rejected += 1
+                raise BulkheadFull("%s: queue full" % self.name)
+            self._waiting += 1
+            self._max_waiting = max(self._max_waiting, self._waiting)
+            try:
+                deadline = None
+                if self.timeout is not None:
+                    deadline = time.time() + self.timeout
+                while self._active >= self.max_concurrency:
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            self._timed_out += 1
+                            raise BulkheadFull("%s: timed out waiting"
+                                    % self.name)
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._active += 1
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._completed += 1
+            self._condition.notify()
+
+    def call(self, func, *args, **kwargs):
+        """Call `func` within the bulkhead."""
+        self.acquire()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.release()
+
+    def stats(self):
+        """Return a dictionary describing the bulkhead for monitoring."""
+        with self._condition:
+            return {
+                'active': self._active,
+                'queue_depth': self._waiting,
+                'max_queue_depth': self._max_waiting,
+                'rejected': self._rejected,
+                'timed_out': self._timed_out,
+                'completed': self._completed,
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+            }
+
+
+def register_bulkhead(bulkhead):
+    """Register a bulkhead for monitoring."""
+    with _bulkheads_lock:
+        _bulkheads[bulkhead.name] = bulkhead
+
+
+def get_bulkhead(name):
+    """Return the registered bulkhead of a widget, or `None`."""
+    with _bulkheads_lock:
+        return _bulkheads.get(name)
+
+
+def bulkhead_stats():
+    """Return the stats of all bulkheads, keyed by widget name."""
+    with _bulkheads_lock:
+        bulkheads = list(_bulkheads.values())
+    return dict((bulkhead.name, bulkhead.stats()) for bulkhead in bulkheads)
@@ -0,0 +1,175 @@
+"""
+Circuit breakers around failing widget views.
+"""
+
+import threading
+import time
+
+from django.core.cache import cache
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitBreaker(object):
+    """
+    A circuit breaker for a single widget.
+
+    The circuit opens when `failures` failures occur within `window`
+    seconds.  While it is open, `allow_request` returns `False`.  After
+    `reset_timeout` seconds the circuit becomes half-open and a single
+    probe request is allowed through.  If the probe succeeds the circuit
+    closes, otherwise it opens again.
+
+    If `shared` is true, the state is kept in the Django cache so that
+    all workers using the same cache see the same circuit.  Updates of
+    shared state are not atomic across workers, which at worst lets an
+    extra probe through.
+    """
+
+    def __init__(self, name, failures=5, window=60, reset_timeout=30,
+            shared=False):
+        self.name = name
+        self.failures = failures
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.shared = shared
+        self._cache_key = 'django_geckoboard:breaker:%s' % name
+        self._lock = threading.Lock()
+        self._local_state = _initial_state()
+
+    @property
+    def state(self):
+        """The current state: `CLOSED`, `OPEN` or `HALF_OPEN`."""
+        with self._lock:
+            state = self._load()
+            self._update(state, time.time())
+            return state['state']
+
+    def allow_request(self):
+        """Return whether the view may be called."""
+        with self._lock:
+            now = time.time()
+            state = self._load()
+            self._update(state, now)
+            if state['state'] == CLOSED:
+                return True
+            if state['state'] == HALF_OPEN and state['probe_started'] is None:
+                state['probe_started'] = now
+                self._save(state)
+                return True
+            return False
+
+    def record_success(self):
+        """Record a successful call of the view."""
+        with self._lock:
+            state = self._load()
+            if state['state'] == CLOSED and not state['failure_times']:
+                return
+            self._save(_initial_state())
+
+    def record_failure(self):
+        """Record a failed call of the view."""
+        with self._lock:
+            now = time.time()
+            state = self._load()
+            if state['state'] == CLOSED:
+                failure_times = [t for t in state['failure_times']
+                        if t > now - self.window]
+                failure_times.append(now)
+                state['failure_times'] = failure_times[-self.failures:]
+                if len(state['failure_times']) >= self.failures:
+                    _open(state, now)
+            else:
+                _open(state, now)
+            self._save(state)
+
+    def stats(self):
+        """Return a dictionary describing the breaker for monitoring."""
+        with self._lock:
+            now = time.time()
+            state = self._load()
+            self._update(state, now)
+            stats = {
+                'state': state['state'],
+                'recent_failures': len([t for t in state['failure_times']
+                        if t > now - self.window]),
+                'opened_at': state['opened_at'],
+                'failures': self.failures,
+                'window': self.window,
+                'reset_timeout': self.reset_timeout,
+                'shared': self.shared,
+            }
+            return stats
+
+    def reset(self):
+        """Close the circuit and forget recorded failures."""
+        with self._lock:
+            self._save(_initial_state())
+
+    def _update(self, state, now):
+        # Move to half-open when the reset timeout elapsed, and allow a
+        # new probe if the previous one did not report back in time.
+        if state['state'] == OPEN:
+            if now - state['opened_at'] >= self.reset_timeout:
+                state['state'] = HALF_OPEN
+                state['probe_started'] = None
+        elif state['state'] == HALF_OPEN:
+            probe_started = state['probe_started']
+            if probe_started is not None and \
+                    now - probe_started >= self.reset_timeout:
+                state['probe_started'] = None
+
+    def _load(self):
+        if not self.shared:
+            return self._local_state
+        state = cache.get(self._cache_key)
+        if state is None:
+            state = _initial_state()
+        return state
+
+    def _save(self, state):
+        if self.shared:
+            cache.set(self._cache_key, state,
+                    max(self.window, self.reset_timeout) * 10)
+        else:
+            self._local_state = state
+
+
+def _initial_state():
+    return {
+        'state': CLOSED,
+        'failure_times': [],
+        'opened_at': None,
+        'probe_started': None,
+    }
+
+def _open(state, now):
+    state['state'] = OPEN
+    state['opened_at'] = now
+    state['probe_started'] = None
+    state['failure_times'] = []
+
+
+def register_breaker(breaker):
+    """Register a circuit breaker for monitoring."""
+    with _breakers_lock:
+        _breakers[breaker.name] = breaker
+
+
+def get_breaker(name):
+    """Return the registered circuit breaker of a widget, or `None`."""
+    with _breakers_lock:
+        return _breakers.get(name)
+
+
+def breaker_stats():
+    """Return the stats of all circuit breakers, keyed by widget name."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return dict((breaker.name, breaker.stats()) for breaker in breakers)
@@ -0,0 +1,201 @@
+"""
+Background refresh of widgets coordinated between nodes.
+
+Widgets registered with `django_geckoboard.registry` that have the
+``refresh_interval`` option are recomputed in the background and their
+payloads stored for the requests.  When several nodes run the refresh
+loop, each widget is assigned to a node by consistent hashing over the
+live nodes and refreshed under a lease in the database, so that no two
+nodes compute the same widget.  Nodes steal overdue widgets from busy or
+dead nodes.
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import time
+
+from django.conf import settings
+from django.db import connections, IntegrityError, transaction
+
+from django_geckoboard.models import RefreshNode, RefreshLease
+from django_geckoboard.payloads import set_payload
+from django_geckoboard.providers import refresh_cycle
+from django_geckoboard.recording import format_request
+from django_geckoboard.registry import registered_widgets
+
+
+logger = logging.getLogger('django_geckoboard')
+
+FORMATS = ('1', '2')
+
+try:
+    _atomic = transaction.atomic
+except AttributeError:
+    _atomic = transaction.commit_on_success  # Django < 1.6
+
+
+class RefreshCoordinator(object):
+    """
+    Refreshes the widgets assigned to this node.
+
+    A node is alive while its heartbeat is younger than `node_timeout`
+    seconds.  A widget is refreshed by the node it hashes to, unless it
+    is overdue by `steal_after` seconds (default the node timeout), in
+    which case any node may take it.  A lease expires after
+    `lease_timeout` seconds, so that the widgets of a node that died
+    while refreshing them are taken over.  The leases are kept in the
+    database `using` (default the ``GECKOBOARD_LEASE_DATABASE`` setting
+    or 'default'), which must be shared by all nodes.
+    """
+
+    def __init__(self, node=None, lease_timeout=60, node_timeout=30,
+            steal_after=None, replicas=64, using=None):
+        if node is None:
+            node = '%s:%d' % (socket.gethostname(), os.getpid())
+        if steal_after is None:
+            steal_after = node_timeout
+        if using is None:
+            using = getattr(settings, 'GECKOBOARD_LEASE_DATABASE',
+                    'default')
+        self.node = node
+        self.lease_timeout = lease_timeout
+        self.node_timeout = node_timeout
+        self.steal_after = steal_after
+        self.replicas = replicas
+        self.using = using
+
+    def heartbeat(self):
+        """Mark this node as alive."""
+        now = time.time()
+        nodes = RefreshNode.objects.using(self.using)
+        if not nodes.filter(name=self.node).update(heartbeat=now):
+            try:
+                with _atomic(using=self.using):
+                    nodes.create(name=self.node, heartbeat=now)
+            except IntegrityError:
+                nodes.filter(name=self.node).update(heartbeat=now)
+
+    def live_nodes(self):
+        """Return the names of the live nodes."""
+        return sorted(RefreshNode.objects.using(self.using)
+                .filter(heartbeat__gt=time.time() - self.node_timeout)
+                .values_list('name', flat=True))
+
+    def leave(self):
+        """Remove this node and give up its leases."""
+        RefreshNode.objects.using(self.using).filter(name=self.node).delete()
+        RefreshLease.objects.using(self.using).filter(owner=self.node) \
+                .update(owner='', expires=0)
+
+    def run_once(self):
+        """
+        Refresh the widgets that are due and return the names of the
+        refreshed widgets.  Widgets assigned to this node are refreshed
+        first, then overdue widgets of other nodes.
+        """
+        self.heartbeat()
+        ring = HashRing(self.live_nodes() or [self.node], self.replicas)
+        widgets = _refreshed_widgets()
+        own = []
+        others = []
+        for name in sorted(widgets):
+            if ring.get_node(name) == self.node:
+                own.append(name)
+            else:
+                others.append(name)
+        refreshed = []
+        # Widgets of a cycle share the values of their data providers.
+        with refresh_cycle():
+            for names, delay in ((own, 0), (others, self.steal_after)):
+                for name in names:
+                    widget = widgets[name]
+                    if self._claim(name, widget.options['refresh_interval']
+                            + delay) and self._refresh(widget):
+                        refreshed.append(name)
+        return refreshed
+
+    def run(self, interval=1.0, stop_event=None):
+        """Refresh widgets every `interval` seconds until stopped."""
+        try:
+            while stop_event is None or not stop_event.is_set():
+                try:
+                    self.run_once()
+                except Exception:
+                    logger.exception("Refreshing widgets on %s failed",
+                            self.node)
+                for connection in connections.all():
+                    connection.close()
+                if stop_event is None:
+                    time.sleep(interval)
+                else:
+                    stop_event.wait(interval)
+        finally:
+            self.leave()
+
+    def _claim(self, name, age):
+        """
+        Take the lease of a widget refreshed more than `age` seconds ago,
+        unless another node holds it.  Return whether it was taken.
+        """
+        now = time.time()
+        leases = RefreshLease.objects.using(self.using)
+        if not leases.filter(widget=name).exists():
+            try:
+                with _atomic(using=self.using):
+                    leases.create(widget=name)
+            except IntegrityError:
+                pass  # created by another node
+        return leases.filter(widget=name, expires__lt=now,
+                refreshed__lte=now - age).update(owner=self.node,
+                expires=now + self.lease_timeout) == 1
+
+    def _refresh(self, widget):
+        """
+        Store new payloads of a widget and release its lease.  Return
+        whether the refresh succeeded.  A failed widget keeps its lease
+        for one refresh interval, so that it is retried no more often
+        than it is refreshed.
+        """
+        try:
+            for format in FORMATS:
+                request = format_request(format)
+                content = widget._compute(request, (), {})
+                set_payload(widget._payload_key(request, (), {}), content)
+        except Exception:
+            logger.exception("Refreshing widget %s failed", widget.name)
+            fields = {'expires': time.time()
+                    + widget.options['refresh_interval']}
+        else:
+            fields = {'expires': 0, 'refreshed': time.time()}
+        RefreshLease.objects.using(self.using).filter(widget=widget.name,
+                owner=self.node).update(**fields)
+        return 'refreshed' in fields
+
+
+class HashRing(object):
+    """
+    A consistent hash ring of nodes, with `replicas` points per node.
+    """
+
+    def __init__(self, nodes, replicas=64):
+        self._points = sorted((_hash('%s#%d' % (node, i)), node)
+                for node in nodes for i in range(replicas))
+        self._hashes = [point[0] for point in self._points]
+
+    def get_node(self, key):
+        """Return the node a key is assigned to."""
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._points)
+        return self._points[index][1]
+
+
+def _hash(value):
+    return int(hashlib.md5(value.encode('utf-8')).hexdigest()[:16], 16)
+
+def _refreshed_widgets():
+    """Return the registered widgets with a refresh interval, by name."""
+    return dict((widget.name, widget)
+            for widget in registered_widgets().values()
+            if widget.options.get('refresh_interval'))
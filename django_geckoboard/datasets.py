@@ -0,0 +1,351 @@
+"""
+Geckoboard Datasets API client.
+
+Datasets are defined from Django model fields, and rows are streamed
+from a QuerySet to Geckoboard in chunks of the maximum size allowed by
+the API, using a single persistent connection.
+"""
+
+import base64
+import datetime
+import decimal
+import itertools
+import json
+import socket
+from collections import OrderedDict
+
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib  # Python 3
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from django_geckoboard.decorators import GeckoboardException
+from django_geckoboard.models import DatasetState
+
+
+API_HOST = 'api.geckoboard.com'
+
+# Requests that may be repeated without changing the result.
+IDEMPOTENT_METHODS = ('GET', 'PUT', 'DELETE')
+
+try:
+    _atomic = transaction.atomic
+except AttributeError:
+    _atomic = transaction.commit_on_success  # Django < 1.6
+
+FIELD_TYPES = {
+    'AutoField': 'number',
+    'BigIntegerField': 'number',
+    'DecimalField': 'number',
+    'FloatField': 'number',
+    'IntegerField': 'number',
+    'PositiveIntegerField': 'number',
+    'PositiveSmallIntegerField': 'number',
+    'SmallIntegerField': 'number',
+    'CharField': 'string',
+    'EmailField': 'string',
+    'SlugField': 'string',
+    'TextField': 'string',
+    'URLField': 'string',
+    'DateField': 'date',
+    'DateTimeField': 'datetime',
+}
+
+
+class DatasetsError(GeckoboardException):
+    """
+    Represents an error returned by the Geckoboard Datasets API.
+    """
+
+    def __init__(self, status, message):
+        super(DatasetsError, self).__init__("%s: %s" % (status, message))
+        self.status = status
+
+
+def schema_from_model(model, fields=None):
+    """
+    Return the Datasets schema for fields of a Django model.
+
+    `fields` is a list of field names and defaults to all concrete fields
+    of a supported type.  The field verbose names are used as the names
+    shown in Geckoboard and nullable fields are marked optional.
+    """
+    if fields is None:
+        model_fields = [f for f in model._meta.fields
+                if f.get_internal_type() in FIELD_TYPES]
+    else:
+        model_fields = [model._meta.get_field(name) for name in fields]
+    schema = OrderedDict()
+    for field in model_fields:
+        field_type = FIELD_TYPES.get(field.get_internal_type())
+        if field_type is None:
+            raise GeckoboardException("Unsupported dataset field type: %s"
+                    % field.get_internal_type())
+        definition = OrderedDict()
+        definition['type'] = field_type
+        definition['name'] = u'%s' % field.verbose_name
+        if field.null:
+            definition['optional'] = True
+        schema[field.attname] = definition
+    return schema
+
+
+class DatasetsClient(object):
+    """
+    Client for the Geckoboard Datasets API.
+
+    The API key defaults to the ``GECKOBOARD_DATASETS_API_KEY`` setting.
+    All requests reuse one HTTP connection, which is reopened if the
+    server closed it.  Requests failing on a reused connection are
+    retried once if they could not be sent or are idempotent; appends
+    that may have reached the server are not repeated.
+    """
+
+    max_append_records = 500
+    max_replace_records = 5000
+
+    def __init__(self, api_key=None, host=API_HOST, port=None, secure=True,
+            timeout=30):
+        if api_key is None:
+            api_key = getattr(settings, 'GECKOBOARD_DATASETS_API_KEY', None)
+        if api_key is None:
+            raise GeckoboardException("No Geckoboard Datasets API key set")
+        self.api_key = api_key
+        self.host = host
+        self.port = port
+        self.secure = secure
+        self.timeout = timeout
+        self._connection = None
+
+    def create(self, dataset_id, fields, unique_by=None):
+        """Find or create a dataset with the given schema."""
+        body = OrderedDict([('fields', fields)])
+        if unique_by:
+            body['unique_by'] = list(unique_by)
+        return self._request('PUT', '/datasets/%s' % dataset_id, body)
+
+    def delete(self, dataset_id):
+        """Delete a dataset and all its data."""
+        return self._request('DELETE', '/datasets/%s' % dataset_id)
+
+    def append(self, dataset_id, rows, delete_by=None):
+        """
+        Append rows to a dataset, in chunks of `max_append_records`.
+        Return the number of rows sent.
+        """
+        count = 0
+        for chunk in _chunks(rows, self.max_append_records):
+            body = OrderedDict([('data', chunk)])
+            if delete_by:
+                body['delete_by'] = delete_by
+            self._request('POST', '/datasets/%s/data' % dataset_id, body)
+            count += len(chunk)
+        return count
+
+    def replace(self, dataset_id, rows):
+        """
+        Replace the data of a dataset.  The first `max_replace_records`
+        rows replace the data and any further rows are appended.  Return
+        the number of rows sent.
+        """
+        rows = iter(rows)
+        chunk = list(itertools.islice(rows, self.max_replace_records))
+        self._request('PUT', '/datasets/%s/data' % dataset_id,
+                {'data': chunk})
+        return len(chunk) + self.append(dataset_id, rows)
+
+    def close(self):
+        """Close the connection."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _request(self, method, path, body=None):
+        headers = {
+            'Authorization': 'Basic %s' % _basic_auth(self.api_key),
+            'User-Agent': 'django-geckoboard',
+        }
+        data = None
+        if body is not None:
+            data = json.dumps(body, default=_json_default)
+            headers['Content-Type'] = 'application/json'
+        try:
+            response = self._send(method, path, data, headers)
+        except _SendError:
+            # The server may have closed the idle connection; retry once.
+            self.close()
+            response = self._send(method, path, data, headers)
+        except (httplib.HTTPException, socket.error):
+            self.close()
+            if method not in IDEMPOTENT_METHODS:
+                raise
+            response = self._send(method, path, data, headers)
+        content = response.read()
+        if not 200 <= response.status < 300:
+            raise DatasetsError(response.status, _error_message(content))
+        if content:
+            return json.loads(content)
+        return None
+
+    def _send(self, method, path, data, headers):
+        if self._connection is None:
+            if self.secure:
+                connection_class = httplib.HTTPSConnection
+            else:
+                connection_class = httplib.HTTPConnection
+            self._connection = connection_class(self.host, self.port,
+                    timeout=self.timeout)
+        try:
+            self._connection.request(method, path, data, headers)
+        except (httplib.HTTPException, socket.error) as e:
+            raise _SendError(e)
+        return self._connection.getresponse()
+
+
+class _SendError(Exception):
+    """A request that failed before it was sent completely."""
+
+
+class QuerySetDataset(object):
+    """
+    A Geckoboard dataset filled from a Django QuerySet.
+
+    Rows are read using `QuerySet.iterator` in chunks of `chunk_size`
+    rows and sent to Geckoboard as they are read, so memory use does not
+    depend on the size of the QuerySet.
+
+    If `updated_field` is set, `sync` sends only the rows that were
+    updated since the last sync.  The high-water mark of that field is
+    stored in the ``DatasetState`` model.
+    """
+
+    def __init__(self, dataset_id, queryset, fields=None, updated_field=None,
+            unique_by=None, chunk_size=1000):
+        self.dataset_id = dataset_id
+        self.queryset = queryset
+        self.schema = schema_from_model(queryset.model, fields)
+        if updated_field and updated_field not in self.schema:
+            raise GeckoboardException("The updated_field must be one of "
+                    "the dataset fields")
+        self.updated_field = updated_field
+        self.unique_by = unique_by
+        self.chunk_size = chunk_size
+
+    def create(self, client):
+        """Create the dataset in Geckoboard."""
+        return client.create(self.dataset_id, self.schema, self.unique_by)
+
+    def push(self, client):
+        """Replace the dataset data with all rows of the QuerySet."""
+        self.create(client)
+        queryset = self.queryset
+        if self.updated_field:
+            queryset = queryset.order_by(self.updated_field)
+        return client.replace(self.dataset_id, self._rows(queryset))
+
+    def sync(self, client, since=None):
+        """
+        Append the rows updated after `since` (by default the high-water
+        mark of the previous sync), store the new high-water mark and
+        return the number of rows sent.
+        """
+        if not self.updated_field:
+            raise GeckoboardException("Incremental sync needs an "
+                    "updated_field")
+        if since is None:
+            since = self.high_water_mark()
+        queryset = self.queryset.order_by(self.updated_field)
+        if since is not None:
+            queryset = queryset.filter(
+                    **{'%s__gt' % self.updated_field: since})
+        tracker = _HighWaterMarkTracker(self.updated_field)
+        rows = tracker.track(self._rows(queryset))
+        count = client.append(self.dataset_id, rows)
+        if tracker.value is not None:
+            self.set_high_water_mark(tracker.value)
+        return count
+
+    def high_water_mark(self):
+        """Return the updated field value of the last synced row."""
+        try:
+            state = DatasetState.objects.get(dataset_id=self.dataset_id)
+        except DatasetState.DoesNotExist:
+            return None
+        field = self.queryset.model._meta.get_field(self.updated_field)
+        return field.to_python(state.high_water_mark)
+
+    def set_high_water_mark(self, value):
+        """Make the next sync send the rows updated after `value`."""
+        encoded = _mark_text(value)
+        states = DatasetState.objects.filter(dataset_id=self.dataset_id)
+        if states.update(high_water_mark=encoded):
+            return
+        try:
+            with _atomic():
+                DatasetState.objects.create(dataset_id=self.dataset_id,
+                        high_water_mark=encoded)
+        except IntegrityError:
+            states.update(high_water_mark=encoded)
+
+    def reset_high_water_mark(self):
+        """Make the next sync send all rows."""
+        DatasetState.objects.filter(dataset_id=self.dataset_id).delete()
+
+    def _rows(self, queryset):
+        values = queryset.values(*self.schema.keys())
+        try:
+            rows = values.iterator(chunk_size=self.chunk_size)
+        except TypeError:
+            # Django versions before 2.0 have no chunk_size argument.
+            rows = values.iterator()
+        return rows
+
+
+class _HighWaterMarkTracker(object):
+
+    def __init__(self, field):
+        self.field = field
+        self.value = None
+
+    def track(self, rows):
+        for row in rows:
+            self.value = row[self.field]
+            yield row
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _mark_text(value):
+    """Return the text of a high-water mark, as parsed by its field."""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return u'%s' % value
+
+def _basic_auth(api_key):
+    return base64.b64encode(('%s:' % api_key).encode('utf-8')).decode('ascii')
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError("%r is not JSON serializable" % value)
+
+def _error_message(content):
+    try:
+        return json.loads(content)['error']['message']
+    except (ValueError, KeyError, TypeError):
+        return content
@@ -3,9 +3,16 @@ Geckoboard decorators.
 """
 
 import base64
+import bisect
+import copy
+import heapq
+import itertools
 from xml.dom.minidom import Document
 from collections import OrderedDict
 import json
+import math
+import threading
+import time
 
 
 try:
@@ -13,16 +20,47 @@ try:
 except ImportError:
     from django.utils.functional import wraps  # Python 2.4 fallback
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models.query import QuerySet
 from django.http import HttpResponse, HttpResponseForbidden
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import available_attrs
 
+from django_geckoboard.approx import approximate_count, round_significant
+from django_geckoboard.background import run_in_background
+from django_geckoboard.bulkheads import Bulkhead, BulkheadFull, \
+        register_bulkhead
+from django_geckoboard.circuitbreaker import CircuitBreaker, register_breaker
+from django_geckoboard.memory import MemoryTracker, NO_MEASUREMENT, \
+        register_tracker
+from django_geckoboard.payloads import arguments_digest, payload_key, \
+        get_payload, set_payload
+from django_geckoboard.profiling import WidgetProfiler
+from django_geckoboard.providers import provider_values
+from django_geckoboard.querycount import QueryBudget, register_budget
+from django_geckoboard.recording import Recorder, recorded_lookup
+from django_geckoboard.refresh import AdaptiveTTL, register_policy
+from django_geckoboard.routing import widget_database
+from django_geckoboard.shm import get_shared_cache
+
 
 TEXT_NONE = 0
 TEXT_INFO = 2
 TEXT_WARN = 1
 
+STALE_HEADER = 'X-Geckoboard-Stale'
+CIRCUIT_HEADER = 'X-Geckoboard-Circuit'
+REJECTED_HEADER = 'X-Geckoboard-Rejected'
+
+# The URLconf arguments of the view whose result is being converted.
+_local = threading.local()
+
 
 class WidgetDecorator(object):
     """
@@ -35,22 +73,357 @@ class WidgetDecorator(object):
     If the ``GECKOBOARD_API_KEY`` setting is used, the request must
     contain the correct API key, or a 403 Forbidden response is
     returned.
+
+    The decorator can also be called with keyword options to create a
+    configured decorator, e.g. ``@number_widget(profile_rate=0.01)``.
+    Supported options:
+
+        profile_rate:       Fraction of requests to profile with
+                            cProfile (default 0, disabled).
+        profile_threshold:  Only keep profiles of requests taking at
+                            least this many seconds.  A request over
+                            the threshold also arms profiling of the
+                            next few requests of the widget.
+        profile_max_files:  Number of profile dumps kept per widget
+                            (default 10).
+        deadline:           Time budget in seconds for the view.  If it
+                            is exceeded, the last successfully rendered
+                            payload is returned with a
+                            ``X-Geckoboard-Stale`` header containing its
+                            age in seconds, while the view finishes in
+                            the background and refreshes the payload.
+        circuit_breaker:    `True` or a dictionary of `CircuitBreaker`
+                            options (`failures`, `window`,
+                            `reset_timeout`, `shared`).  While the
+                            circuit is open the view is not called and
+                            the last payload or a 503 response is
+                            returned.
+        cache_timeout:      Cache rendered payloads for this many
+                            seconds in the shared-memory cache of the
+                            host (see `django_geckoboard.shm`).
+        adaptive_cache:     `True` or a dictionary of `AdaptiveTTL`
+                            options (`min_timeout`, `max_timeout`,
+                            `staleness`, `max_load`).  Cache rendered
+                            payloads in the shared-memory cache for a
+                            timeout adapted to the cost, change rate
+                            and poll frequency of the widget, starting
+                            from `cache_timeout` if it is set.
+        max_concurrency:    The maximum number of concurrent calls of
+                            the view in a process.
+        max_queue:          The number of calls that may wait for a
+                            free slot (default 0).
+        queue_timeout:      The maximum time in seconds a call waits in
+                            the queue.  Calls that find the queue full
+                            or time out get the last payload or a 503
+                            response, with a ``X-Geckoboard-Rejected``
+                            header.
+        refresh_interval:   Recompute the payloads every this many
+                            seconds in the background refresh loop (see
+                            `django_geckoboard.coordination`).  Requests
+                            are served the refreshed payload while it is
+                            at most two intervals old.
+        using:              Database alias that all ORM reads made by
+                            the view are routed to, typically a read
+                            replica.  Defaults to the
+                            ``GECKOBOARD_DATABASE`` setting.
+        statement_timeout:  Abort database statements of the view
+                            running longer than this many seconds
+                            (PostgreSQL, MySQL and SQLite).
+        max_queries:        The maximum number of database queries per
+                            computation.  Queries are counted and timed
+                            per widget (see
+                            `django_geckoboard.querycount`).
+        query_budget_action: 'warn', 'log' or 'raise' when the budget is
+                            exceeded or a statement is repeated
+                            `query_repeat_threshold` times (default 5).
+                            Defaults to the
+                            ``GECKOBOARD_QUERY_BUDGET_ACTION`` setting
+                            or 'log'.
+        track_queries:      Count and time queries without a budget.
+        max_memory:         The maximum number of bytes a computation may
+                            allocate at its peak.  Allocations are
+                            measured per widget for the view, the
+                            conversion and the rendering (see
+                            `django_geckoboard.memory`).
+        memory_budget_action: 'warn', 'log' or 'raise' when the memory
+                            budget is exceeded.  Defaults to the
+                            ``GECKOBOARD_MEMORY_BUDGET_ACTION`` setting
+                            or 'log'.
+        track_memory:       Measure allocations without a budget.
+        record_rate:        Fraction of view results to record to the
+                            replay corpus (see
+                            `django_geckoboard.recording`).
+        snapshot_interval:  Store the converted data in the snapshot
+                            history at most every this many seconds
+                            (see `django_geckoboard.snapshots`).
+        providers:          A list of data providers or provider names,
+                            whose values are passed to the view as
+                            keyword arguments named after the
+                            providers, or a dictionary of providers
+                            keyed by argument name (see
+                            `django_geckoboard.providers`).
     """
-    def __call__(self, view_func):
+
+    def __init__(self, **options):
+        self.options = options
+        self.name = None
+        self.view_func = None
+
+    def __call__(self, view_func=None, **options):
+        if view_func is None:
+            merged = dict(self.options)
+            merged.update(options)
+            return self.__class__(**merged)
+        widget = self._bind(view_func)
         def _wrapped_view(request, *args, **kwargs):
             if not _is_api_key_correct(request):
                 return HttpResponseForbidden("Geckoboard API key incorrect")
-            view_result = view_func(request, *args, **kwargs)
-            data = self._convert_view_result(view_result)
-            content = _render(request, data)
-            return HttpResponse(content)
+            return widget._respond(request, args, kwargs)
         wrapper = wraps(view_func, assigned=available_attrs(view_func))
-        return csrf_exempt(wrapper(_wrapped_view))
+        wrapped_view = csrf_exempt(wrapper(_wrapped_view))
+        wrapped_view.widget = widget
+        return wrapped_view
+
+    def _bind(self, view_func):
+        """Return a copy of the decorator dedicated to a single view."""
+        widget = copy.copy(self)
+        widget.view_func = view_func
+        widget.name = _widget_name(view_func)
+        widget.profiler = None
+        if self.options.get('profile_rate') or \
+                self.options.get('profile_threshold') is not None:
+            widget.profiler = WidgetProfiler(widget.name,
+                    sample_rate=self.options.get('profile_rate', 0),
+                    threshold=self.options.get('profile_threshold'),
+                    max_files=self.options.get('profile_max_files', 10))
+        widget.breaker = None
+        breaker_options = self.options.get('circuit_breaker')
+        if breaker_options:
+            if breaker_options is True:
+                breaker_options = {}
+            widget.breaker = CircuitBreaker(widget.name, **breaker_options)
+            register_breaker(widget.breaker)
+        widget.bulkhead = None
+        if self.options.get('max_concurrency'):
+            widget.bulkhead = Bulkhead(widget.name,
+                    self.options['max_concurrency'],
+                    max_queue=self.options.get('max_queue', 0),
+                    timeout=self.options.get('queue_timeout'))
+            register_bulkhead(widget.bulkhead)
+        widget.recorder = None
+        if self.options.get('record_rate'):
+            widget.recorder = Recorder(widget.name,
+                    self.options['record_rate'])
+        widget.query_budget = None
+        if self.options.get('max_queries') is not None or \
+                self.options.get('track_queries'):
+            widget.query_budget = QueryBudget(widget.name,
+                    max_queries=self.options.get('max_queries'),
+                    repeat_threshold=self.options.get(
+                        'query_repeat_threshold', 5),
+                    action=self.options.get('query_budget_action'))
+            register_budget(widget.query_budget)
+        widget.memory = None
+        if self.options.get('max_memory') is not None or \
+                self.options.get('track_memory'):
+            widget.memory = MemoryTracker(widget.name,
+                    max_bytes=self.options.get('max_memory'),
+                    action=self.options.get('memory_budget_action'))
+            register_tracker(widget.memory)
+        widget.ttl_policy = None
+        ttl_options = self.options.get('adaptive_cache')
+        if ttl_options:
+            if ttl_options is True:
+                ttl_options = {}
+            ttl_options = dict(ttl_options)
+            ttl_options.setdefault('initial',
+                    self.options.get('cache_timeout'))
+            widget.ttl_policy = AdaptiveTTL(widget.name, **ttl_options)
+            register_policy(widget.ttl_policy)
+        return widget
+
+    def _respond(self, request, args, kwargs):
+        policy = self.ttl_policy
+        cache_timeout = self.options.get('cache_timeout')
+        if policy is None and not cache_timeout:
+            return self._respond_uncached(request, args, kwargs)
+        if policy is not None:
+            policy.record_poll()
+        shared_cache = get_shared_cache()
+        if shared_cache is None:
+            return self._respond_uncached(request, args, kwargs)
+        key = self._payload_key(request, args, kwargs)
+        content = shared_cache.get(key)
+        if content is not None:
+            return HttpResponse(content)
+        start = time.time()
+        response = self._respond_uncached(request, args, kwargs)
+        if response.status_code == 200 and \
+                not response.has_header(STALE_HEADER):
+            if policy is not None:
+                policy.record_computation(key, time.time() - start,
+                        response.content)
+                cache_timeout = policy.timeout()
+            shared_cache.set(key, response.content, cache_timeout)
+        return response
+
+    def _respond_uncached(self, request, args, kwargs):
+        interval = self.options.get('refresh_interval')
+        if interval:
+            payload = get_payload(self._payload_key(request, args, kwargs))
+            if payload is not None and \
+                    time.time() - payload[1] <= 2 * interval:
+                return HttpResponse(payload[0])
+        try:
+            return self._respond_guarded(request, args, kwargs)
+        except BulkheadFull:
+            response = self._fallback_response(request, args, kwargs)
+            response[REJECTED_HEADER] = 'bulkhead'
+            return response
+
+    def _respond_guarded(self, request, args, kwargs):
+        breaker = self.breaker
+        if breaker is None:
+            return self._respond_live(request, args, kwargs)
+        if not breaker.allow_request():
+            response = self._fallback_response(request, args, kwargs)
+            response[CIRCUIT_HEADER] = breaker.state
+            return response
+        try:
+            response = self._respond_live(request, args, kwargs)
+        except BulkheadFull:
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        if response.has_header(STALE_HEADER):
+            # The view did not finish within its deadline.
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    def _respond_live(self, request, args, kwargs):
+        deadline = self.options.get('deadline')
+        if deadline is None and self.breaker is None and \
+                self.bulkhead is None:
+            return HttpResponse(self._compute(request, args, kwargs))
+        key = self._payload_key(request, args, kwargs)
+        def compute():
+            content = self._compute(request, args, kwargs)
+            set_payload(key, content)
+            return content
+        if deadline is None:
+            return HttpResponse(compute())
+        computation = run_in_background(key, compute)
+        if not computation.wait(deadline):
+            payload = get_payload(key)
+            if payload is not None:
+                return _stale_response(*payload)
+            computation.wait()
+        return HttpResponse(computation.get())
+
+    def _fallback_response(self, request, args, kwargs):
+        """Return the response served while the view is unavailable."""
+        payload = get_payload(self._payload_key(request, args, kwargs))
+        if payload is not None:
+            return _stale_response(*payload)
+        return HttpResponse("Geckoboard widget unavailable", status=503)
+
+    def _payload_key(self, request, args, kwargs):
+        return payload_key(self.name, _format_name(request), args, kwargs)
+
+    def _compute(self, request, args, kwargs):
+        if self.bulkhead is not None:
+            return self.bulkhead.call(self._compute_profiled, request, args,
+                    kwargs)
+        return self._compute_profiled(request, args, kwargs)
+
+    def _compute_profiled(self, request, args, kwargs):
+        if self.profiler is None:
+            return self._render_tracked(request, args, kwargs)
+        return self.profiler.run(_format_name(request), self._render_tracked,
+                request, args, kwargs)
+
+    def _render_tracked(self, request, args, kwargs):
+        if self.memory is None:
+            return self._render_view(request, args, kwargs)
+        with self.memory.track():
+            return self._render_view(request, args, kwargs)
+
+    def _render_view(self, request, args, kwargs):
+        alias = self.options.get('using',
+                getattr(settings, 'GECKOBOARD_DATABASE', None))
+        # Lazy QuerySets returned by the view are evaluated during
+        # conversion, which therefore runs on the same database.
+        with widget_database(alias, self.options.get('statement_timeout')):
+            if self.query_budget is None:
+                capture, data = self._run_view(request, args, kwargs)
+            else:
+                with self.query_budget.track():
+                    capture, data = self._run_view(request, args, kwargs)
+        with self._measure('render'):
+            content = self._render_data(request, data)
+        if capture is not None:
+            self.recorder.record(self, capture, data)
+        if self.options.get('snapshot_interval'):
+            self._record_snapshot(data, args, kwargs)
+        return content
+
+    def _run_view(self, request, args, kwargs):
+        """
+        Call the view and return a tuple `(capture, data)` of the
+        captured view result, if it was sampled, and the converted data.
+        """
+        arguments = (args, kwargs)
+        providers = self.options.get('providers')
+        if providers:
+            kwargs = dict(kwargs)
+            kwargs.update(provider_values(providers, self.name))
+        with self._measure('view'):
+            view_result = self.view_func(request, *args, **kwargs)
+        capture = None
+        if self.recorder is not None and self.recorder.is_sampled():
+            capture = self.recorder.capture(view_result)
+        outer = getattr(_local, 'arguments', None)
+        _local.arguments = arguments
+        try:
+            with self._measure('convert'):
+                if capture is None:
+                    data = self._convert_view_result(view_result)
+                else:
+                    with capture.converting():
+                        data = self._convert_view_result(view_result)
+        finally:
+            _local.arguments = outer
+        return capture, data
+
+    def _measure(self, phase):
+        if self.memory is None:
+            return NO_MEASUREMENT
+        return self.memory.measure(phase)
+
+    def _record_snapshot(self, data, args, kwargs):
+        # Imported here, as models cannot be imported before the
+        # application registry is ready.
+        from django_geckoboard.snapshots import record_snapshot, \
+                snapshot_key
+        record_snapshot(snapshot_key(self.name, args, kwargs), data,
+                self._snapshot_value(data),
+                self.options['snapshot_interval'])
+
+    def _snapshot_value(self, data):
+        # Extending classes with a single current value return it here.
+        return None
 
     def _convert_view_result(self, data):
         # Extending classes do view result mangling here.
         return data
 
+    def _render_data(self, request, data):
+        # Extending classes with format-specific structure adapt it here.
+        return _render(request, data)
+
 widget = WidgetDecorator()
 
 
@@ -61,16 +434,56 @@ class NumberWidgetDecorator(WidgetDecorator):
     The decorated view must return a tuple `(current, [previous])`, where
     `current` is the current value and `previous` is the previous value
     of the measured quantity.
+
+    With the `compare_to` option, a number of seconds, a view returning
+    only the current value is compared to the value in the snapshot
+    history of the widget (see `django_geckoboard.snapshots`) that old.
+
+    With the `approximate_count` option, `True` or a dictionary of
+    `approximate_count` options (`threshold`, `sample_size`) and
+    `digits` (default 2), values may be QuerySets, whose counts are
+    estimated (see `django_geckoboard.approx`) and rounded to `digits`
+    significant digits.
     """
 
     def _convert_view_result(self, result):
         if not isinstance(result, (tuple, list)):
             result = [result]
+        approximate = self.options.get('approximate_count')
+        if approximate:
+            result = [_approximate_value(v, approximate) for v in result]
+        compare_to = self.options.get('compare_to')
+        if compare_to and len(result) == 1:
+            from django_geckoboard.snapshots import previous_value, \
+                    snapshot_key
+            args, kwargs = getattr(_local, 'arguments', None) or ((), {})
+            result = [result[0], recorded_lookup('previous_value',
+                    previous_value, snapshot_key(self.name, args, kwargs),
+                    compare_to)]
         return {'item': [{'value': v} for v in result if v is not None]}
 
+    def _snapshot_value(self, data):
+        if data['item']:
+            return data['item'][0]['value']
+        return None
+
 number_widget = NumberWidgetDecorator()
 
 
+def _approximate_value(value, options):
+    if not isinstance(value, QuerySet):
+        return value
+    if options is True:
+        options = {}
+    options = dict(options)
+    digits = options.pop('digits', 2)
+    count = recorded_lookup('approximate_count', approximate_count, value,
+            **options)
+    if count.exact:
+        return count.value
+    return round_significant(count.value, digits)
+
+
 class RAGWidgetDecorator(WidgetDecorator):
     """
     Geckoboard Red-Amber-Green (RAG) widget decorator.
@@ -233,6 +646,9 @@ class GeckOMeterWidgetDecorator(WidgetDecorator):
 
         return data
 
+    def _snapshot_value(self, data):
+        return data['item']
+
 geck_o_meter = GeckOMeterWidgetDecorator()
 
 
@@ -269,6 +685,74 @@ class FunnelWidgetDecorator(WidgetDecorator):
 funnel = FunnelWidgetDecorator()
 
 
+class LeaderboardWidgetDecorator(WidgetDecorator):
+    """
+    Geckoboard Leaderboard decorator.
+
+    The decorated view must return an iterable over tuples `(label,
+    value)`, for example a QuerySet iterator over `values_list`.  The
+    entries with the highest values are shown.  The decorator takes the
+    following options:
+
+        k:              The number of entries shown (default 10).
+        ascending:      Show the entries with the lowest values instead.
+        rank_changes:   Include the `previous_rank` of each entry, from
+                        the previous ranking served by the widget, kept
+                        in the Django cache.
+
+    The top entries are selected with a bounded heap, so the iterable is
+    consumed in a single pass without sorting or storing it.
+    """
+
+    def _convert_view_result(self, result):
+        k = self.options.get('k', 10)
+        if self.options.get('ascending'):
+            top = heapq.nsmallest(k, result, key=_leaderboard_value)
+        else:
+            top = heapq.nlargest(k, result, key=_leaderboard_value)
+        previous_ranks = {}
+        if self.options.get('rank_changes'):
+            previous_ranks = recorded_lookup('previous_ranks',
+                    self._previous_ranks, [label for label, _ in top])
+        items = []
+        for label, value in top:
+            item = OrderedDict()
+            item['label'] = label
+            item['value'] = value
+            if label in previous_ranks:
+                item['previous_rank'] = previous_ranks[label]
+            items.append(item)
+        return {'item': items}
+
+    def _render_data(self, request, data):
+        # The JSON format uses 'items' where the XML format uses 'item'
+        # elements.
+        if _get_format(request) == '2':
+            data = {'items': data['item']}
+        return _render(request, data)
+
+    def _previous_ranks(self, labels):
+        """
+        Return the ranks of the labels in the ranking before the last
+        change, and store the current ranking.  Rankings are kept per
+        URLconf arguments of the view.
+        """
+        args, kwargs = getattr(_local, 'arguments', None) or ((), {})
+        key = 'django_geckoboard:leaderboard:%s:%s' % (self.name,
+                arguments_digest(args, kwargs))
+        rankings = cache.get(key) or {'current': [], 'previous': []}
+        if labels != rankings['current']:
+            rankings = {'current': labels, 'previous': rankings['current']}
+            cache.set(key, rankings, 365 * 24 * 60 * 60)
+        return dict((label, rank + 1)
+                for rank, label in enumerate(rankings['previous']))
+
+leaderboard = LeaderboardWidgetDecorator()
+
+def _leaderboard_value(entry):
+    return entry[1]
+
+
 class BulletGraphWidgetDecorator(WidgetDecorator):
     """
     Geckoboard bullet graph decorator.
@@ -318,6 +802,263 @@ class BulletGraphWidgetDecorator(WidgetDecorator):
 bullet_graph = BulletGraphWidgetDecorator()
 
 
+class MapWidgetDecorator(WidgetDecorator):
+    """
+    Geckoboard Map decorator.
+
+    The decorated view must return an iterable over `(latitude,
+    longitude)` tuples, or a NumPy array with those two columns.  The
+    points are aggregated into clusters, and each cluster is plotted at
+    the mean position of its points with a size relative to its number
+    of points.  The decorator takes the following options:
+
+        clustering: 'grid' (default) to cluster points in cells of
+                    `cell_size` degrees (default 1), or 'geohash' to
+                    cluster points with the same geohash of `precision`
+                    characters (default 3).
+        max_points: The maximum number of clusters plotted (default
+                    500); the largest clusters are kept.
+        max_size:   The size of the largest cluster (default 10).
+        color:      The point color, a string ``'RRGGBB[TT]'``.
+
+    The payload size is bounded by `max_points` regardless of the number
+    of input points.
+    """
+
+    def _convert_view_result(self, result):
+        clustering = self.options.get('clustering', 'grid')
+        if clustering == 'grid':
+            cell_size = self.options.get('cell_size', 1.0)
+            clusters = _grid_clusters(result, cell_size, cell_size)
+        elif clustering == 'geohash':
+            # Geohash cells are a grid of 2^n by 2^m cells.
+            bits = self.options.get('precision', 3) * 5
+            clusters = _grid_clusters(result, 180.0 / (1 << (bits // 2)),
+                    360.0 / (1 << ((bits + 1) // 2)))
+        else:
+            raise GeckoboardException("Unknown clustering: %s" % clustering)
+        clusters = heapq.nlargest(self.options.get('max_points', 500),
+                clusters, key=_cluster_count)
+        max_size = self.options.get('max_size', 10)
+        max_count = clusters and clusters[0][0] or 1
+        points = []
+        for count, latitude, longitude in clusters:
+            point = OrderedDict()
+            point['latitude'] = '%.4f' % latitude
+            point['longitude'] = '%.4f' % longitude
+            point['size'] = max(1, int(round(max_size * count
+                    / float(max_count))))
+            if self.options.get('color'):
+                point['color'] = self.options['color']
+            points.append(point)
+        return {'points': {'point': points}}
+
+map_widget = MapWidgetDecorator()
+
+def _cluster_count(cluster):
+    return cluster[0]
+
+def _grid_clusters(points, lat_size, lon_size):
+    """Return `(count, latitude, longitude)` tuples of grid clusters."""
+    if numpy is not None and isinstance(points, numpy.ndarray):
+        return _grid_clusters_array(points, lat_size, lon_size)
+    floor = math.floor
+    cells = {}
+    for point in points:
+        latitude, longitude = point[0], point[1]
+        # Cells start at the south pole and the antimeridian, as in
+        # _grid_clusters_array.
+        key = (floor((latitude + 90) / lat_size),
+                floor((longitude + 180) / lon_size))
+        cell = cells.get(key)
+        if cell is None:
+            cells[key] = [1, latitude, longitude]
+        else:
+            cell[0] += 1
+            cell[1] += latitude
+            cell[2] += longitude
+    return [(count, lat_sum / count, lon_sum / count)
+            for count, lat_sum, lon_sum in cells.values()]
+
+def _grid_clusters_array(points, lat_size, lon_size):
+    points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+    rows = numpy.floor((points[:, 0] + 90) / lat_size).astype(numpy.int64)
+    columns = numpy.floor((points[:, 1] + 180) / lon_size) \
+            .astype(numpy.int64)
+    keys = rows * int(math.ceil(360.0 / lon_size) + 1) + columns
+    _, inverse, counts = numpy.unique(keys, return_inverse=True,
+            return_counts=True)
+    lat_sums = numpy.bincount(inverse, weights=points[:, 0])
+    lon_sums = numpy.bincount(inverse, weights=points[:, 1])
+    return list(zip(counts.tolist(), (lat_sums / counts).tolist(),
+            (lon_sums / counts).tolist()))
+
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def geohash(latitude, longitude, precision):
+    """Return the geohash of a position with `precision` characters."""
+    # Interleave the longitude and latitude bits, longitude first.
+    bits = precision * 5
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    lon = min(int((longitude + 180.0) / 360.0 * (1 << lon_bits)),
+            (1 << lon_bits) - 1)
+    lat = min(int((latitude + 90.0) / 180.0 * (1 << lat_bits)),
+            (1 << lat_bits) - 1)
+    code = 0
+    for i in range(lon_bits):
+        code = (code << 1) | ((lon >> (lon_bits - 1 - i)) & 1)
+        if i < lat_bits:
+            code = (code << 1) | ((lat >> (lat_bits - 1 - i)) & 1)
+    return ''.join(_GEOHASH_ALPHABET[(code >> (5 * (precision - 1 - i))) & 31]
+            for i in range(precision))
+
+
+class HistogramWidgetDecorator(LineChartWidgetDecorator):
+    """
+    Geckoboard histogram decorator, rendered as a line chart.
+
+    The decorated view must return the samples: a list, an iterator or a
+    NumPy array of numbers.  The decorator takes the following options:
+
+        bins:       The number of bins (default 10).
+        binning:    'fixed' (default) for equal-width bins, 'log' for
+                    bins of equal width on a log scale, or 'quantile'
+                    for bins containing roughly equal numbers of
+                    samples.
+        range:      A tuple `(min, max)` of the binned values.  Samples
+                    outside the range are not counted.  By default the
+                    range of the samples is used.
+        color:      The line color, a string ``'RRGGBB[TT]'``.
+
+    Binning is vectorized if NumPy is installed.  If a range is given,
+    fixed and log bins are counted in chunks, so iterators are consumed
+    without loading all samples in memory.
+    """
+
+    def _convert_view_result(self, result):
+        bins = self.options.get('bins', 10)
+        binning = self.options.get('binning', 'fixed')
+        value_range = self.options.get('range')
+        if binning not in ('fixed', 'log', 'quantile'):
+            raise GeckoboardException("Unknown binning: %s" % binning)
+        if value_range is None or binning == 'quantile':
+            samples = _materialize_samples(result)
+            if binning == 'quantile':
+                edges = _quantile_edges(samples, bins)
+            else:
+                edges = _bin_edges(_samples_range(samples, binning), bins,
+                        binning)
+            counts = _count_bins(samples, edges)
+        else:
+            edges = _bin_edges(value_range, bins, binning)
+            counts = [0] * (len(edges) - 1)
+            for chunk in _sample_chunks(result):
+                for i, count in enumerate(_count_bins(chunk, edges)):
+                    counts[i] += count
+        labels = [_format_edge(edges[i])
+                for i in (0, (len(edges) - 1) // 2, len(edges) - 1)]
+        chart = [counts, labels, ['0', '%d' % max(counts)]]
+        if self.options.get('color'):
+            chart.append(self.options['color'])
+        return super(HistogramWidgetDecorator, self) \
+                ._convert_view_result(chart)
+
+histogram = HistogramWidgetDecorator()
+
+
+# Number of samples binned at a time when consuming iterators.
+SAMPLE_CHUNK_SIZE = 65536
+
+def _materialize_samples(samples):
+    if numpy is not None:
+        if isinstance(samples, numpy.ndarray):
+            return samples.ravel()
+        if isinstance(samples, (list, tuple)):
+            return numpy.asarray(samples, dtype=float)
+        return numpy.fromiter(samples, dtype=float)
+    return list(samples)
+
+def _sample_chunks(samples):
+    if numpy is not None and isinstance(samples, numpy.ndarray):
+        yield samples.ravel()
+        return
+    if isinstance(samples, (list, tuple)):
+        yield _materialize_samples(samples)
+        return
+    iterator = iter(samples)
+    while True:
+        chunk = list(itertools.islice(iterator, SAMPLE_CHUNK_SIZE))
+        if not chunk:
+            return
+        yield _materialize_samples(chunk)
+
+def _samples_range(samples, binning):
+    if binning == 'log':
+        samples = [x for x in samples if x > 0] if numpy is None \
+                else samples[samples > 0]
+    if len(samples) == 0:
+        return (1, 10) if binning == 'log' else (0, 1)
+    if numpy is not None:
+        low, high = samples.min(), samples.max()
+    else:
+        low, high = min(samples), max(samples)
+    if low == high:
+        high = low + 1
+    return (low, high)
+
+def _bin_edges(value_range, bins, binning):
+    low, high = value_range
+    if bins < 1:
+        raise GeckoboardException("There must be at least 1 bin")
+    if binning == 'log':
+        if low <= 0:
+            raise GeckoboardException("Log-scale bins need a positive range")
+        ratio = (float(high) / low) ** (1.0 / bins)
+        edges = [low * ratio ** i for i in range(bins)]
+    else:
+        step = (high - low) / float(bins)
+        edges = [low + step * i for i in range(bins)]
+    edges.append(high)
+    return edges
+
+def _quantile_edges(samples, bins):
+    if len(samples) == 0:
+        return _bin_edges((0, 1), bins, 'fixed')
+    quantiles = [float(i) / bins for i in range(bins + 1)]
+    if numpy is not None:
+        edges = list(numpy.percentile(samples, [q * 100 for q in quantiles]))
+    else:
+        ordered = sorted(samples)
+        last = len(ordered) - 1
+        edges = [ordered[int(round(q * last))] for q in quantiles]
+    unique_edges = [edges[0]]
+    for edge in edges[1:]:
+        if edge > unique_edges[-1]:
+            unique_edges.append(edge)
+    if len(unique_edges) == 1:
+        unique_edges.append(unique_edges[0] + 1)
+    return unique_edges
+
+def _count_bins(samples, edges):
+    """Count samples per bin; the last bin includes its right edge."""
+    if numpy is not None:
+        counts, _ = numpy.histogram(samples, bins=edges)
+        return [int(c) for c in counts]
+    bins = len(edges) - 1
+    counts = [0] * bins
+    low, high = edges[0], edges[-1]
+    for x in samples:
+        if low <= x < high:
+            counts[bisect.bisect_right(edges, x) - 1] += 1
+        elif x == high:
+            counts[bins - 1] += 1
+    return counts
+
+def _format_edge(value):
+    return '%g' % value
+
+
 def _is_api_key_correct(request):
     """Return whether the Geckoboard API key on the request is correct."""
     api_key = getattr(settings, 'GECKOBOARD_API_KEY', None)
@@ -331,12 +1072,39 @@ def _is_api_key_correct(request):
     return False
 
 
-def _render(request, data):
-    """Render the data to Geckoboard based on the format request parameter."""
+def _widget_name(view_func):
+    """Return the name identifying the widget rendered by a view."""
+    name = getattr(view_func, '__name__', None) or 'widget'
+    module = getattr(view_func, '__module__', None)
+    if module:
+        name = '%s.%s' % (module, name)
+    return name
+
+
+def _stale_response(content, timestamp):
+    """Return a response serving a previously rendered payload."""
+    response = HttpResponse(content)
+    response[STALE_HEADER] = '%d' % max(0, time.time() - timestamp)
+    return response
+
+
+def _get_format(request):
+    """Return the Geckoboard format request parameter."""
     format = request.POST.get('format', '')
     if not format:
         format = request.GET.get('format', '')
-    if format == '2':
+    return format
+
+def _format_name(request):
+    """Return the name of the format requested by Geckoboard."""
+    if _get_format(request) == '2':
+        return 'json'
+    else:
+        return 'xml'
+
+def _render(request, data):
+    """Render the data to Geckoboard based on the format request parameter."""
+    if _get_format(request) == '2':
         return _render_json(data)
     else:
         return _render_xml(data)
@@ -0,0 +1,291 @@
+"""
+HyperLogLog sketches of distinct values, for unique visitor counts.
+
+A sketch estimates the number of distinct values added to it in a fixed
+amount of memory, with a relative standard error of ``1.04 / sqrt(m)``
+for `m` registers.  Sketches of time buckets are merged to count the
+distinct values of a period without reading the underlying events.
+"""
+
+import base64
+import hashlib
+import math
+import struct
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from django_geckoboard.decorators import number_widget
+from django_geckoboard.models import DistinctSketch
+
+
+DEFAULT_PRECISION = 12
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+
+# Cache entries outlive the longest period usually compared.
+DEFAULT_CACHE_TIMEOUT = 60 * 24 * 60 * 60
+
+# Flush locks of crashed processes expire after this many seconds.
+FLUSH_LOCK_TIMEOUT = 10
+
+_HASH = struct.Struct('>Q')
+
+try:
+    _atomic = transaction.atomic
+except AttributeError:
+    _atomic = transaction.commit_on_success  # Django < 1.6
+
+
+class HyperLogLog(object):
+    """
+    A HyperLogLog sketch with ``2 ** precision`` one-byte registers.
+
+    Values are hashed with 64 bits, so no large range correction is
+    needed, and small cardinalities are estimated by linear counting.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError("The precision must be between %d and %d"
+                    % (MIN_PRECISION, MAX_PRECISION))
+        self.precision = precision
+        self.m = 1 << precision
+        if registers is None:
+            registers = bytearray(self.m)
+        elif len(registers) != self.m:
+            raise ValueError("A sketch of precision %d has %d registers"
+                    % (precision, self.m))
+        self.registers = registers
+
+    def add(self, value):
+        """Add a value (a string, bytes or a number) to the sketch."""
+        h = _HASH.unpack(hashlib.md5(_encode(value)).digest()[:8])[0]
+        bits = 64 - self.precision
+        index = h >> bits
+        rank = bits - (h & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other):
+        """Add all values of another sketch to this sketch."""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """Return the estimated number of distinct values."""
+        m = self.m
+        total = sum(_POWERS[r] for r in self.registers)
+        estimate = _alpha(m) * m * m / total
+        zeros = self.registers.count(b'\x00')
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / float(zeros))
+        return estimate
+
+    @property
+    def error(self):
+        """The relative standard error of the estimates."""
+        return 1.04 / math.sqrt(self.m)
+
+    def copy(self):
+        return HyperLogLog(self.precision, bytearray(self.registers))
+
+    def to_bytes(self):
+        return struct.pack('B', self.precision) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytearray(data)
+        return cls(data[0], data[1:])
+
+
+class DistinctCounter(object):
+    """
+    Counts distinct values per time bucket of `bucket_size` seconds.
+
+    Values are added to in-process sketches, which `flush` merges into
+    the sketches stored in the Django cache (`storage` 'cache') or the
+    ``DistinctSketch`` model (`storage` 'database').  A stored sketch is
+    merged while holding a lock made with `cache.add`; a bucket locked
+    by another process is kept in the process and merged by the next
+    flush.  Merging is idempotent, so the sketches of the current and
+    previous bucket are also kept and merged again.  Reads merge the
+    stored sketches of a period, which takes one cache or database
+    round trip, independent of the number of values counted.
+    """
+
+    def __init__(self, name, bucket_size=60 * 60,
+            precision=DEFAULT_PRECISION, storage='cache', using='default',
+            timeout=DEFAULT_CACHE_TIMEOUT):
+        if storage not in ('cache', 'database'):
+            raise ValueError("Unsupported sketch storage: %s" % storage)
+        self.name = name
+        self.bucket_size = bucket_size
+        self.precision = precision
+        self.storage = storage
+        self.using = using
+        self.timeout = timeout
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def add(self, value, timestamp=None):
+        """Add a value seen at `timestamp` (a Unix time, default now)."""
+        self.update([value], timestamp)
+
+    def update(self, values, timestamp=None):
+        bucket = self._bucket(timestamp)
+        with self._lock:
+            sketch = self._local.get(bucket)
+            if sketch is None:
+                sketch = self._local[bucket] = HyperLogLog(self.precision)
+            sketch.update(values)
+
+    def flush(self):
+        """Merge the in-process sketches into the stored sketches."""
+        with self._lock:
+            local = dict((bucket, sketch.copy())
+                    for bucket, sketch in self._local.items())
+        current = self._bucket(None)
+        for bucket, sketch in local.items():
+            if self._store(bucket, sketch) and bucket < current - 1:
+                with self._lock:
+                    del self._local[bucket]
+
+    def sketch(self, start, end=None):
+        """
+        Return the merged sketch of the buckets overlapping the period
+        from `start` to `end` (Unix times, `end` defaults to now).
+        """
+        first = self._bucket(start)
+        last = self._bucket(end)
+        buckets = list(range(first, last + 1))
+        merged = HyperLogLog(self.precision)
+        for sketch in self._load(buckets).values():
+            merged.merge(sketch)
+        with self._lock:
+            for bucket in buckets:
+                if bucket in self._local:
+                    merged.merge(self._local[bucket])
+        return merged
+
+    def count(self, start, end=None):
+        """Return the estimated number of distinct values of a period."""
+        return int(round(self.sketch(start, end).count()))
+
+    def counts(self, period, now=None):
+        """
+        Return a tuple `(current, previous)` of the estimated distinct
+        counts of the last `period` seconds and the period before,
+        suitable as the result of a ``number_widget`` view.  Periods are
+        rounded to whole buckets.
+        """
+        if now is None:
+            now = time.time()
+        buckets = max(1, int(round(period / float(self.bucket_size))))
+        last = self._bucket(now)
+        current = self._count_buckets(last - buckets + 1, last)
+        previous = self._count_buckets(last - 2 * buckets + 1,
+                last - buckets)
+        return (current, previous)
+
+    def _count_buckets(self, first, last):
+        return self.count(first * self.bucket_size,
+                last * self.bucket_size)
+
+    def _bucket(self, timestamp):
+        if timestamp is None:
+            timestamp = time.time()
+        return int(timestamp // self.bucket_size)
+
+    def _cache_key(self, bucket):
+        return 'django_geckoboard:hll:%s:%d' % (self.name, bucket)
+
+    def _load(self, buckets):
+        """Return a dictionary of the stored sketches of buckets."""
+        if not buckets:
+            return {}
+        if self.storage == 'cache':
+            keys = dict((self._cache_key(b), b) for b in buckets)
+            return dict((keys[key], HyperLogLog.from_bytes(data))
+                    for key, data in cache.get_many(list(keys)).items())
+        rows = DistinctSketch.objects.using(self.using).filter(
+                name=self.name, bucket__gte=min(buckets),
+                bucket__lte=max(buckets)).values_list('bucket', 'registers')
+        wanted = set(buckets)
+        return dict((bucket, HyperLogLog.from_bytes(
+                base64.b64decode(registers))) for bucket, registers in rows
+                if bucket in wanted)
+
+    def _store(self, bucket, sketch):
+        """
+        Merge a sketch into the stored sketch of a bucket.  Return
+        whether it was merged, which fails if the bucket is locked.
+        """
+        lock_key = self._cache_key(bucket) + ':lock'
+        if not cache.add(lock_key, 1, FLUSH_LOCK_TIMEOUT):
+            return False
+        try:
+            stored = self._load([bucket])
+            if bucket in stored:
+                sketch.merge(stored[bucket])
+            return self._save(bucket, sketch)
+        finally:
+            cache.delete(lock_key)
+
+    def _save(self, bucket, sketch):
+        if self.storage == 'cache':
+            cache.set(self._cache_key(bucket), sketch.to_bytes(),
+                    self.timeout)
+            return True
+        registers = base64.b64encode(sketch.to_bytes()).decode('ascii')
+        sketches = DistinctSketch.objects.using(self.using)
+        if sketches.filter(name=self.name, bucket=bucket) \
+                .update(registers=registers):
+            return True
+        try:
+            with _atomic(using=self.using):
+                sketches.create(name=self.name, bucket=bucket,
+                        registers=registers)
+        except IntegrityError:
+            # Created by a process not sharing the cache; the sketch is
+            # kept and merged into that row by the next flush.
+            return False
+        return True
+
+
+def distinct_count_widget(counter, period, **options):
+    """
+    Return a ``number_widget`` view showing the distinct count of the
+    last `period` seconds of a `DistinctCounter` and the count of the
+    period before.  Keyword options are passed to the decorator.
+    """
+    def view(request):
+        return counter.counts(period)
+    view.__name__ = str('distinct_count_%s' % counter.name)
+    return number_widget(**options)(view)
+
+
+_POWERS = [2.0 ** -r for r in range(64 - MIN_PRECISION + 2)]
+
+def _alpha(m):
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, type(u'')):
+        value = u'%s' % value
+    return value.encode('utf-8')
@@ -0,0 +1,16 @@
+"""
+Downsample and delete old widget snapshots.
+"""
+
+from django.core.management.base import BaseCommand
+
+from django_geckoboard.snapshots import prune_snapshots
+
+
+class Command(BaseCommand):
+    help = ("Downsamples and deletes old widget snapshots according to "
+            "the GECKOBOARD_SNAPSHOT_RETENTION setting.")
+
+    def handle(self, *args, **options):
+        removed = prune_snapshots()
+        self.stdout.write("Removed %d snapshots\n" % removed)
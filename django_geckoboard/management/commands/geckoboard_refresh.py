@@ -0,0 +1,53 @@
+"""
+Run the background refresh loop of registered widgets.
+"""
+
+from optparse import make_option
+
+try:
+    from importlib import import_module
+except ImportError:
+    from django.utils.importlib import import_module  # Python 2.6
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from django_geckoboard.coordination import RefreshCoordinator
+
+
+class Command(BaseCommand):
+    help = ("Refreshes the registered widgets with a refresh_interval in "
+            "the background, sharing the work with the other nodes "
+            "running this command.")
+
+    options = (
+        ('--interval', dict(dest='interval', type='float', default=1.0,
+                help="Seconds between refresh cycles.")),
+        ('--node', dict(dest='node', default=None,
+                help="Node name (default: host name and process id).")),
+        ('--once', dict(dest='once', action='store_true', default=False,
+                help="Run a single refresh cycle and exit.")),
+    )
+
+    # Django < 1.8 uses optparse options, newer versions add_arguments.
+    option_list = getattr(BaseCommand, 'option_list', ()) + tuple(
+            make_option(flag, **kwargs) for flag, kwargs in options)
+
+    def add_arguments(self, parser):
+        for flag, kwargs in self.options:
+            kwargs = dict(kwargs)
+            if kwargs.get('type') == 'float':
+                kwargs['type'] = float
+            parser.add_argument(flag, **kwargs)
+
+    def handle(self, *args, **options):
+        # Widgets are usually registered next to the URL patterns.
+        urlconf = getattr(settings, 'ROOT_URLCONF', None)
+        if urlconf:
+            import_module(urlconf)
+        coordinator = RefreshCoordinator(node=options['node'])
+        if options['once']:
+            for name in coordinator.run_once():
+                self.stdout.write("Refreshed %s\n" % name)
+            return
+        coordinator.run(options['interval'])
@@ -0,0 +1,64 @@
+"""
+Replay the recorded widget corpus.
+"""
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_geckoboard.recording import replay_corpus, compare_reports, \
+        save_report, load_report
+
+
+class Command(BaseCommand):
+    help = ("Replays the recorded widget view results through conversion "
+            "and rendering, checks the output against the recording and "
+            "reports timing and allocation changes.")
+
+    options = (
+        ('--corpus', dict(dest='corpus', default=None,
+                help="Corpus directory (default: GECKOBOARD_RECORD_DIR).")),
+        ('--repeat', dict(dest='repeat', type='int', default=10,
+                help="Number of timed runs per record.")),
+        ('--save', dict(dest='save', default=None,
+                help="Write the report to this JSON file.")),
+        ('--baseline', dict(dest='baseline', default=None,
+                help="Compare with a report saved by another version.")),
+    )
+
+    # Django < 1.8 uses optparse options, newer versions add_arguments.
+    option_list = getattr(BaseCommand, 'option_list', ()) + tuple(
+            make_option(flag, **kwargs) for flag, kwargs in options)
+
+    def add_arguments(self, parser):
+        for flag, kwargs in self.options:
+            kwargs = dict(kwargs)
+            if kwargs.get('type') == 'int':
+                kwargs['type'] = int
+            parser.add_argument(flag, **kwargs)
+
+    def handle(self, *args, **options):
+        report = replay_corpus(options['corpus'], options['repeat'])
+        if not report['widgets']:
+            raise CommandError("The corpus is empty")
+        mismatches = 0
+        for name in sorted(report['widgets']):
+            widget = report['widgets'][name]
+            mismatches += len(widget['mismatches'])
+            self.stdout.write("%s: %d records, %d mismatches, %.1f us%s\n" % (
+                    name, widget['records'], len(widget['mismatches']),
+                    widget['time_us'], widget['peak_bytes'] is not None
+                    and ", peak %d bytes" % widget['peak_bytes'] or ""))
+        if options['baseline']:
+            baseline = load_report(options['baseline'])
+            self.stdout.write("Changes from version %s to %s:\n"
+                    % (baseline['version'], report['version']))
+            for name, metric, old, new, change in compare_reports(report,
+                    baseline):
+                self.stdout.write("%s %s: %s -> %s (%+.1f%%)\n"
+                        % (name, metric, old, new, change * 100))
+        if options['save']:
+            save_report(report, options['save'])
+        if mismatches:
+            raise CommandError("%d records rendered differently from the "
+                    "recording" % mismatches)
@@ -0,0 +1,262 @@
+"""
+Memory allocation tracking and budgets of widget views.
+
+The memory allocated while a widget is computed is measured with
+`tracemalloc`, separately for the view, the conversion of its result
+and the rendering of the payload.  A widget can be given a maximum
+number of bytes its computation may allocate at its peak.
+
+Measurements need Python 3.4 or newer, and per-phase peaks and budgets
+need Python 3.9 or newer; on older versions tracking does nothing and
+budgets are not checked.  `tracemalloc` traces the allocations of all
+threads and keeps a single peak, so computations running at the same
+time distort each other's numbers.  Their budgets are not checked.
+"""
+
+import logging
+import threading
+import warnings
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # Python 2
+
+# The peak of a phase can only be measured where it can be reset.
+_can_reset_peak = hasattr(tracemalloc, 'reset_peak')
+
+from django.conf import settings
+
+
+logger = logging.getLogger('django_geckoboard')
+
+ACTIONS = ('warn', 'log', 'raise')
+PHASES = ('view', 'convert', 'render')
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+_local = threading.local()
+_tracing_lock = threading.Lock()
+_tracing = {'active': [], 'started': False}
+
+
+class MemoryBudgetExceeded(Exception):
+    """
+    Raised when a widget computation allocates more memory than its
+    budget allows and the budget action is 'raise'.
+    """
+
+
+class MemoryBudgetWarning(RuntimeWarning):
+    """
+    Issued when a widget computation exceeds its memory budget and the
+    budget action is 'warn'.
+    """
+
+
+class _NoMeasurement(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+NO_MEASUREMENT = _NoMeasurement()
+
+
+class MemoryTracker(object):
+    """
+    Tracks the memory allocated by the computations of a widget.
+
+    For each phase, the peak allocation above the memory in use when
+    the phase started and the net allocation (memory still in use when
+    it ended) are recorded.  If a computation that did not overlap
+    another tracked computation allocates more than `max_bytes` at its
+    peak, the violation is handled according to
+    `action`: 'warn' issues a `MemoryBudgetWarning`, 'log' logs a
+    warning and 'raise' raises `MemoryBudgetExceeded`.  The action
+    defaults to the ``GECKOBOARD_MEMORY_BUDGET_ACTION`` setting or
+    'log'.
+    """
+
+    def __init__(self, name, max_bytes=None, action=None):
+        if action is not None and action not in ACTIONS:
+            raise ValueError("Unknown memory budget action: %s" % action)
+        self.name = name
+        self.max_bytes = max_bytes
+        self.action = action
+        self._lock = threading.Lock()
+        self._computations = 0
+        self._max_peak = 0
+        self._exceeded = 0
+        self._phases = dict((phase, {
+            'max_peak': 0,
+            'total_net': 0,
+            'last_peak': None,
+            'last_net': None,
+        }) for phase in PHASES)
+
+    @contextmanager
+    def track(self):
+        """
+        Trace allocations during a computation, whose phases are
+        measured with `measure`, and check the budget.
+        """
+        if tracemalloc is None:
+            yield
+            return
+        # Computations of other widgets nested in this one, e.g. through
+        # data providers, are measured separately.
+        outer = (getattr(_local, 'base', None),
+                getattr(_local, 'measurements', None))
+        computation = {'concurrent': False}
+        _start_tracing(computation)
+        try:
+            _local.base = tracemalloc.get_traced_memory()[0]
+            _local.measurements = measurements = {}
+            yield
+        finally:
+            _local.base, _local.measurements = outer
+            _stop_tracing(computation)
+        self._record(measurements,
+                _can_reset_peak and not computation['concurrent'])
+
+    def measure(self, phase):
+        """Return a context manager measuring a phase of a computation."""
+        if tracemalloc is None or \
+                getattr(_local, 'measurements', None) is None:
+            return NO_MEASUREMENT
+        return self._measure(phase)
+
+    @contextmanager
+    def _measure(self, phase):
+        before = tracemalloc.get_traced_memory()[0]
+        if _can_reset_peak:
+            tracemalloc.reset_peak()
+        yield
+        current, peak = tracemalloc.get_traced_memory()
+        measurements = _local.measurements
+        measurements[phase] = (peak - before, current - before,
+                peak - _local.base)
+
+    def stats(self):
+        """Return a dictionary describing the memory use of the widget."""
+        with self._lock:
+            return {
+                'computations': self._computations,
+                'max_peak': self._max_peak,
+                'exceeded': self._exceeded,
+                'max_bytes': self.max_bytes,
+                'phases': dict((phase, dict(stats))
+                        for phase, stats in self._phases.items()),
+            }
+
+    def _record(self, measurements, check_budget):
+        peak = max([m[2] for m in measurements.values()] or [0])
+        exceeded = check_budget and self.max_bytes is not None and \
+                peak > self.max_bytes
+        with self._lock:
+            self._computations += 1
+            self._max_peak = max(self._max_peak, peak)
+            if exceeded:
+                self._exceeded += 1
+            for phase, (phase_peak, net, _) in measurements.items():
+                stats = self._phases.setdefault(phase, {
+                    'max_peak': 0,
+                    'total_net': 0,
+                    'last_peak': None,
+                    'last_net': None,
+                })
+                stats['max_peak'] = max(stats['max_peak'], phase_peak)
+                stats['total_net'] += net
+                stats['last_peak'] = phase_peak
+                stats['last_net'] = net
+        if exceeded:
+            phases = ", ".join("%s %s" % (phase,
+                    _format_bytes(measurements[phase][0]))
+                    for phase in PHASES if phase in measurements)
+            self._violation("Widget %s allocated %s at its peak, more than "
+                    "its budget of %s (%s)" % (self.name, _format_bytes(peak),
+                    _format_bytes(self.max_bytes), phases))
+
+    def _violation(self, message):
+        action = self.action or getattr(settings,
+                'GECKOBOARD_MEMORY_BUDGET_ACTION', 'log')
+        if action == 'raise':
+            raise MemoryBudgetExceeded(message)
+        if action == 'warn':
+            warnings.warn(message, MemoryBudgetWarning)
+        else:
+            logger.warning(message)
+
+
+def _start_tracing(computation):
+    with _tracing_lock:
+        active = _tracing['active']
+        if not active and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing['started'] = True
+        if active:
+            # Nested or in another thread; either resets the peak.
+            computation['concurrent'] = True
+            for other in active:
+                other['concurrent'] = True
+        active.append(computation)
+
+def _stop_tracing(computation):
+    # Tracing started elsewhere, e.g. with PYTHONTRACEMALLOC, is left
+    # running.
+    with _tracing_lock:
+        _tracing['active'] = [c for c in _tracing['active']
+                if c is not computation]
+        if not _tracing['active'] and _tracing['started']:
+            tracemalloc.stop()
+            _tracing['started'] = False
+
+def _format_bytes(count):
+    if abs(count) < 1024:
+        return '%d B' % count
+    for unit in ('KB', 'MB', 'GB'):
+        count /= 1024.0
+        if abs(count) < 1024 or unit == 'GB':
+            return '%.1f %s' % (count, unit)
+
+
+def register_tracker(tracker):
+    """Register a memory tracker for monitoring."""
+    with _trackers_lock:
+        _trackers[tracker.name] = tracker
+
+
+def get_tracker(name):
+    """Return the registered memory tracker of a widget, or `None`."""
+    with _trackers_lock:
+        return _trackers.get(name)
+
+
+def memory_stats():
+    """Return the stats of all memory trackers, keyed by widget name."""
+    with _trackers_lock:
+        trackers = list(_trackers.values())
+    return dict((tracker.name, tracker.stats()) for tracker in trackers)
+
+
+def memory_report(limit=10):
+    """
+    Return a text report of the `limit` widgets with the highest peak
+    allocations, with the peak of each phase.
+    """
+    stats = sorted(memory_stats().items(),
+            key=lambda item: -item[1]['max_peak'])[:limit]
+    lines = ['%-40s %8s %10s %10s %10s %10s' % ('widget', 'runs', 'peak',
+            'view', 'convert', 'render')]
+    for name, widget in stats:
+        lines.append('%-40s %8d %10s %10s %10s %10s' % (name[-40:],
+                widget['computations'], _format_bytes(widget['max_peak']),
+                _format_bytes(widget['phases']['view']['max_peak']),
+                _format_bytes(widget['phases']['convert']['max_peak']),
+                _format_bytes(widget['phases']['render']['max_peak'])))
+    return '\n'.join(lines)
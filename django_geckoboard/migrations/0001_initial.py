@@ -0,0 +1,74 @@
+from django.db import migrations, models
+
+
+if hasattr(models, 'Index'):
+    SNAPSHOT_INDEX = {'indexes': [models.Index(fields=['widget', 'timestamp'],
+            name='geckoboard_snapshot_time')]}
+else:
+    SNAPSHOT_INDEX = {'index_together': {('widget', 'timestamp')}}
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='RefreshNode',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                        serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('heartbeat', models.FloatField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RefreshLease',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                        serialize=False, verbose_name='ID')),
+                ('widget', models.CharField(max_length=255, unique=True)),
+                ('owner', models.CharField(blank=True, max_length=255)),
+                ('expires', models.FloatField(default=0)),
+                ('refreshed', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WidgetSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                        serialize=False, verbose_name='ID')),
+                ('widget', models.CharField(db_index=True, max_length=255)),
+                ('timestamp', models.FloatField(db_index=True)),
+                ('resolution', models.IntegerField(default=0)),
+                ('value', models.FloatField(null=True)),
+                ('data', models.TextField()),
+            ],
+            options=SNAPSHOT_INDEX,
+        ),
+        migrations.CreateModel(
+            name='DistinctSketch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                        serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('bucket', models.IntegerField()),
+                ('registers', models.TextField()),
+            ],
+            options={
+                'unique_together': {('name', 'bucket')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DatasetState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                        serialize=False, verbose_name='ID')),
+                ('dataset_id', models.CharField(max_length=255,
+                        unique=True)),
+                ('high_water_mark', models.TextField()),
+            ],
+        ),
+    ]
@@ -1 +1,90 @@
-# This file is necessary to make Django recognize it as an application.
+"""
+Models of django-geckoboard.
+
+Times are stored as Unix timestamps, so that nodes compare them without
+time zone conversions.
+"""
+
+import django
+from django.db import models
+
+
+class RefreshNode(models.Model):
+    """
+    A node taking part in the background refresh of widgets.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    heartbeat = models.FloatField()
+
+    def __unicode__(self):
+        return self.name
+
+
+class RefreshLease(models.Model):
+    """
+    The lease on the background refresh of a widget.
+
+    A node may refresh the widget while it holds an unexpired lease.
+    """
+    widget = models.CharField(max_length=255, unique=True)
+    owner = models.CharField(max_length=255, blank=True)
+    expires = models.FloatField(default=0)
+    refreshed = models.FloatField(default=0)
+
+    def __unicode__(self):
+        return self.widget
+
+
+class WidgetSnapshot(models.Model):
+    """
+    The converted data of a widget at a point in time.
+
+    Raw snapshots have a `resolution` of 0.  Old snapshots are
+    downsampled to one snapshot per `resolution` seconds, whose `value`
+    is the average of the values it replaces.
+    """
+    widget = models.CharField(max_length=255, db_index=True)
+    timestamp = models.FloatField(db_index=True)
+    resolution = models.IntegerField(default=0)
+    value = models.FloatField(null=True)
+    data = models.TextField()
+
+    class Meta:
+        # Lookups select a time range of a single widget.
+        if hasattr(models, 'Index'):
+            indexes = [models.Index(fields=['widget', 'timestamp'],
+                    name='geckoboard_snapshot_time')]
+        elif django.VERSION >= (1, 5):
+            index_together = [('widget', 'timestamp')]
+
+    def __unicode__(self):
+        return u'%s@%s' % (self.widget, self.timestamp)
+
+
+class DistinctSketch(models.Model):
+    """
+    The HyperLogLog sketch of the distinct values of a counter in a time
+    bucket.  The registers are stored base64-encoded.
+    """
+    name = models.CharField(max_length=255)
+    bucket = models.IntegerField()
+    registers = models.TextField()
+
+    class Meta:
+        unique_together = [('name', 'bucket')]
+
+    def __unicode__(self):
+        return u'%s@%s' % (self.name, self.bucket)
+
+
+class DatasetState(models.Model):
+    """
+    The synchronization state of a Geckoboard dataset: the high-water
+    mark of its updated field, as text parsed by that field (ISO 8601
+    for dates and times).
+    """
+    dataset_id = models.CharField(max_length=255, unique=True)
+    high_water_mark = models.TextField()
+
+    def __unicode__(self):
+        return self.dataset_id
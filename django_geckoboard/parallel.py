@@ -0,0 +1,182 @@
+"""
+Parallel sub-computations of widget views.
+
+Widget views often run a few independent, slow queries one after
+another.  Running them on a shared pool of threads makes the latency of
+the view that of the slowest query instead of their sum.
+"""
+
+import threading
+from collections import OrderedDict, deque
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # Python 3
+
+from django.conf import settings
+from django.db import connections
+
+from django_geckoboard.querycount import count_queries, get_query_counter
+from django_geckoboard.routing import get_statement_timeout, \
+        get_widget_database, widget_database
+
+
+DEFAULT_WORKERS = 8
+
+_local = threading.local()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class Parallel(object):
+    """
+    A set of named sub-computations run concurrently.
+
+    The sub-computations run on a process-wide pool of
+    ``GECKOBOARD_PARALLEL_WORKERS`` threads (default 8), and on the
+    calling thread, so that a busy pool degrades to running them one
+    after another instead of waiting.  At most `max_workers` threads,
+    including the calling thread, work on one set.  Each thread uses
+    its own database connections, routed to the database of the widget
+    being computed; pool threads close their connections when they are
+    done with a set.  Sub-computations started from a pool thread run
+    in that thread.
+
+    Queries made by pool threads are counted against the query budget
+    of the widget being computed.  Memory allocations need no special
+    care, as `tracemalloc` traces all threads.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._tasks = []
+
+    def add(self, name, func, *args, **kwargs):
+        """Add a sub-computation calling `func` with the arguments."""
+        if name in [task.name for task in self._tasks]:
+            raise ValueError("Duplicate sub-computation: %s" % name)
+        self._tasks.append(_Task(name, func, args, kwargs))
+
+    def run(self):
+        """
+        Run the sub-computations and return a tuple of their results,
+        in the order they were added.  If sub-computations raise an
+        exception, the exception of the first one is re-raised after
+        all have finished.
+        """
+        return tuple(self.run_dict().values())
+
+    def run_dict(self):
+        """
+        Run the sub-computations and return an ordered dictionary of
+        their results, keyed by name.
+        """
+        batch = _Batch(self._tasks, get_widget_database(),
+                get_statement_timeout(), get_query_counter())
+        helpers = len(self._tasks) - 1
+        if self.max_workers is not None:
+            helpers = min(helpers, self.max_workers - 1)
+        if helpers > 0 and not getattr(_local, 'worker', False):
+            _get_pool().submit(batch, helpers)
+        while batch.run_next():
+            pass
+        batch.wait()
+        for task in self._tasks:
+            if task.exception is not None:
+                raise task.exception
+        return OrderedDict((task.name, task.result) for task in self._tasks)
+
+
+class _Task(object):
+
+    def __init__(self, name, func, args, kwargs):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.exception = None
+
+
+class _Batch(object):
+    """The pending tasks of a `Parallel.run` call."""
+
+    def __init__(self, tasks, alias, statement_timeout, counter):
+        self.alias = alias
+        self.statement_timeout = statement_timeout
+        self.counter = counter
+        for task in tasks:
+            task.result = task.exception = None
+        self._pending = deque(tasks)
+        self._remaining = len(tasks)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not tasks:
+            self._done.set()
+
+    def run_next(self):
+        """Run a pending task.  Return whether there was one."""
+        with self._lock:
+            if not self._pending:
+                return False
+            task = self._pending.popleft()
+        try:
+            with widget_database(self.alias, self.statement_timeout):
+                if self.counter is None or \
+                        get_query_counter() is self.counter:
+                    task.result = task.func(*task.args, **task.kwargs)
+                else:
+                    with count_queries(self.counter):
+                        task.result = task.func(*task.args, **task.kwargs)
+        except Exception as e:
+            task.exception = e
+        with self._lock:
+            self._remaining -= 1
+            if not self._remaining:
+                self._done.set()
+        return True
+
+    def wait(self):
+        self._done.wait()
+
+
+class _WorkerPool(object):
+
+    def __init__(self, size):
+        self.size = size
+        self._queue = Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, batch, helpers):
+        """Let up to `helpers` pool threads work on a batch."""
+        with self._lock:
+            while len(self._threads) < min(self.size, helpers):
+                thread = threading.Thread(target=self._work,
+                        name='geckoboard-parallel-%d' % len(self._threads))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        for i in range(min(self.size, helpers)):
+            self._queue.put(batch)
+
+    def _work(self):
+        _local.worker = True
+        while True:
+            batch = self._queue.get()
+            try:
+                while batch.run_next():
+                    pass
+            finally:
+                for connection in connections.all():
+                    connection.close()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _WorkerPool(getattr(settings,
+                    'GECKOBOARD_PARALLEL_WORKERS', DEFAULT_WORKERS))
+        return _pool
@@ -0,0 +1,47 @@
+"""
+Storage of the last successfully rendered widget payloads.
+
+Payloads are kept in the Django cache, so that they are shared between
+worker processes if a shared cache backend is configured.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+DEFAULT_PAYLOAD_TIMEOUT = 24 * 60 * 60
+
+
+def payload_key(name, format, args=(), kwargs=None):
+    """
+    Return the cache key of a widget payload.
+
+    The key depends on the widget name, the format and the arguments
+    passed to the view by the URLconf.
+    """
+    return 'django_geckoboard:payload:%s:%s:%s' % (name, format,
+            arguments_digest(args, kwargs))
+
+
+def arguments_digest(args=(), kwargs=None):
+    """Return a digest of the arguments passed to a view."""
+    arguments = repr((tuple(args), sorted((kwargs or {}).items())))
+    return hashlib.md5(arguments.encode('utf-8')).hexdigest()
+
+
+def get_payload(key):
+    """
+    Return a tuple `(content, timestamp)` of the last stored payload, or
+    `None` if no payload was stored.
+    """
+    return cache.get(key)
+
+
+def set_payload(key, content):
+    """Store a rendered payload."""
+    timeout = getattr(settings, 'GECKOBOARD_PAYLOAD_TIMEOUT',
+            DEFAULT_PAYLOAD_TIMEOUT)
+    cache.set(key, (content, time.time()), timeout)
@@ -0,0 +1,126 @@
+"""
+Sampled profiling of Geckoboard widget requests.
+"""
+
+import cProfile
+import itertools
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+
+# Number of requests profiled after a request exceeded the threshold.
+ARMED_REQUESTS = 3
+
+_dump_counter = itertools.count()
+
+
+def get_profile_dir():
+    """Return the directory profile dumps are written to."""
+    directory = getattr(settings, 'GECKOBOARD_PROFILE_DIR', None)
+    if directory is None:
+        directory = os.path.join(tempfile.gettempdir(),
+                'django_geckoboard_profiles')
+    return directory
+
+
+class WidgetProfiler(object):
+    """
+    Profiles a sample of the requests for a single widget.
+
+    A request is profiled with a probability of `sample_rate`.  If a
+    `threshold` (in seconds) is set, only profiles of requests taking at
+    least that long are kept, and an unprofiled request that exceeds the
+    threshold causes the next few requests to be profiled.  Unsampled
+    requests only pay for a random number and, with a threshold, two
+    clock reads.
+
+    Profiles are written to the ``GECKOBOARD_PROFILE_DIR`` directory as
+    ``<widget>-<format>-<timestamp>.prof`` files that can be loaded with
+    the `pstats` module.  At most `max_files` dumps are kept per widget and
+    format; older dumps are removed.
+    """
+
+    def __init__(self, name, sample_rate=0, threshold=None, max_files=10):
+        self.name = name
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.max_files = max_files
+        self._armed = 0
+        self._lock = threading.Lock()
+
+    def run(self, format, func, *args, **kwargs):
+        """Call `func`, profiling the call if it is sampled."""
+        if not self._is_sampled():
+            if self.threshold is None:
+                return func(*args, **kwargs)
+            start = time.time()
+            result = func(*args, **kwargs)
+            if time.time() - start >= self.threshold:
+                self._armed = ARMED_REQUESTS
+            return result
+        profile = cProfile.Profile()
+        start = time.time()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in this process.
+            return func(*args, **kwargs)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            profile.disable()
+        elapsed = time.time() - start
+        if self.threshold is None or elapsed >= self.threshold:
+            self._dump(profile, format, elapsed)
+        return result
+
+    def _is_sampled(self):
+        if self._armed:
+            with self._lock:
+                if self._armed:
+                    self._armed -= 1
+                    return True
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    def _dump(self, profile, format, elapsed):
+        directory = get_profile_dir()
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        prefix = '%s-%s-' % (_safe_name(self.name), format)
+        filename = '%s%s-%d-%d-%dms.prof' % (prefix,
+                time.strftime('%Y%m%d%H%M%S'), os.getpid(),
+                next(_dump_counter), elapsed * 1000)
+        profile.dump_stats(os.path.join(directory, filename))
+        self._rotate(directory, prefix)
+
+    def _rotate(self, directory, prefix):
+        dumps = [os.path.join(directory, f) for f in os.listdir(directory)
+                if f.startswith(prefix) and f.endswith('.prof')]
+        if len(dumps) <= self.max_files:
+            return
+        dumps.sort(key=lambda path: (_mtime(path), path))
+        for path in dumps[:len(dumps) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # removed by another process
+
+
+def _safe_name(name):
+    return re.sub(r'[^\w.-]', '_', name)
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
@@ -0,0 +1,208 @@
+"""
+Data providers shared by widgets.
+
+Widgets on the same dashboard often show different views of the same
+data.  A provider computes such a dataset once, keeps it for a time to
+live, and is injected into every widget view that declares it.
+Providers are computed on demand, so a provider is only refreshed when
+a widget using it is computed.
+"""
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+_local = threading.local()
+_cycles = itertools.count(1)
+
+
+class DataProvider(object):
+    """
+    A dataset computed by `func` and shared by widgets.
+
+    The value is recomputed when it is older than `ttl` seconds.  During
+    a refresh cycle (see `refresh_cycle`), it is computed at most once
+    per cycle, whatever its age.  Concurrent requests for a stale value
+    wait for a single computation.  `depends` names providers whose
+    values are passed to `func` as keyword arguments; providers that
+    depend on each other raise `ValueError`.  If `shared` is
+    true, the value is also kept in the Django cache, so that all
+    workers using the cache share it.
+
+    Calling the provider returns its value.
+    """
+
+    def __init__(self, name, func, ttl=60, depends=(), shared=False):
+        self.name = name
+        self.func = func
+        self.ttl = ttl
+        self.depends = tuple(depends)
+        self.shared = shared
+        self._cache_key = 'django_geckoboard:provider:%s' % name
+        self._lock = threading.Lock()
+        self._value = None
+        self._computed = None
+        self._cycle = None
+        self._computations = 0
+        self._hits = 0
+        self._duration = None
+        self._consumers = {}
+
+    def __call__(self):
+        return self.get()
+
+    def get(self, consumer=None):
+        """
+        Return the value, computing it if it is stale.  `consumer` names
+        the widget or provider using the value, for `stats`.
+        """
+        cycle = getattr(_local, 'cycle', None)
+        with self._lock:
+            if consumer is not None:
+                self._consumers[consumer] = time.time()
+            if self._is_fresh(cycle):
+                self._hits += 1
+                return self._value
+            if self.shared and cycle is None:
+                entry = cache.get(self._cache_key)
+                if entry is not None and \
+                        time.time() - entry[0] < self.ttl:
+                    self._computed, self._value = entry
+                    self._hits += 1
+                    return self._value
+            # Checked before any dependency is locked, as a cycle would
+            # deadlock.
+            _check_dependencies(self)
+            kwargs = dict((name, get_provider(name).get(self.name))
+                    for name in self.depends)
+            start = time.time()
+            value = self.func(**kwargs)
+            self._duration = time.time() - start
+            self._value = value
+            self._computed = time.time()
+            self._cycle = cycle
+            self._computations += 1
+            if self.shared:
+                cache.set(self._cache_key, (self._computed, value),
+                        self.ttl)
+            return value
+
+    def invalidate(self):
+        """Make the next `get` recompute the value."""
+        with self._lock:
+            self._computed = None
+            self._cycle = None
+            if self.shared:
+                cache.delete(self._cache_key)
+
+    def stats(self):
+        """Return a dictionary describing the provider for monitoring."""
+        with self._lock:
+            return {
+                'ttl': self.ttl,
+                'depends': list(self.depends),
+                'computations': self._computations,
+                'hits': self._hits,
+                'computed': self._computed,
+                'duration': self._duration,
+                'consumers': dict(self._consumers),
+            }
+
+    def _is_fresh(self, cycle):
+        if self._computed is None:
+            return False
+        if cycle is not None:
+            return self._cycle == cycle
+        return time.time() - self._computed < self.ttl
+
+
+def provider(name=None, ttl=60, depends=(), shared=False):
+    """
+    Decorator registering a function as a `DataProvider`, named after
+    the function unless `name` is given.  The decorated name refers to
+    the provider.
+    """
+    def decorator(func):
+        data_provider = DataProvider(name or func.__name__, func, ttl=ttl,
+                depends=depends, shared=shared)
+        register_provider(data_provider)
+        return data_provider
+    return decorator
+
+
+@contextmanager
+def refresh_cycle():
+    """
+    Compute every provider used in the current thread at most once
+    until the block exits.
+    """
+    previous = getattr(_local, 'cycle', None)
+    if previous is None:
+        _local.cycle = next(_cycles)
+    try:
+        yield
+    finally:
+        _local.cycle = previous
+
+
+def provider_values(providers, consumer=None):
+    """
+    Return a dictionary of provider values, given a list of providers or
+    provider names, keyed by provider name, or a dictionary of providers
+    or names keyed by argument name.
+    """
+    if isinstance(providers, dict):
+        items = providers.items()
+    else:
+        items = [(_provider_name(p), p) for p in providers]
+    return dict((argument, _lookup(p).get(consumer))
+            for argument, p in items)
+
+
+def register_provider(data_provider):
+    """Register a data provider under its name."""
+    with _providers_lock:
+        _providers[data_provider.name] = data_provider
+
+
+def get_provider(name):
+    """Return the registered data provider with a name."""
+    with _providers_lock:
+        data_provider = _providers.get(name)
+    if data_provider is None:
+        raise ValueError("Unknown data provider: %s" % name)
+    return data_provider
+
+
+def provider_stats():
+    """Return the stats of all data providers, keyed by name."""
+    with _providers_lock:
+        providers = list(_providers.values())
+    return dict((p.name, p.stats()) for p in providers)
+
+
+def _check_dependencies(data_provider, path=()):
+    """Raise `ValueError` if a provider depends on itself."""
+    path += (data_provider.name,)
+    for name in data_provider.depends:
+        if name in path:
+            raise ValueError("Data provider dependency cycle: %s"
+                    % " -> ".join(path[path.index(name):] + (name,)))
+        _check_dependencies(get_provider(name), path)
+
+def _provider_name(data_provider):
+    if isinstance(data_provider, DataProvider):
+        return data_provider.name
+    return data_provider
+
+def _lookup(data_provider):
+    if isinstance(data_provider, DataProvider):
+        return data_provider
+    return get_provider(data_provider)
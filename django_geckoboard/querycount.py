@@ -0,0 +1,290 @@
+"""
+Database query budgets of widget views.
+
+The queries made while a widget is computed are counted and timed.  A
+widget can be given a maximum number of queries, and statements that
+are repeated with different parameters are reported as likely N+1
+query patterns.
+"""
+
+import logging
+import re
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger('django_geckoboard')
+
+ACTIONS = ('warn', 'log', 'raise')
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+_local = threading.local()
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"%s|\?")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised when a widget view makes more queries than its budget allows
+    and the budget action is 'raise'.
+    """
+
+
+class QueryBudgetWarning(RuntimeWarning):
+    """
+    Issued when a widget view exceeds its query budget or repeats a
+    statement and the budget action is 'warn'.
+    """
+
+
+class QueryCounter(object):
+    """
+    Counts and times the queries made in a block of code.
+
+    Instances are callable as a Django ``execute_wrapper``.  A counter
+    may record the queries of several threads at once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.time = 0.0
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, time.time() - start)
+
+    def record(self, sql, seconds):
+        statement = normalize_sql(sql)
+        with self._lock:
+            self.count += 1
+            self.time += seconds
+            self.statements[statement] = \
+                    self.statements.get(statement, 0) + 1
+
+    def repeated(self, threshold):
+        """
+        Return `(statement, count)` tuples of the statements made at
+        least `threshold` times, most repeated first.
+        """
+        return sorted(((statement, count)
+                for statement, count in self.statements.items()
+                if count >= threshold), key=lambda item: -item[1])
+
+
+class QueryBudget(object):
+    """
+    The query budget of a widget.
+
+    At most `max_queries` queries (unlimited if `None`) may be made per
+    computation, and a statement may be repeated fewer than
+    `repeat_threshold` times.  Violations are handled according to
+    `action`: 'warn' issues a `QueryBudgetWarning`, 'log' logs a warning
+    and 'raise' raises `QueryBudgetExceeded`.  The action defaults to
+    the ``GECKOBOARD_QUERY_BUDGET_ACTION`` setting or 'log'.
+    """
+
+    def __init__(self, name, max_queries=None, repeat_threshold=5,
+            action=None):
+        if action is not None and action not in ACTIONS:
+            raise ValueError("Unknown query budget action: %s" % action)
+        self.name = name
+        self.max_queries = max_queries
+        self.repeat_threshold = repeat_threshold
+        self.action = action
+        self._lock = threading.Lock()
+        self._computations = 0
+        self._queries = 0
+        self._time = 0.0
+        self._max_count = 0
+        self._exceeded = 0
+        self._repeated = []
+
+    @contextmanager
+    def track(self):
+        """Count the queries made in the block and check the budget."""
+        counter = QueryCounter()
+        with count_queries(counter):
+            yield counter
+        self._check(counter)
+
+    def stats(self):
+        """Return a dictionary describing the query use of the widget."""
+        with self._lock:
+            return {
+                'computations': self._computations,
+                'queries': self._queries,
+                'time': self._time,
+                'max_count': self._max_count,
+                'exceeded': self._exceeded,
+                'repeated': list(self._repeated),
+                'max_queries': self.max_queries,
+            }
+
+    def _check(self, counter):
+        repeated = counter.repeated(self.repeat_threshold)
+        exceeded = self.max_queries is not None and \
+                counter.count > self.max_queries
+        with self._lock:
+            self._computations += 1
+            self._queries += counter.count
+            self._time += counter.time
+            self._max_count = max(self._max_count, counter.count)
+            if exceeded:
+                self._exceeded += 1
+            if repeated:
+                self._repeated = repeated
+        problems = []
+        if exceeded:
+            problems.append("made %d queries, more than its budget of %d"
+                    % (counter.count, self.max_queries))
+        for statement, count in repeated:
+            problems.append("repeated a statement %d times, a likely N+1 "
+                    "query: %s" % (count, statement))
+        if problems:
+            self._violation("Widget %s %s" % (self.name,
+                    "; ".join(problems)))
+
+    def _violation(self, message):
+        action = self.action or getattr(settings,
+                'GECKOBOARD_QUERY_BUDGET_ACTION', 'log')
+        if action == 'raise':
+            raise QueryBudgetExceeded(message)
+        if action == 'warn':
+            warnings.warn(message, QueryBudgetWarning)
+        else:
+            logger.warning(message)
+
+
+@contextmanager
+def count_queries(counter):
+    """
+    Record the queries made on all database connections of the current
+    thread in a `QueryCounter`.
+    """
+    aliases = list(connections)
+    outer = get_query_counter()
+    _local.counter = counter
+    try:
+        with _wrap_connections(counter, aliases):
+            yield counter
+    finally:
+        _local.counter = outer
+
+
+def get_query_counter():
+    """
+    Return the `QueryCounter` recording the queries of the current
+    thread, or `None`.
+    """
+    return getattr(_local, 'counter', None)
+
+
+@contextmanager
+def _wrap_connections(counter, aliases):
+    if not aliases:
+        yield
+        return
+    connection = connections[aliases[0]]
+    if hasattr(connection, 'execute_wrapper'):
+        wrapper = connection.execute_wrapper(counter)
+    else:
+        wrapper = _debug_cursor(connection, counter)
+    with wrapper:
+        with _wrap_connections(counter, aliases[1:]):
+            yield
+
+
+@contextmanager
+def _debug_cursor(connection, counter):
+    # Django versions before 2.0 have no execute wrappers; the debug
+    # cursor of the connection is wrapped instead.
+    make_debug_cursor = connection.make_debug_cursor
+    patched = connection.__dict__.get('make_debug_cursor')
+    use_debug_cursor = connection.use_debug_cursor
+    start = len(connection.queries)
+    connection.make_debug_cursor = lambda cursor: _CountingCursor(
+            make_debug_cursor(cursor), counter)
+    connection.use_debug_cursor = True
+    try:
+        yield
+    finally:
+        if patched is None:
+            del connection.make_debug_cursor
+        else:
+            connection.make_debug_cursor = patched
+        connection.use_debug_cursor = use_debug_cursor
+        if not settings.DEBUG:
+            del connection.queries[start:]
+
+
+class _CountingCursor(object):
+
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def execute(self, sql, params=()):
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.counter.record(sql, time.time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.counter.record(sql, time.time() - start)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+def normalize_sql(sql):
+    """
+    Return a statement with its literals and parameter lists replaced,
+    so that statements differing only in their parameters are equal.
+    """
+    sql = _STRINGS.sub('?', sql)
+    sql = _NUMBERS.sub('?', sql)
+    sql = _PLACEHOLDERS.sub('?', sql)
+    sql = _LISTS.sub('(...)', sql)
+    return ' '.join(sql.split())
+
+
+def register_budget(budget):
+    """Register a query budget for monitoring."""
+    with _budgets_lock:
+        _budgets[budget.name] = budget
+
+
+def get_budget(name):
+    """Return the registered query budget of a widget, or `None`."""
+    with _budgets_lock:
+        return _budgets.get(name)
+
+
+def query_stats():
+    """Return the query stats of all widgets, keyed by widget name."""
+    with _budgets_lock:
+        budgets = list(_budgets.values())
+    return dict((budget.name, budget.stats()) for budget in budgets)
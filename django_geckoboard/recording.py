@@ -0,0 +1,421 @@
+"""
+Recording and replaying of real widget view results.
+
+A sample of the results returned by widget views is recorded to an
+on-disk corpus, together with the payloads rendered from them.  The
+corpus can be replayed through the conversion and rendering code to
+check that the output has not changed and to compare performance
+between package versions.
+
+Conversions that read external state, such as the snapshot history or
+the Django cache, do so through `recorded_lookup`, so that replaying
+them uses the recorded values and does not change that state.
+"""
+
+import glob
+import json
+import logging
+import os
+import pickle
+import random
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    from collections.abc import Iterator
+except ImportError:
+    from collections import Iterator  # Python 2
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # Python 2
+
+try:
+    from importlib import import_module
+except ImportError:
+    from django.utils.importlib import import_module  # Python 2.6
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # Python 2
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.query import QuerySet
+from django.http import HttpRequest
+
+import django_geckoboard
+from django_geckoboard.profiling import _safe_name
+
+
+logger = logging.getLogger('django_geckoboard')
+
+CORPUS_EXTENSION = '.corpus'
+DEFAULT_MAX_BYTES = 1024 * 1024
+
+# View results with more items, counting nested containers, are not
+# recorded.
+MAX_ITEMS = 10000
+
+# Records waiting to be written; further records are dropped.
+MAX_PENDING = 100
+
+_LENGTH = struct.Struct('>I')
+
+_local = threading.local()
+
+_pending = queue.Queue(MAX_PENDING)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_corpus_dir():
+    """
+    Return the directory the corpus is written to.  The default is a
+    subdirectory of the system temporary directory for the current user.
+    """
+    directory = getattr(settings, 'GECKOBOARD_RECORD_DIR', None)
+    if directory is None:
+        directory = os.path.join(tempfile.gettempdir(),
+                'django_geckoboard_corpus-%d' % _uid())
+    return directory
+
+
+def flush_records():
+    """Wait until the queued records are written to the corpus."""
+    _pending.join()
+
+
+class Recorder(object):
+    """
+    Records a sample of the view results of a single widget.
+
+    A view result is recorded with a probability of `sample_rate`.
+    Records are rendered and appended to ``<widget>.corpus`` in the
+    corpus directory by a background thread, each one a zlib-compressed
+    pickle of the decorator class and options, the view result, the
+    values of the lookups made by the conversion, the converted data and
+    the XML and JSON payloads.  View results that are QuerySets or
+    iterators, or contain them or more than `MAX_ITEMS` items, are not
+    recorded, as pickling them would evaluate or consume them; their
+    records only replay the rendering of the converted data.  Records
+    that would grow the file beyond ``GECKOBOARD_RECORD_MAX_BYTES``
+    (default 1 MB), or find `MAX_PENDING` records waiting to be written,
+    are dropped.
+    """
+
+    def __init__(self, name, sample_rate):
+        self.name = name
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+
+    def is_sampled(self):
+        return random.random() < self.sample_rate
+
+    def capture(self, view_result):
+        """
+        Return a `Capture` of a view result, taken before conversion can
+        modify it.
+        """
+        snapshot = None
+        if _is_recordable(view_result):
+            try:
+                snapshot = pickle.dumps(view_result, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                logger.warning("Cannot record the result of %s", self.name,
+                        exc_info=True)
+        return Capture(snapshot)
+
+    def record(self, decorator, capture, data):
+        """
+        Queue a record of a captured view result and its data, to be
+        written by the background thread.
+        """
+        _start_writer()
+        try:
+            _pending.put_nowait((self, decorator, capture, data,
+                    time.time()))
+        except queue.Full:
+            pass
+
+    def _write(self, decorator, capture, data, recorded):
+        record = {
+            'widget': self.name,
+            'decorator': '%s.%s' % (decorator.__class__.__module__,
+                    decorator.__class__.__name__),
+            'options': decorator.options,
+            'view_result': capture.snapshot,
+            'lookups': capture.lookups,
+            'data': data,
+            'xml': decorator._render_data(format_request('1'), data),
+            'json': decorator._render_data(format_request('2'), data),
+            'recorded': recorded,
+            'version': django_geckoboard.__version__,
+        }
+        try:
+            blob = zlib.compress(pickle.dumps(record,
+                    pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            logger.warning("Cannot record the options of %s", self.name,
+                    exc_info=True)
+            return
+        directory = _corpus_dir(create=True)
+        max_bytes = getattr(settings, 'GECKOBOARD_RECORD_MAX_BYTES',
+                DEFAULT_MAX_BYTES)
+        path = os.path.join(directory, _safe_name(self.name)
+                + CORPUS_EXTENSION)
+        with self._lock:
+            size = os.path.exists(path) and os.path.getsize(path) or 0
+            if size + _LENGTH.size + len(blob) > max_bytes:
+                return
+            with open(path, 'ab') as f:
+                f.write(_LENGTH.pack(len(blob)) + blob)
+
+
+class Capture(object):
+    """
+    A view result captured for recording: `snapshot` is the pickled view
+    result, or `None` if it is not recorded, and `lookups` the
+    `(name, value)` pairs of the lookups made while converting it.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.lookups = []
+
+    @contextmanager
+    def converting(self):
+        """Record the lookups made in the block."""
+        outer = getattr(_local, 'state', None)
+        _local.state = ('record', self.lookups)
+        try:
+            yield
+        finally:
+            _local.state = outer
+
+
+def recorded_lookup(name, func, *args, **kwargs):
+    """
+    Return `func(*args, **kwargs)`, a lookup of external state made by
+    the conversion of a view result.
+
+    While a view result is recorded, the value is stored with the record
+    under `name`.  While a record is replayed, the stored value is
+    returned and `func`, which may read or change production state, is
+    not called; lookups missing from the record return `None`.
+    """
+    state = getattr(_local, 'state', None)
+    if state is None:
+        return func(*args, **kwargs)
+    mode, lookups = state
+    if mode == 'replay':
+        for i, (lookup_name, value) in enumerate(lookups):
+            if lookup_name == name:
+                del lookups[i]
+                return value
+        return None
+    value = func(*args, **kwargs)
+    lookups.append((name, value))
+    return value
+
+
+def format_request(format):
+    """Return a request for the given Geckoboard format parameter."""
+    request = HttpRequest()
+    request.GET['format'] = format
+    return request
+
+
+def read_corpus(path):
+    """Iterate over the records in a corpus file."""
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_LENGTH.size)
+            if len(header) < _LENGTH.size:
+                return
+            blob = f.read(_LENGTH.unpack(header)[0])
+            yield pickle.loads(zlib.decompress(blob))
+
+
+def replay_corpus(directory=None, repeat=10):
+    """
+    Replay all records in the corpus and return a report.
+
+    Each record is converted and rendered to XML and JSON `repeat`
+    times.  The report contains, per widget, the number of records, the
+    records whose output differs from the recorded output, the best
+    time in microseconds to process all records once and, on Python
+    versions with `tracemalloc`, the peak number of bytes allocated
+    while processing a record.
+    """
+    if directory is None:
+        directory = _corpus_dir()
+    widgets = {}
+    for path in sorted(glob.glob(os.path.join(directory,
+            '*' + CORPUS_EXTENSION))):
+        for record in read_corpus(path):
+            widget = widgets.setdefault(record['widget'], {
+                'records': 0,
+                'mismatches': [],
+                'time_us': 0.0,
+                'peak_bytes': None,
+            })
+            index = widget['records']
+            widget['records'] += 1
+            decorator = _load_decorator(record)
+            xml, json_content = _replay_record(decorator, record)
+            if xml != record['xml'] or json_content != record['json']:
+                widget['mismatches'].append(index)
+            widget['time_us'] += min(_time_record(decorator, record)
+                    for i in range(repeat)) * 1e6
+            peak = _peak_allocation(decorator, record)
+            if peak is not None:
+                widget['peak_bytes'] = max(widget['peak_bytes'] or 0, peak)
+    return {
+        'version': django_geckoboard.__version__,
+        'widgets': widgets,
+    }
+
+
+def compare_reports(report, baseline):
+    """
+    Return a list of `(widget, metric, baseline, current, change)`
+    tuples for the widgets in both reports, where `change` is the
+    relative change from the baseline.
+    """
+    changes = []
+    for name in sorted(report['widgets']):
+        old = baseline['widgets'].get(name)
+        if old is None:
+            continue
+        new = report['widgets'][name]
+        for metric in ('time_us', 'peak_bytes'):
+            if not old.get(metric) or new.get(metric) is None:
+                continue
+            change = (new[metric] - old[metric]) / float(old[metric])
+            changes.append((name, metric, old[metric], new[metric], change))
+    return changes
+
+
+def save_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+
+def load_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        # The thread does not survive a fork of the process.
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_records,
+                    name='django_geckoboard recorder')
+            _writer.daemon = True
+            _writer.start()
+
+def _write_records():
+    while True:
+        recorder, decorator, capture, data, recorded = _pending.get()
+        try:
+            recorder._write(decorator, capture, data, recorded)
+        except Exception:
+            logger.exception("Cannot record the result of %s",
+                    recorder.name)
+        finally:
+            _pending.task_done()
+
+def _corpus_dir(create=False):
+    """
+    Return the corpus directory, creating it if `create` is true.  As
+    records are unpickled, the default directory must be private to the
+    current user.
+    """
+    directory = get_corpus_dir()
+    if create and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory, 0o700)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+    if getattr(settings, 'GECKOBOARD_RECORD_DIR', None) is None and \
+            os.path.isdir(directory) and hasattr(os, 'getuid'):
+        stat = os.stat(directory)
+        if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+            raise ImproperlyConfigured("The corpus directory %s is not "
+                    "private to the current user; set "
+                    "GECKOBOARD_RECORD_DIR" % directory)
+    return directory
+
+def _uid():
+    return hasattr(os, 'getuid') and os.getuid() or 0
+
+def _is_recordable(result):
+    pending = [result]
+    items = 0
+    while pending:
+        value = pending.pop()
+        if isinstance(value, (QuerySet, Iterator)):
+            return False
+        if isinstance(value, dict):
+            values = list(value.values())
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            values = list(value)
+        else:
+            continue
+        items += len(values)
+        if items > MAX_ITEMS:
+            return False
+        pending.extend(values)
+    return True
+
+def _load_decorator(record):
+    module_name, class_name = record['decorator'].rsplit('.', 1)
+    decorator_class = getattr(import_module(module_name), class_name)
+    decorator = decorator_class(**record['options'])
+    decorator.name = record['widget']
+    return decorator
+
+def _replay_record(decorator, record):
+    if record['view_result'] is None:
+        data = record['data']
+    else:
+        view_result = pickle.loads(record['view_result'])
+        outer = getattr(_local, 'state', None)
+        _local.state = ('replay', list(record.get('lookups', ())))
+        try:
+            data = decorator._convert_view_result(view_result)
+        finally:
+            _local.state = outer
+    return (decorator._render_data(format_request('1'), data),
+            decorator._render_data(format_request('2'), data))
+
+def _time_record(decorator, record):
+    start = time.time()
+    _replay_record(decorator, record)
+    return time.time() - start
+
+def _peak_allocation(decorator, record):
+    if tracemalloc is None:
+        return None
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        _replay_record(decorator, record)
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        if started:
+            tracemalloc.stop()
@@ -0,0 +1,171 @@
+"""
+Adaptive cache timeouts for widget payloads.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+# Weight of a new measurement in the moving averages.
+SMOOTHING = 0.3
+
+# Weight kept by the change statistics at every computation.
+DECAY = 0.8
+
+# Payload digests kept for comparison, for the most recently computed
+# formats and arguments.
+MAX_PAYLOADS = 1000
+
+
+class AdaptiveTTL(object):
+    """
+    Chooses the cache timeout of a widget from its measured cost, change
+    rate and poll frequency.
+
+    Every time the payload is recomputed, its computation time is
+    measured and the payload is compared with the previous one for the
+    same format and arguments.  From this the rate at which the payload
+    changes is estimated, and the timeout is set to `staleness` times the
+    expected time between changes, so that fast-moving widgets are
+    refreshed often and widgets that rarely change are not recomputed
+    needlessly.  While no changes are seen the timeout doubles at every
+    computation.
+
+    If the widget is polled so often that recomputing it on every poll
+    would keep a worker busy more than `max_load` of the time, the
+    timeout is raised until it does not.  The timeout always stays
+    between `min_timeout` and `max_timeout`.
+    """
+
+    def __init__(self, name, min_timeout=5, max_timeout=600, initial=None,
+            staleness=0.5, max_load=0.1):
+        if min_timeout > max_timeout:
+            raise ValueError("min_timeout must not exceed max_timeout")
+        self.name = name
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.staleness = staleness
+        self.max_load = max_load
+        if initial is None:
+            initial = min_timeout
+        self._lock = threading.Lock()
+        self._timeout = _clamp(initial, min_timeout, max_timeout)
+        self._reason = 'initial'
+        self._cost = None
+        self._poll_interval = None
+        self._last_poll = None
+        self._polls = 0
+        self._computations = 0
+        self._changes = 0.0
+        self._observed = 0.0
+        self._payloads = OrderedDict()
+
+    def record_poll(self):
+        """Record a request of the widget, served from cache or not."""
+        with self._lock:
+            now = time.time()
+            if self._last_poll is not None:
+                self._poll_interval = _average(self._poll_interval,
+                        now - self._last_poll)
+            self._last_poll = now
+            self._polls += 1
+
+    def record_computation(self, key, seconds, content):
+        """
+        Record that the payload for `key` was computed in `seconds` and
+        update the timeout.
+        """
+        digest = hashlib.md5(content).digest()
+        with self._lock:
+            now = time.time()
+            self._computations += 1
+            self._cost = _average(self._cost, seconds)
+            previous = self._payloads.pop(key, None)
+            self._payloads[key] = (digest, now)
+            if len(self._payloads) > MAX_PAYLOADS:
+                self._payloads.popitem(last=False)
+            if previous is not None:
+                self._changes = self._changes * DECAY + \
+                        (digest != previous[0])
+                self._observed = self._observed * DECAY + \
+                        (now - previous[1])
+            self._update()
+
+    def timeout(self):
+        """Return the current cache timeout in seconds."""
+        with self._lock:
+            return self._timeout
+
+    def stats(self):
+        """Return a dictionary describing the policy for introspection."""
+        with self._lock:
+            change_rate = None
+            if self._observed:
+                change_rate = self._changes / self._observed
+            return {
+                'timeout': self._timeout,
+                'reason': self._reason,
+                'cost': self._cost,
+                'poll_interval': self._poll_interval,
+                'change_rate': change_rate,
+                'polls': self._polls,
+                'computations': self._computations,
+                'min_timeout': self.min_timeout,
+                'max_timeout': self.max_timeout,
+            }
+
+    def _update(self):
+        if not self._observed:
+            return
+        if self._changes:
+            timeout = self.staleness * self._observed / self._changes
+            reason = 'change rate'
+        else:
+            timeout = self._timeout * 2
+            reason = 'no changes'
+        # Recomputing at most once per timeout and at most once per poll
+        # costs cost / max(timeout, poll_interval) of a worker.
+        if self._cost and self._poll_interval is not None and \
+                self._cost / max(timeout, self._poll_interval) \
+                > self.max_load:
+            timeout = self._cost / self.max_load
+            reason = 'computation cost'
+        if timeout < self.min_timeout:
+            timeout, reason = self.min_timeout, 'min_timeout'
+        elif timeout > self.max_timeout:
+            timeout, reason = self.max_timeout, 'max_timeout'
+        self._timeout = timeout
+        self._reason = reason
+
+
+def _average(current, value):
+    if current is None:
+        return value
+    return current + SMOOTHING * (value - current)
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def register_policy(policy):
+    """Register an adaptive timeout policy for introspection."""
+    with _policies_lock:
+        _policies[policy.name] = policy
+
+
+def get_policy(name):
+    """Return the registered timeout policy of a widget, or `None`."""
+    with _policies_lock:
+        return _policies.get(name)
+
+
+def ttl_stats():
+    """Return the stats of all timeout policies, keyed by widget name."""
+    with _policies_lock:
+        policies = list(_policies.values())
+    return dict((policy.name, policy.stats()) for policy in policies)
@@ -0,0 +1,44 @@
+"""
+Registry of the widgets served outside the Django URLconf.
+"""
+
+import threading
+
+
+_widgets = {}
+_widgets_lock = threading.Lock()
+
+
+def register_widget(path, view):
+    """
+    Register a decorated widget view under a path, relative to the
+    prefix the widgets are served at.
+    """
+    widget = getattr(view, 'widget', None)
+    if widget is None:
+        raise ValueError("%r is not decorated with a widget decorator"
+                % view)
+    with _widgets_lock:
+        _widgets[_normalize(path)] = widget
+
+
+def unregister_widget(path):
+    """Remove the widget registered under a path."""
+    with _widgets_lock:
+        _widgets.pop(_normalize(path), None)
+
+
+def get_widget(path):
+    """Return the widget registered under a path, or `None`."""
+    with _widgets_lock:
+        return _widgets.get(_normalize(path))
+
+
+def registered_widgets():
+    """Return all registered widgets, keyed by path."""
+    with _widgets_lock:
+        return dict(_widgets)
+
+
+def _normalize(path):
+    return path.strip('/')
@@ -0,0 +1,130 @@
+"""
+Routing of the database queries of widget views.
+
+While a widget view runs, the reads it makes through the ORM are
+routed to the database of the widget, usually a read replica, so that
+dashboards do not add load to the primary database.  A statement
+timeout can be applied to the connection for the duration of the view.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connections, router, DEFAULT_DB_ALIAS
+
+
+logger = logging.getLogger('django_geckoboard')
+
+# Number of SQLite virtual machine instructions between deadline checks.
+SQLITE_PROGRESS_STEPS = 1000
+
+_local = threading.local()
+_install_lock = threading.Lock()
+
+
+class WidgetRouter(object):
+    """
+    A database router sending reads to the database of the widget being
+    computed in the current thread.  Writes, and reads outside widget
+    views, are left to the other routers, as the widget database is
+    usually a read-only replica.
+
+    The router is installed in front of the ``DATABASE_ROUTERS`` when
+    first needed; list it explicitly to control its position.
+    """
+
+    def db_for_read(self, model, **hints):
+        return getattr(_local, 'alias', None)
+
+    def db_for_write(self, model, **hints):
+        return None
+
+
+def install_router():
+    """Install `WidgetRouter` unless it is already installed."""
+    with _install_lock:
+        if not [r for r in router.routers if isinstance(r, WidgetRouter)]:
+            router.routers.insert(0, WidgetRouter())
+
+
+def get_widget_database():
+    """Return the database alias of the current widget view, or `None`."""
+    return getattr(_local, 'alias', None)
+
+
+def get_statement_timeout():
+    """Return the statement timeout of the current widget view, or `None`."""
+    return getattr(_local, 'statement_timeout', None)
+
+
+@contextmanager
+def widget_database(alias=None, statement_timeout=None):
+    """
+    Route ORM queries made in the current thread to the database `alias`
+    and, if `statement_timeout` is set, abort statements on that
+    database running longer than that many seconds.
+    """
+    if alias is not None:
+        install_router()
+    previous = getattr(_local, 'alias', None)
+    previous_timeout = getattr(_local, 'statement_timeout', None)
+    _local.alias = alias
+    _local.statement_timeout = statement_timeout
+    try:
+        if statement_timeout:
+            connection = connections[alias or DEFAULT_DB_ALIAS]
+            with _statement_timeout(connection, statement_timeout):
+                yield
+        else:
+            yield
+    finally:
+        _local.alias = previous
+        _local.statement_timeout = previous_timeout
+
+
+@contextmanager
+def _statement_timeout(connection, seconds):
+    vendor = getattr(connection, 'vendor', None)
+    if vendor == 'postgresql':
+        with _session_setting(connection,
+                'SET statement_timeout = %d' % (seconds * 1000),
+                'RESET statement_timeout'):
+            yield
+    elif vendor == 'mysql':
+        # Only applies to SELECT statements (MySQL 5.7.8 and newer).
+        with _session_setting(connection,
+                'SET SESSION max_execution_time = %d' % (seconds * 1000),
+                'SET SESSION max_execution_time = DEFAULT'):
+            yield
+    elif vendor == 'sqlite':
+        connection.cursor()  # connect
+        deadline = time.time() + seconds
+        connection.connection.set_progress_handler(
+                lambda: time.time() > deadline, SQLITE_PROGRESS_STEPS)
+        try:
+            yield
+        finally:
+            if connection.connection is not None:
+                connection.connection.set_progress_handler(None,
+                        SQLITE_PROGRESS_STEPS)
+    else:
+        logger.warning("Statement timeouts are not supported on %s",
+                vendor)
+        yield
+
+
+@contextmanager
+def _session_setting(connection, set_sql, reset_sql):
+    connection.cursor().execute(set_sql)
+    try:
+        yield
+    finally:
+        if connection.connection is not None:
+            try:
+                connection.cursor().execute(reset_sql)
+            except Exception:
+                # An aborted transaction undoes the setting itself.
+                logger.warning("Cannot reset the statement timeout",
+                        exc_info=True)
@@ -0,0 +1,240 @@
+"""
+Time series built by the database or from the snapshot history of
+widgets, for line chart widgets.
+"""
+
+import datetime
+import decimal
+import time
+
+import django
+from django.db import connections
+from django.db.models import Count
+
+try:
+    from django.db.models.functions import Trunc
+except ImportError:
+    Trunc = None  # Django < 1.10
+
+try:
+    from django.utils import timezone
+    from django.utils.timezone import now as _now
+except ImportError:
+    timezone = None  # Django < 1.4
+    _now = datetime.datetime.now
+try:
+    _UTC = datetime.timezone.utc
+except AttributeError:
+    _UTC = getattr(timezone, 'utc', None)  # Python 2
+
+from django_geckoboard.decorators import GeckoboardException
+
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+
+LABEL_FORMATS = {
+    'hour': '%H:%M',
+    'day': '%d %b',
+    'week': '%d %b',
+    'month': '%b %Y',
+}
+
+
+def time_series(queryset, field, granularity='day', window=30,
+        aggregate=None, end=None, labels=3, color=None):
+    """
+    Return a `(values, x_axis, y_axis, [color])` tuple for the
+    ``line_chart`` decorator, aggregating `queryset` per time bucket.
+
+    `field` is the name of the datetime field the rows are bucketed on,
+    `granularity` is one of 'hour', 'day', 'week' or 'month' and
+    `window` is the number of buckets, ending with the bucket containing
+    `end` (default now).  `aggregate` is the aggregate computed for each
+    bucket and defaults to ``Count('pk')``.  Buckets without rows have a
+    value of 0.  The X-axis gets `labels` evenly spaced bucket labels
+    and the Y-axis the minimum and maximum values.
+
+    The bucketing and aggregation are done by the database, using a
+    single query.  With time zone support, buckets start at midnight (or
+    the hour) in the current time zone.
+    """
+    if granularity not in GRANULARITIES:
+        raise GeckoboardException("Unsupported granularity: %s"
+                % granularity)
+    if aggregate is None:
+        aggregate = Count('pk')
+    if end is None:
+        end = _now()
+    last = _bucket_start(end, granularity)
+    first = _next_bucket(last, granularity, 1 - window)
+    queryset = queryset.filter(**{
+        '%s__gte' % field: first,
+        '%s__lt' % field: _next_bucket(last, granularity, 1),
+    })
+    totals = {}
+    for bucket, value in _aggregate_buckets(queryset, field, granularity,
+            aggregate):
+        bucket = _to_datetime(bucket)
+        if _is_aware(end) and not _is_aware(bucket):
+            bucket = _make_local(bucket)
+        bucket = _bucket_start(bucket, granularity)
+        totals[bucket] = totals.get(bucket, 0) + _to_number(value)
+
+    buckets = []
+    values = []
+    bucket = first
+    for i in range(window):
+        buckets.append(bucket)
+        values.append(totals.get(bucket, 0))
+        bucket = _next_bucket(bucket, granularity, 1)
+
+    label_format = LABEL_FORMATS[granularity]
+    x_axis = [buckets[i].strftime(label_format)
+            for i in _label_positions(window, labels)]
+    y_axis = [_format_number(min(values)), _format_number(max(values))]
+    if color is None:
+        return (values, x_axis, y_axis)
+    return (values, x_axis, y_axis, color)
+
+
+def snapshot_series(widget, window=24 * 60 * 60, points=24, end=None,
+        labels=3, color=None):
+    """
+    Return a `(values, x_axis, y_axis, [color])` tuple for the
+    ``line_chart`` decorator from the snapshot history of a widget (see
+    `django_geckoboard.snapshots`), given as its decorated view or name.
+
+    The `window` seconds ending at `end` (a Unix time, default now) are
+    divided into `points` buckets, whose value is the average of the
+    snapshot values in the bucket.  Buckets without snapshots repeat the
+    previous value, or 0 before the first snapshot.
+    """
+    from django_geckoboard.snapshots import snapshot_history
+    if end is None:
+        end = time.time()
+    start = end - window
+    step = window / float(points)
+    sums = [0.0] * points
+    counts = [0] * points
+    for timestamp, value in snapshot_history(widget, start, end):
+        bucket = min(int((timestamp - start) / step), points - 1)
+        sums[bucket] += value
+        counts[bucket] += 1
+    values = []
+    value = 0
+    for total, count in zip(sums, counts):
+        if count:
+            value = total / count
+        values.append(value)
+
+    label_format = window <= 2 * 24 * 60 * 60 and '%H:%M' or '%d %b'
+    x_axis = [time.strftime(label_format, time.localtime(start + i * step))
+            for i in _label_positions(points, labels)]
+    y_axis = [_format_number(min(values)), _format_number(max(values))]
+    if color is None:
+        return (values, x_axis, y_axis)
+    return (values, x_axis, y_axis, color)
+
+
+def _aggregate_buckets(queryset, field, granularity, aggregate):
+    """Return an iterable of `(bucket, value)` pairs from the database."""
+    if Trunc is not None:
+        kind = granularity
+        if granularity == 'week' and django.VERSION < (2, 1):
+            kind = 'day'  # folded together into weeks by the caller
+        rows = queryset.annotate(bucket=Trunc(field, kind)) \
+                .values('bucket').annotate(value=aggregate).order_by()
+        return ((row['bucket'], row['value']) for row in rows)
+    # Older Django versions can only truncate to days and months; weeks
+    # are folded together from days by the caller.
+    if granularity == 'hour':
+        raise GeckoboardException("Hourly series need Django 1.10 or newer")
+    kind = granularity == 'week' and 'day' or granularity
+    connection = connections[queryset.db]
+    qn = connection.ops.quote_name
+    model_field = queryset.model._meta.get_field(field)
+    column = '%s.%s' % (qn(queryset.model._meta.db_table),
+            qn(model_field.column))
+    rows = queryset.extra(select={
+        'bucket': connection.ops.date_trunc_sql(kind, column),
+    }).values('bucket').annotate(value=aggregate).order_by()
+    return ((row['bucket'], row['value']) for row in rows)
+
+
+def _bucket_start(dt, granularity):
+    """Return the start of the bucket of a datetime."""
+    if not _is_aware(dt):
+        return _truncate(dt, granularity)
+    local = timezone.localtime(dt)
+    return _make_local(_truncate(local.replace(tzinfo=None), granularity))
+
+def _next_bucket(dt, granularity, count):
+    """Return the start of the bucket `count` buckets after `dt`."""
+    if not _is_aware(dt):
+        return _shift(dt, granularity, count)
+    if granularity == 'hour':
+        # Aware arithmetic uses wall time, so step in UTC.
+        return timezone.localtime(dt.astimezone(_UTC) +
+                datetime.timedelta(hours=count))
+    # Days, weeks and months are shifted in local time, as they do not
+    # have a fixed length across DST changes.
+    local = timezone.localtime(dt).replace(tzinfo=None)
+    return _make_local(_shift(local, granularity, count))
+
+def _is_aware(dt):
+    return timezone is not None and dt.tzinfo is not None and \
+            dt.tzinfo.utcoffset(dt) is not None
+
+def _make_local(dt):
+    current = timezone.get_current_timezone()
+    try:
+        return timezone.make_aware(dt, current)
+    except Exception:
+        # pytz refuses times made ambiguous or skipped by a DST change.
+        return current.localize(dt, is_dst=False)
+
+def _truncate(dt, granularity):
+    if granularity == 'hour':
+        return dt.replace(minute=0, second=0, microsecond=0)
+    dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'week':
+        return dt - datetime.timedelta(days=dt.weekday())
+    if granularity == 'month':
+        return dt.replace(day=1)
+    return dt
+
+def _shift(dt, granularity, count):
+    if granularity == 'hour':
+        return dt + datetime.timedelta(hours=count)
+    if granularity == 'day':
+        return dt + datetime.timedelta(days=count)
+    if granularity == 'week':
+        return dt + datetime.timedelta(weeks=count)
+    month = dt.year * 12 + dt.month - 1 + count
+    return dt.replace(year=month // 12, month=month % 12 + 1)
+
+def _to_datetime(value):
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    return datetime.datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S')
+
+def _to_number(value):
+    if value is None:
+        return 0
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return '%s' % value
+
+def _label_positions(window, labels):
+    if labels <= 1 or window == 1:
+        return [0]
+    labels = min(labels, window)
+    return [int(round(i * (window - 1) / float(labels - 1)))
+            for i in range(labels)]
@@ -0,0 +1,272 @@
+"""
+Shared-memory cache of rendered widget payloads.
+
+The cache is a memory-mapped file shared by all worker processes on a
+host, so that a payload rendered by one worker is served by all others
+without recomputing it or asking an external cache.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows; only threads are synchronized
+
+from django.conf import settings
+
+
+logger = logging.getLogger('django_geckoboard')
+
+MAGIC = b'GECKOSHM'
+LAYOUT_VERSION = 1
+
+# File header: magic, layout version, number of slots, slot size.
+_FILE_HEADER = struct.Struct('=8sIII')
+_FILE_HEADER_SIZE = 64
+
+# Slot header: sequence number, key hash, expiry time, access time,
+# key length, value length.  The sequence number is odd while the slot
+# is being written.
+_SLOT_HEADER = struct.Struct('=QQddII')
+_SEQUENCE = struct.Struct('=Q')
+_ACCESSED = struct.Struct('=d')
+_ACCESSED_OFFSET = 24
+
+# Number of slots a key can be stored in.
+WAYS = 8
+
+# Number of times a read is retried when it overlaps a write.
+READ_RETRIES = 10
+
+
+class SharedMemoryCache(object):
+    """
+    A cache of byte strings in fixed-size slots of a memory-mapped file.
+
+    A key hashes to a set of `WAYS` adjacent slots.  When all slots of
+    the set are in use, the least recently used entry is evicted.
+    Values larger than a slot are not cached.
+
+    Reads do not take locks.  Every slot carries a sequence number that
+    writers make odd while they update the slot and increment again when
+    done; a reader retries if the sequence number was odd or changed
+    while it copied the slot.  Writers are serialized with a thread lock
+    and an exclusive `flock` on the file.
+    """
+
+    def __init__(self, path, slots=256, slot_size=65536):
+        if slots < WAYS:
+            raise ValueError("A shared cache needs at least %d slots" % WAYS)
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.capacity = slot_size - _SLOT_HEADER.size
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = _FILE_HEADER_SIZE + slots * slot_size
+        self._write_locked(self._initialize, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    def get(self, key, default=None):
+        """Return the value stored for `key`, or `default`."""
+        key = _encode_key(key)
+        key_hash = _hash(key)
+        now = time.time()
+        for offset in self._set_offsets(key_hash):
+            for attempt in range(READ_RETRIES):
+                entry = self._read_slot(offset)
+                if entry is not None:
+                    break
+            else:
+                continue  # slot is being rewritten continuously
+            sequence, slot_hash, expires, key_data, value = entry
+            if slot_hash == key_hash and key_data == key and sequence:
+                if expires < now:
+                    return default
+                _ACCESSED.pack_into(self._map, offset + _ACCESSED_OFFSET,
+                        now)
+                return value
+        return default
+
+    def set(self, key, value, timeout):
+        """
+        Store `value` (a byte string) for `timeout` seconds.  Return
+        whether the value fit in a slot.
+        """
+        key = _encode_key(key)
+        if len(key) + len(value) > self.capacity:
+            return False
+        self._write_locked(self._set, key, value, timeout)
+        return True
+
+    def delete(self, key):
+        key = _encode_key(key)
+        self._write_locked(self._delete, key)
+
+    def clear(self):
+        """Remove all entries."""
+        self._write_locked(self._clear)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def _read_slot(self, offset):
+        """
+        Return `(sequence, key_hash, expires, key, value)` of a slot, or
+        `None` if the slot was written to while reading it.
+        """
+        sequence = _SEQUENCE.unpack_from(self._map, offset)[0]
+        if sequence & 1:
+            return None
+        header = _SLOT_HEADER.unpack_from(self._map, offset)
+        _, key_hash, expires, _, key_length, value_length = header
+        start = offset + _SLOT_HEADER.size
+        if key_length + value_length > self.capacity:
+            return None
+        key = self._map[start:start + key_length]
+        value = self._map[start + key_length:
+                start + key_length + value_length]
+        if _SEQUENCE.unpack_from(self._map, offset)[0] != sequence:
+            return None
+        return sequence, key_hash, expires, key, value
+
+    def _set(self, key, value, timeout):
+        key_hash = _hash(key)
+        now = time.time()
+        target = None
+        oldest = None
+        for offset in self._set_offsets(key_hash):
+            sequence, slot_hash, expires, accessed, key_length, _ = \
+                    _SLOT_HEADER.unpack_from(self._map, offset)
+            if sequence and slot_hash == key_hash:
+                start = offset + _SLOT_HEADER.size
+                if self._map[start:start + key_length] == key:
+                    target = offset
+                    break
+            if not sequence or expires < now:
+                accessed = -1  # free slots are reused first
+            if oldest is None or accessed < oldest:
+                target, oldest = offset, accessed
+        # A writer that crashed may have left the sequence number odd.
+        writing = _SEQUENCE.unpack_from(self._map, target)[0] | 1
+        _SEQUENCE.pack_into(self._map, target, writing)
+        start = target + _SLOT_HEADER.size
+        self._map[start:start + len(key)] = key
+        self._map[start + len(key):start + len(key) + len(value)] = value
+        _SLOT_HEADER.pack_into(self._map, target, writing, key_hash,
+                now + timeout, now, len(key), len(value))
+        _SEQUENCE.pack_into(self._map, target, writing + 1)
+
+    def _delete(self, key):
+        key_hash = _hash(key)
+        for offset in self._set_offsets(key_hash):
+            entry = self._read_slot(offset)
+            if entry is not None and entry[1] == key_hash and \
+                    entry[3] == key:
+                self._expire(offset)
+
+    def _clear(self):
+        for slot in range(self.slots):
+            self._expire(_FILE_HEADER_SIZE + slot * self.slot_size)
+
+    def _expire(self, offset):
+        sequence = _SEQUENCE.unpack_from(self._map, offset)[0]
+        if not sequence:
+            return
+        writing = sequence | 1
+        _SEQUENCE.pack_into(self._map, offset, writing)
+        _SLOT_HEADER.pack_into(self._map, offset, writing, 0, 0, 0, 0, 0)
+        _SEQUENCE.pack_into(self._map, offset, writing + 1)
+
+    def _set_offsets(self, key_hash):
+        first = key_hash % self.slots
+        return [_FILE_HEADER_SIZE + ((first + i) % self.slots) * self.slot_size
+                for i in range(WAYS)]
+
+    def _initialize(self, size):
+        header = _FILE_HEADER.pack(MAGIC, LAYOUT_VERSION, self.slots,
+                self.slot_size)
+        if os.fstat(self._fd).st_size == 0:
+            os.ftruncate(self._fd, size)
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            os.write(self._fd, header)
+            return
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        existing = os.read(self._fd, _FILE_HEADER.size)
+        if existing != header or os.fstat(self._fd).st_size != size:
+            raise ValueError("%s is not a shared cache with %d "
+                    "slots of %d bytes" % (self.path, self.slots,
+                    self.slot_size))
+
+    def _write_locked(self, func, *args):
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                return func(*args)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+def _encode_key(key):
+    if not isinstance(key, bytes):
+        key = key.encode('utf-8')
+    return key
+
+def _hash(key):
+    # Zero marks an empty slot.
+    return struct.unpack('=Q', hashlib.md5(key).digest()[:8])[0] or 1
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_shared_cache():
+    """
+    Return the shared cache of this host, configured by the
+    ``GECKOBOARD_SHARED_CACHE_PATH``, ``GECKOBOARD_SHARED_CACHE_SLOTS``
+    and ``GECKOBOARD_SHARED_CACHE_SLOT_SIZE`` settings, or `None` if the
+    cache file cannot be used.
+
+    The default path is specific to the Django project and the user, so
+    that sites sharing a host do not serve each other's payloads.
+    """
+    path = getattr(settings, 'GECKOBOARD_SHARED_CACHE_PATH', None)
+    slots = getattr(settings, 'GECKOBOARD_SHARED_CACHE_SLOTS', 256)
+    slot_size = getattr(settings, 'GECKOBOARD_SHARED_CACHE_SLOT_SIZE', 65536)
+    if path is None:
+        directory = os.path.isdir('/dev/shm') and '/dev/shm' \
+                or tempfile.gettempdir()
+        path = os.path.join(directory, 'django_geckoboard-%s-%d-%d'
+                % (_namespace(), slots, slot_size))
+    with _caches_lock:
+        if path in _caches:
+            return _caches[path]
+        try:
+            cache = SharedMemoryCache(path, slots, slot_size)
+        except (EnvironmentError, ValueError):
+            # Disabled for the lifetime of the process, rather than
+            # failing every cached widget request.
+            logger.warning("Cannot open the shared cache %s; payloads "
+                    "are not cached", path, exc_info=True)
+            cache = None
+        _caches[path] = cache
+        return cache
+
+
+def _namespace():
+    project = '%s:%s' % (getattr(settings, 'SETTINGS_MODULE', ''),
+            getattr(settings, 'SECRET_KEY', ''))
+    user = hasattr(os, 'getuid') and os.getuid() or 0
+    return '%s-%d' % (hashlib.md5(project.encode('utf-8')).hexdigest()[:12],
+            user)
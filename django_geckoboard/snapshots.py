@@ -0,0 +1,190 @@
+"""
+Snapshot history of widget data.
+
+Widgets with the ``snapshot_interval`` option store their converted data
+in the database at most once per interval.  The history provides the
+previous values of number widgets and the data of line charts without
+querying the underlying data again.  Snapshots are stored in the
+``GECKOBOARD_SNAPSHOT_DATABASE`` database (default 'default'), also
+while the view queries run on a replica.
+
+Snapshots of a view called with arguments are kept apart for each set
+of arguments, under the key returned by `snapshot_key`.  The history
+functions accept such a key in place of a widget name.
+"""
+
+import hashlib
+import json
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from django_geckoboard.models import WidgetSnapshot
+from django_geckoboard.payloads import arguments_digest
+
+
+# Snapshots up to the age (in seconds) of a tier, and older than the
+# previous tier, are kept at one snapshot per resolution seconds, or all
+# snapshots if the resolution is 0.  Older snapshots are deleted.
+DEFAULT_RETENTION = (
+    (24 * 60 * 60, 0),
+    (7 * 24 * 60 * 60, 60 * 60),
+    (365 * 24 * 60 * 60, 24 * 60 * 60),
+)
+
+try:
+    _atomic = transaction.atomic
+except AttributeError:
+    _atomic = transaction.commit_on_success  # Django < 1.6
+
+_last_snapshots = {}
+_last_snapshots_lock = threading.Lock()
+
+
+def snapshot_key(name, args=(), kwargs=None):
+    """
+    Return the key of the snapshots of a widget view called with the
+    arguments `args` and `kwargs`, which is its name without arguments.
+    """
+    if not args and not kwargs:
+        return name
+    return '%s:%s' % (name, arguments_digest(args, kwargs))
+
+
+def record_snapshot(name, data, value, interval):
+    """
+    Store a snapshot of the converted data of a widget, unless one was
+    stored less than `interval` seconds ago.  Return whether a snapshot
+    was stored.
+    """
+    now = time.time()
+    with _last_snapshots_lock:
+        last = _last_snapshots.get(name)
+        if last is not None and now - last < interval:
+            return False
+        _last_snapshots[name] = now
+    # Another process may have stored a snapshot recently.  The cache
+    # lock lets one process write per interval; the query covers caches
+    # that are not shared between processes.
+    lock_key = 'django_geckoboard:snapshot:%s' % \
+            hashlib.md5(name.encode('utf-8')).hexdigest()
+    if not cache.add(lock_key, now, int(math.ceil(interval))):
+        return False
+    if _snapshots().filter(widget=name,
+            timestamp__gt=now - interval).exists():
+        return False
+    _snapshots().create(widget=name, timestamp=now,
+            value=_to_float(value), data=json.dumps(data, default=str))
+    return True
+
+
+def previous_value(widget, age, now=None):
+    """
+    Return the value of the last snapshot of a widget (a decorated view,
+    name or `snapshot_key`) taken at least `age` seconds ago, or `None`.
+    """
+    if now is None:
+        now = time.time()
+    values = _snapshots().filter(widget=_widget_name(widget),
+            timestamp__lte=now - age, value__isnull=False) \
+            .order_by('-timestamp').values_list('value', flat=True)[:1]
+    if values:
+        return values[0]
+    return None
+
+
+def snapshot_history(widget, since, until=None):
+    """
+    Return a list of `(timestamp, value)` tuples of the snapshots of a
+    widget (a decorated view, name or `snapshot_key`) taken between the
+    `since` and `until` Unix times.
+    """
+    snapshots = _snapshots().filter(widget=_widget_name(widget),
+            timestamp__gte=since, value__isnull=False)
+    if until is not None:
+        snapshots = snapshots.filter(timestamp__lte=until)
+    return list(snapshots.order_by('timestamp')
+            .values_list('timestamp', 'value'))
+
+
+def prune_snapshots(now=None, retention=None):
+    """
+    Downsample and delete old snapshots according to `retention`, a list
+    of `(age, resolution)` tiers with increasing ages, which defaults to
+    the ``GECKOBOARD_SNAPSHOT_RETENTION`` setting.  Return the number of
+    snapshots removed.
+    """
+    if now is None:
+        now = time.time()
+    if retention is None:
+        retention = getattr(settings, 'GECKOBOARD_SNAPSHOT_RETENTION',
+                DEFAULT_RETENTION)
+    removed = 0
+    with _atomic(using=_database()):
+        previous_age = 0
+        for age, resolution in retention:
+            if resolution:
+                removed += _downsample(now - previous_age, resolution)
+            previous_age = age
+        expired = _snapshots().filter(
+                timestamp__lt=now - retention[-1][0])
+        removed += expired.count()
+        expired.delete()
+    return removed
+
+
+def _downsample(before, resolution):
+    """Merge the snapshots older than `before` into coarser ones."""
+    # Only whole buckets are merged, so that a bucket is merged once.
+    before -= before % resolution
+    snapshots = _snapshots().filter(timestamp__lt=before,
+            resolution__lt=resolution).order_by('widget', 'timestamp')
+    removed = 0
+    group = []
+    for snapshot in snapshots.iterator():
+        if group and (snapshot.widget != group[0].widget or
+                _bucket(snapshot, resolution) != _bucket(group[0],
+                    resolution)):
+            removed += _merge(group, resolution)
+            group = []
+        group.append(snapshot)
+    if group:
+        removed += _merge(group, resolution)
+    return removed
+
+def _merge(group, resolution):
+    values = [s.value for s in group if s.value is not None]
+    value = None
+    if values:
+        value = sum(values) / len(values)
+    _snapshots().create(widget=group[0].widget,
+            timestamp=_bucket(group[0], resolution), resolution=resolution,
+            value=value, data=group[-1].data)
+    _snapshots().filter(pk__in=[s.pk for s in group]).delete()
+    return len(group) - 1
+
+def _database():
+    return getattr(settings, 'GECKOBOARD_SNAPSHOT_DATABASE', 'default')
+
+def _snapshots():
+    return WidgetSnapshot.objects.using(_database())
+
+def _bucket(snapshot, resolution):
+    return snapshot.timestamp - snapshot.timestamp % resolution
+
+def _widget_name(widget):
+    """Return the name of a widget, given the decorated view or a name."""
+    bound = getattr(widget, 'widget', None)
+    if bound is not None:
+        return bound.name
+    return widget
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
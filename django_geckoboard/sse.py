@@ -0,0 +1,271 @@
+"""
+Server-Sent Events stream of widget payloads.
+
+Self-hosted wallboards can subscribe to the widgets registered with
+`django_geckoboard.registry` over a single Server-Sent Events
+connection instead of polling every widget.  Each subscribed widget is
+computed once per interval in the process, whatever the number of
+clients, and its payload is sent to the clients only when it changed.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    StreamingHttpResponse = None  # Django < 1.5
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.http import HttpResponseBadRequest, HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt
+
+from django_geckoboard.decorators import _is_api_key_correct
+from django_geckoboard.recording import format_request
+from django_geckoboard.registry import get_widget
+
+
+logger = logging.getLogger('django_geckoboard')
+
+DEFAULT_INTERVAL = 10
+DEFAULT_KEEPALIVE = 15
+
+# Milliseconds a client waits before reconnecting.
+RETRY = 5000
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+class Subscription(object):
+    """
+    The widgets a client subscribed to and the payloads not yet sent to
+    it.  Only the latest payload of a widget is kept, so a slow client
+    skips intermediate updates instead of queueing them.
+    """
+
+    def __init__(self, paths, format):
+        self.paths = paths
+        self.format = format
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def publish(self, path, content):
+        with self._lock:
+            self._pending.pop(path, None)
+            self._pending[path] = content
+            self._ready.set()
+
+    def updates(self, timeout=None):
+        """
+        Wait up to `timeout` seconds for updates and return a list of
+        `(path, content)` tuples, which is empty on timeout.
+        """
+        self._ready.wait(timeout)
+        with self._lock:
+            updates = list(self._pending.items())
+            self._pending.clear()
+            self._ready.clear()
+        return updates
+
+
+class _Channel(object):
+    """A widget in a format and its subscribers."""
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.subscribers = set()
+        self.content = None
+        self.due = 0
+
+
+class Broadcaster(object):
+    """
+    Computes the widgets subscribed to in a background thread and
+    publishes changed payloads to the subscriptions.
+
+    A widget is recomputed every `refresh_interval` seconds if it has
+    that option, and otherwise every `interval` seconds (default the
+    ``GECKOBOARD_SSE_INTERVAL`` setting or 10).  Widgets are computed
+    through their caches, deadlines and circuit breakers, like polls.
+    """
+
+    def __init__(self, interval=None):
+        if interval is None:
+            interval = getattr(settings, 'GECKOBOARD_SSE_INTERVAL',
+                    DEFAULT_INTERVAL)
+        self.interval = interval
+        self._channels = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def subscribe(self, paths, format='2'):
+        """
+        Subscribe to the widgets registered under `paths`.  The current
+        payloads of the widgets are published to the new subscription
+        right away, or as soon as they are computed.
+        """
+        widgets = []
+        for path in paths:
+            widget = get_widget(path)
+            if widget is None:
+                raise ValueError("No widget registered under %s" % path)
+            widgets.append((path, widget))
+        subscription = Subscription([path for path, w in widgets], format)
+        with self._lock:
+            for path, widget in widgets:
+                channel = self._channels.get((path, format))
+                if channel is None:
+                    channel = self._channels[(path, format)] = \
+                            _Channel(widget)
+                    self._wakeup.set()
+                channel.subscribers.add(subscription)
+                if channel.content is not None:
+                    subscription.publish(path, channel.content)
+            self._start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for path in subscription.paths:
+                key = (path, subscription.format)
+                channel = self._channels.get(key)
+                if channel is None:
+                    continue
+                channel.subscribers.discard(subscription)
+                if not channel.subscribers:
+                    del self._channels[key]
+
+    def poll_once(self, now=None):
+        """
+        Compute the widgets that are due and publish the changed
+        payloads.  Return the number of seconds until the next widget
+        is due.
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            due = [(key, channel) for key, channel in self._channels.items()
+                    if channel.due <= now]
+            for key, channel in due:
+                channel.due = now + (channel.widget.options.get(
+                        'refresh_interval') or self.interval)
+        for (path, format), channel in due:
+            widget = channel.widget
+            try:
+                response = widget._respond(format_request(format), (), {})
+            except Exception:
+                logger.exception("Computing widget %s for the event "
+                        "stream failed", widget.name)
+                continue
+            if response.status_code != 200 or \
+                    response.content == channel.content:
+                continue
+            content = response.content
+            with self._lock:
+                channel.content = content
+                subscribers = list(channel.subscribers)
+            for subscription in subscribers:
+                subscription.publish(path, content)
+        with self._lock:
+            if not self._channels:
+                return self.interval
+            return max(0, min(c.due for c in self._channels.values())
+                    - now)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                    name='geckoboard-events')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            # Cleared before polling, so that a subscription made while
+            # polling wakes the next wait.
+            self._wakeup.clear()
+            try:
+                delay = self.poll_once()
+            except Exception:
+                logger.exception("Polling widgets for the event stream "
+                        "failed")
+                delay = self.interval
+            finally:
+                for connection in connections.all():
+                    connection.close()
+            self._wakeup.wait(delay)
+
+
+def get_broadcaster():
+    """Return the broadcaster of this process."""
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            _broadcaster = Broadcaster()
+        return _broadcaster
+
+
+@csrf_exempt
+def widget_events(request):
+    """
+    Stream the payloads of the widgets listed in the ``widgets``
+    parameter (comma-separated registry paths) as Server-Sent Events.
+
+    Each event is named after the widget path and carries the payload
+    in the ``format`` of the request (default JSON).  A comment is sent
+    every ``GECKOBOARD_SSE_KEEPALIVE`` seconds (default 15) while no
+    payload changes.  Streaming needs Django 1.5 or newer.
+    """
+    if StreamingHttpResponse is None:
+        # A regular response would consume the endless stream.
+        raise ImproperlyConfigured("The widget event stream needs "
+                "Django 1.5 or newer")
+    if not _is_api_key_correct(request):
+        return HttpResponseForbidden("Geckoboard API key incorrect")
+    widgets = request.GET.get('widgets') or request.POST.get('widgets', '')
+    paths = [path for path in widgets.split(',') if path]
+    format = request.GET.get('format') or request.POST.get('format', '2')
+    if not paths or format not in ('1', '2'):
+        return HttpResponseBadRequest("Widgets and format required")
+    broadcaster = get_broadcaster()
+    try:
+        subscription = broadcaster.subscribe(paths, format)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    keepalive = getattr(settings, 'GECKOBOARD_SSE_KEEPALIVE',
+            DEFAULT_KEEPALIVE)
+    response = StreamingHttpResponse(
+            _stream(broadcaster, subscription, keepalive),
+            content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # disable nginx buffering
+    return response
+
+
+def _stream(broadcaster, subscription, keepalive):
+    try:
+        yield ('retry: %d\n\n' % RETRY).encode('ascii')
+        while True:
+            updates = subscription.updates(keepalive)
+            if not updates:
+                yield b': keepalive\n\n'
+            for path, content in updates:
+                yield format_event(path, content)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+def format_event(name, data):
+    """Return a Server-Sent Event with a name and (multi-line) data."""
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    lines = [b'event: ' + name.encode('utf-8')]
+    lines.extend(b'data: ' + line for line in data.splitlines() or [b''])
+    return b'\n'.join(lines) + b'\n\n'
@@ -0,0 +1,237 @@
+"""
+Incremental tails of log files, for text and RAG widgets.
+
+A `FileTail` remembers the byte offset it read a file up to, so every
+poll reads only the data appended since the previous one.  It keeps the
+most recent matching lines and counts the lines matching named patterns,
+and follows the file when it is rotated or truncated.
+"""
+
+import collections
+import errno
+import hashlib
+import os
+import re
+import threading
+
+
+# Bytes at the start of a file compared on every update, to notice a file
+# that was truncated and has grown past the previous offset again.
+HEAD_SIZE = 1024
+
+
+class FileTail(object):
+    """
+    Follows the lines appended to the file at `path`.
+
+    Lines are kept if they match `pattern` (a regular expression or a
+    compiled pattern; all lines by default), up to the `max_lines` most
+    recent ones.  `counters` is a dictionary of regular expressions
+    keyed by name; the lines matching each one are counted since the
+    tail was created.  The lines and counts are kept in the process, so
+    each process serving the widgets counts the lines it read itself.
+
+    The first read starts at the beginning of the file, or at most
+    `backlog` bytes before its end.  A `checkpoint` saved from the
+    ``checkpoint`` property of a previous tail resumes reading where
+    that tail stopped, if the file is unchanged up to that point.
+    When the file is replaced, e.g. by log rotation, the rest of the old
+    file is read before following the new one from its beginning.  When
+    the file shrinks or its first `HEAD_SIZE` bytes change, it is
+    assumed to have been truncated and is read again from the beginning.
+    A line is only processed once its newline has been written.
+
+    The tail is safe to use from several threads.
+    """
+
+    def __init__(self, path, pattern=None, max_lines=100, counters=None,
+            backlog=None, encoding='utf-8', chunk_size=64 * 1024,
+            checkpoint=None):
+        self.path = path
+        self.pattern = _compile(pattern)
+        self.counters = dict((name, _compile(counter))
+                for name, counter in (counters or {}).items())
+        self.backlog = backlog
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._file = None
+        self._identity = None
+        self._offset = 0
+        self._head = None
+        self._partial = b''
+        self._started = False
+        self._checkpoint = checkpoint
+        self._lines = collections.deque(maxlen=max_lines)
+        self._counts = dict((name, 0) for name in self.counters)
+        self._read_lines = 0
+        self._read_bytes = 0
+        self._rotations = 0
+        self._truncations = 0
+
+    def update(self):
+        """
+        Read the data appended since the last update and return the
+        number of new lines.
+        """
+        with self._lock:
+            return self._update()
+
+    def lines(self, limit=None):
+        """
+        Return the most recent matching lines, at most `limit`, newest
+        first.  The file is updated first.
+        """
+        with self._lock:
+            self._update()
+            lines = list(self._lines)
+        lines.reverse()
+        if limit is not None:
+            lines = lines[:limit]
+        return lines
+
+    def counts(self):
+        """
+        Return the number of lines matching each counter, keyed by
+        counter name.  The file is updated first.
+        """
+        with self._lock:
+            self._update()
+            return dict(self._counts)
+
+    @property
+    def checkpoint(self):
+        """
+        A tuple `(device, inode, offset, head)` of the position read up
+        to, where `head` is a digest of the start of the file.
+        """
+        with self._lock:
+            if self._identity is None:
+                return None
+            return self._identity + (self._offset, self._head)
+
+    def stats(self):
+        """Return a dictionary describing the tail for monitoring."""
+        with self._lock:
+            return {
+                'path': self.path,
+                'offset': self._offset,
+                'lines': self._read_lines,
+                'bytes': self._read_bytes,
+                'rotations': self._rotations,
+                'truncations': self._truncations,
+                'counts': dict(self._counts),
+            }
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _update(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            stat = None  # rotated away and not yet recreated
+        count = 0
+        if self._file is not None:
+            if stat is None or (stat.st_dev, stat.st_ino) != self._identity:
+                count += self._read()
+                count += self._flush_partial()
+                self._close()
+                self._rotations += 1
+            elif stat.st_size < self._offset or \
+                    self._head_digest() != self._head:
+                self._offset = 0
+                self._head = self._head_digest()
+                self._partial = b''
+                self._truncations += 1
+        if self._file is None:
+            if stat is None:
+                return count
+            try:
+                self._open()
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                return count
+        return count + self._read()
+
+    def _open(self):
+        # Unbuffered, so that reads after a seek never see stale data.
+        self._file = open(self.path, 'rb', 0)
+        stat = os.fstat(self._file.fileno())
+        self._identity = (stat.st_dev, stat.st_ino)
+        self._offset = 0
+        self._partial = b''
+        if not self._started:
+            self._started = True
+            if self._checkpoint is not None:
+                device, inode, offset, head = self._checkpoint
+                self._checkpoint = None
+                if (device, inode) == self._identity and \
+                        offset <= stat.st_size:
+                    self._offset = offset
+                    if self._head_digest() == head:
+                        self._head = head
+                        return
+                    self._offset = 0
+                # Otherwise the file was replaced or truncated since.
+            elif self.backlog is not None and stat.st_size > self.backlog:
+                # Skip to the first complete line of the backlog.
+                self._offset = stat.st_size - self.backlog - 1
+                self._file.seek(self._offset)
+                self._offset += len(self._file.readline())
+        self._head = self._head_digest()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _head_digest(self):
+        """Return a digest of the start of the file read so far."""
+        self._file.seek(0)
+        head = self._file.read(min(self._offset, HEAD_SIZE))
+        return hashlib.md5(head).hexdigest()
+
+    def _read(self):
+        count = 0
+        start = self._offset
+        self._file.seek(self._offset)
+        while True:
+            chunk = self._file.read(self.chunk_size)
+            if not chunk:
+                if start < HEAD_SIZE and self._offset > start:
+                    self._head = self._head_digest()
+                return count
+            self._offset += len(chunk)
+            self._read_bytes += len(chunk)
+            lines = (self._partial + chunk).split(b'\n')
+            self._partial = lines.pop()
+            for line in lines:
+                self._add(line)
+            count += len(lines)
+
+    def _flush_partial(self):
+        if not self._partial:
+            return 0
+        self._add(self._partial)
+        self._partial = b''
+        return 1
+
+    def _add(self, line):
+        line = line.rstrip(b'\r').decode(self.encoding, 'replace')
+        self._read_lines += 1
+        if self.pattern is None or self.pattern.search(line):
+            self._lines.append(line)
+        for name, counter in self.counters.items():
+            if counter.search(line):
+                self._counts[name] += 1
+
+
+def _compile(pattern):
+    if pattern is None or hasattr(pattern, 'search'):
+        return pattern
+    return re.compile(pattern)
@@ -3,3 +3,25 @@ Tests for django-geckoboard.
 """
 
 from django_geckoboard.tests.test_decorators import *
+from django_geckoboard.tests.test_profiling import *
+from django_geckoboard.tests.test_deadlines import *
+from django_geckoboard.tests.test_circuitbreaker import *
+from django_geckoboard.tests.test_datasets import *
+from django_geckoboard.tests.test_series import *
+from django_geckoboard.tests.test_shm import *
+from django_geckoboard.tests.test_bulkheads import *
+from django_geckoboard.tests.test_recording import *
+from django_geckoboard.tests.test_wsgi import *
+from django_geckoboard.tests.test_refresh import *
+from django_geckoboard.tests.test_coordination import *
+from django_geckoboard.tests.test_routing import *
+from django_geckoboard.tests.test_querycount import *
+from django_geckoboard.tests.test_snapshots import *
+from django_geckoboard.tests.test_approx import *
+from django_geckoboard.tests.test_hyperloglog import *
+from django_geckoboard.tests.test_tdigest import *
+from django_geckoboard.tests.test_parallel import *
+from django_geckoboard.tests.test_providers import *
+from django_geckoboard.tests.test_sse import *
+from django_geckoboard.tests.test_memory import *
+from django_geckoboard.tests.test_tail import *
@@ -0,0 +1,13 @@
+"""
+Models used by the django-geckoboard tests.
+"""
+
+from django.db import models
+
+
+class Order(models.Model):
+    customer = models.CharField(max_length=50)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created = models.DateTimeField()
+    updated = models.DateTimeField()
+    note = models.TextField(null=True, blank=True)
@@ -2,13 +2,34 @@
 django-geckoboard testing settings.
 """
 
+import os
+import tempfile
+
+
+# The lease tests share a database between processes, so it is a file.
+LEASES_TEST_DATABASE = os.path.join(tempfile.gettempdir(),
+        'django_geckoboard_leases_%d.sqlite3' % os.getpid())
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': ':memory:',
-    }
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        # Tests use an in-memory database; the name only distinguishes
+        # the alias from the default database.
+        'NAME': 'replica',
+    },
+    'leases': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': LEASES_TEST_DATABASE,
+        'TEST_NAME': LEASES_TEST_DATABASE,
+        'TEST': {'NAME': LEASES_TEST_DATABASE},
+    },
 }
 
 INSTALLED_APPS = [
     'django_geckoboard',
+    'django_geckoboard.tests',
 ]
@@ -0,0 +1,98 @@
+"""
+Tests for the approximate row counts.
+"""
+
+import json
+import random
+
+from django.db import connection
+from django.http import HttpRequest
+
+from django_geckoboard.approx import approximate_count, round_significant, \
+        table_estimate
+from django_geckoboard.decorators import number_widget
+from django_geckoboard.tests.models import Order
+from django_geckoboard.tests.utils import TransactionTestCase
+
+
+class ApproximateCountTestCase(TransactionTestCase):
+    """
+    Tests for the ``approximate_count`` function.
+
+    ANALYZE commits the transaction, so the tests do not run in one.
+    """
+
+    def setUp(self):
+        super(ApproximateCountTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        random.seed(1)
+        cursor = connection.cursor()
+        cursor.executemany("INSERT INTO %s (customer, amount, created, "
+                "updated) VALUES (%%s, 1, '2011-01-01', '2011-01-01')"
+                % Order._meta.db_table,
+                [(i % 4 and 'b' or 'a',) for i in range(4000)])
+
+    def tearDown(self):
+        cursor = connection.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master "
+                "WHERE name = 'sqlite_stat1'")
+        if cursor.fetchone() is not None:
+            cursor.execute("DELETE FROM sqlite_stat1")
+        super(ApproximateCountTestCase, self).tearDown()
+
+    def _analyze(self):
+        connection.cursor().execute("ANALYZE")
+
+    def test_exact_below_threshold(self):
+        self._analyze()
+        count = approximate_count(Order.objects.all())
+        self.assertEqual((4000, 0, 'exact'), count)
+        self.assertTrue(count.exact)
+
+    def test_statistics(self):
+        self._analyze()
+        self.assertEqual(4000, table_estimate(Order))
+        self.assertEqual((4000, None, 'statistics'),
+                approximate_count(Order.objects.all(), threshold=1000))
+
+    def test_no_statistics(self):
+        self.assertEqual(None, table_estimate(Order))
+
+    def test_sample(self):
+        self._analyze()
+        count = approximate_count(Order.objects.filter(customer='a'),
+                threshold=1000, sample_size=400)
+        self.assertEqual('sample', count.method)
+        self.assertTrue(count.error > 0)
+        self.assertTrue(abs(count.value - 1000) <= count.error,
+                "%s differs from 1000 by more than its error" % (count,))
+
+    def test_sample_without_statistics(self):
+        count = approximate_count(Order.objects.filter(customer='b'),
+                threshold=1000, sample_size=400)
+        self.assertEqual('sample', count.method)
+        self.assertTrue(abs(count.value - 3000) <= count.error,
+                "%s differs from 3000 by more than its error" % (count,))
+
+    def test_sliced_queryset_is_exact(self):
+        self._analyze()
+        self.assertEqual((10, 0, 'exact'), approximate_count(
+                Order.objects.all()[:10], threshold=1000))
+
+    def test_round_significant(self):
+        self.assertEqual(1200, round_significant(1234))
+        self.assertEqual(1300, round_significant(1250.1))
+        self.assertEqual(123000, round_significant(123456, 3))
+        self.assertEqual(0.012, round_significant(0.01234))
+        self.assertEqual(0, round_significant(0))
+
+    def test_number_widget_option(self):
+        self._analyze()
+        @number_widget(approximate_count={'threshold': 1000, 'digits': 1})
+        def widget(request):
+            return (Order.objects.all(), 3500)
+        request = HttpRequest()
+        request.POST['format'] = '2'
+        content = widget(request).content
+        self.assertEqual({'item': [{'value': 4000}, {'value': 3500}]},
+                json.loads(content.decode('utf-8')))
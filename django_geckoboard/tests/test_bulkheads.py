@@ -0,0 +1,95 @@
+"""
+Tests for the per-widget concurrency limits.
+"""
+
+import threading
+
+from django.core.cache import cache
+from django.http import HttpRequest
+
+from django_geckoboard.bulkheads import Bulkhead, BulkheadFull, \
+        bulkhead_stats
+from django_geckoboard.decorators import number_widget, STALE_HEADER, \
+        REJECTED_HEADER
+from django_geckoboard.tests.utils import TestCase
+
+
+class BulkheadTestCase(TestCase):
+    """
+    Tests for the ``Bulkhead`` class.
+    """
+
+    def test_rejects_when_queue_full(self):
+        bulkhead = Bulkhead('test', 1)
+        bulkhead.acquire()
+        self.assertRaises(BulkheadFull, bulkhead.acquire)
+        bulkhead.release()
+        bulkhead.acquire()
+        stats = bulkhead.stats()
+        self.assertEqual(1, stats['active'])
+        self.assertEqual(1, stats['rejected'])
+        self.assertEqual(1, stats['completed'])
+
+    def test_queue_timeout(self):
+        bulkhead = Bulkhead('test', 1, max_queue=1, timeout=0.01)
+        bulkhead.acquire()
+        self.assertRaises(BulkheadFull, bulkhead.acquire)
+        self.assertEqual(1, bulkhead.stats()['timed_out'])
+        self.assertEqual(1, bulkhead.stats()['max_queue_depth'])
+
+    def test_queued_call_runs_when_slot_frees(self):
+        bulkhead = Bulkhead('test', 1, max_queue=1, timeout=5)
+        bulkhead.acquire()
+        threading.Timer(0.05, bulkhead.release).start()
+        self.assertEqual(1, bulkhead.call(lambda: 1))
+        self.assertEqual(0, bulkhead.stats()['active'])
+
+
+class BulkheadDecoratorTestCase(TestCase):
+    """
+    Tests for the ``max_concurrency`` decorator option.
+    """
+
+    def setUp(self):
+        super(BulkheadDecoratorTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        cache.clear()
+        self.request = HttpRequest()
+        self.request.POST['format'] = '2'
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def view(self, request):
+        self.started.set()
+        self.release.wait(5)
+        return 10
+
+    def _run_blocked_call(self, widget):
+        self.started.clear()
+        self.release.clear()
+        thread = threading.Thread(target=widget, args=(self.request,))
+        thread.start()
+        self.started.wait(5)
+        return thread
+
+    def test_rejected_without_payload(self):
+        widget = number_widget(max_concurrency=1)(self.view)
+        thread = self._run_blocked_call(widget)
+        resp = widget(self.request)
+        self.release.set()
+        thread.join()
+        self.assertEqual(503, resp.status_code)
+        self.assertEqual('bulkhead', resp[REJECTED_HEADER])
+        stats = bulkhead_stats()[widget.widget.name]
+        self.assertEqual(1, stats['rejected'])
+
+    def test_rejected_with_payload(self):
+        widget = number_widget(max_concurrency=1)(self.view)
+        widget(self.request)
+        thread = self._run_blocked_call(widget)
+        resp = widget(self.request)
+        self.release.set()
+        thread.join()
+        self.assertEqual('{"item": [{"value": 10}]}', resp.content)
+        self.assertTrue(resp.has_header(STALE_HEADER))
@@ -0,0 +1,116 @@
+"""
+Tests for the widget circuit breakers.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.http import HttpRequest
+
+from django_geckoboard.circuitbreaker import CircuitBreaker, CLOSED, OPEN, \
+        HALF_OPEN, get_breaker, breaker_stats
+from django_geckoboard.decorators import number_widget, STALE_HEADER, \
+        CIRCUIT_HEADER
+from django_geckoboard.tests.utils import TestCase
+
+
+class CircuitBreakerTestCase(TestCase):
+    """
+    Tests for the ``CircuitBreaker`` class.
+    """
+
+    def setUp(self):
+        super(CircuitBreakerTestCase, self).setUp()
+        cache.clear()
+
+    def test_opens_after_failures(self):
+        breaker = CircuitBreaker('test', failures=2)
+        breaker.record_failure()
+        self.assertEqual(CLOSED, breaker.state)
+        breaker.record_failure()
+        self.assertEqual(OPEN, breaker.state)
+        self.assertFalse(breaker.allow_request())
+
+    def test_failures_outside_window_ignored(self):
+        breaker = CircuitBreaker('test', failures=2, window=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        breaker.record_failure()
+        self.assertEqual(CLOSED, breaker.state)
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker('test', failures=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(CLOSED, breaker.state)
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker('test', failures=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(HALF_OPEN, breaker.state)
+        breaker.reset_timeout = 60
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(CLOSED, breaker.state)
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker('test', failures=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.reset_timeout = 60
+        breaker.record_failure()
+        self.assertEqual(OPEN, breaker.state)
+
+    def test_shared_state(self):
+        breaker1 = CircuitBreaker('test', failures=1, shared=True)
+        breaker2 = CircuitBreaker('test', failures=1, shared=True)
+        breaker1.record_failure()
+        self.assertEqual(OPEN, breaker2.state)
+
+
+class CircuitBreakerDecoratorTestCase(TestCase):
+    """
+    Tests for the ``circuit_breaker`` decorator option.
+    """
+
+    def setUp(self):
+        super(CircuitBreakerDecoratorTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        cache.clear()
+        self.request = HttpRequest()
+        self.request.POST['format'] = '2'
+        self.calls = 0
+        self.fail = False
+
+    def view(self, request):
+        self.calls += 1
+        if self.fail:
+            raise ValueError("data source down")
+        return 10
+
+    def test_open_circuit_serves_last_payload(self):
+        widget = number_widget(circuit_breaker={'failures': 1})(self.view)
+        widget(self.request)
+        self.fail = True
+        self.assertRaises(ValueError, widget, self.request)
+        resp = widget(self.request)
+        self.assertEqual(2, self.calls)
+        self.assertEqual('{"item": [{"value": 10}]}', resp.content)
+        self.assertTrue(resp.has_header(STALE_HEADER))
+        self.assertEqual(OPEN, resp[CIRCUIT_HEADER])
+
+    def test_open_circuit_without_payload(self):
+        widget = number_widget(circuit_breaker={'failures': 1})(self.view)
+        self.fail = True
+        self.assertRaises(ValueError, widget, self.request)
+        resp = widget(self.request)
+        self.assertEqual(1, self.calls)
+        self.assertEqual(503, resp.status_code)
+
+    def test_breaker_registered(self):
+        widget = number_widget(circuit_breaker=True)(self.view)
+        name = widget.widget.name
+        self.assertTrue(get_breaker(name) is widget.widget.breaker)
+        self.assertEqual(CLOSED, breaker_stats()[name]['state'])
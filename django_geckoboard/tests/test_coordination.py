@@ -0,0 +1,207 @@
+"""
+Tests for the coordinated background refresh of widgets.
+"""
+
+import multiprocessing
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO  # Python 3
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpRequest
+
+from django_geckoboard.coordination import RefreshCoordinator, HashRing
+from django_geckoboard.decorators import number_widget
+from django_geckoboard.models import RefreshLease, RefreshNode
+from django_geckoboard.registry import register_widget, unregister_widget
+from django_geckoboard.tests.utils import TestCase, TransactionTestCase
+
+
+WIDGETS = 8
+
+calls = []
+
+
+def _make_view(index):
+    def view(request):
+        calls.append(index)
+        return index
+    view.__name__ = 'widget%d' % index
+    return number_widget(refresh_interval=1)(view)
+
+views = [_make_view(i) for i in range(WIDGETS)]
+
+
+def _fail(request):
+    raise RuntimeError("failed")
+
+def _run_node(node, queue):
+    coordinator = RefreshCoordinator(node, using='leases')
+    coordinator.heartbeat()
+    deadline = time.time() + 10
+    while len(coordinator.live_nodes()) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    refreshed = []
+    for i in range(3):
+        refreshed.extend(coordinator.run_once())
+    queue.put(refreshed)
+
+
+class HashRingTestCase(TestCase):
+    """
+    Tests for the ``HashRing`` class.
+    """
+
+    def test_balanced(self):
+        ring = HashRing(['a', 'b', 'c'])
+        counts = {}
+        for i in range(3000):
+            node = ring.get_node('key%d' % i)
+            counts[node] = counts.get(node, 0) + 1
+        self.assertEqual(['a', 'b', 'c'], sorted(counts))
+        for count in counts.values():
+            self.assertTrue(700 < count < 1300, counts)
+
+    def test_removing_node_moves_its_keys_only(self):
+        before = HashRing(['a', 'b', 'c'])
+        after = HashRing(['a', 'b'])
+        for i in range(1000):
+            key = 'key%d' % i
+            if before.get_node(key) != 'c':
+                self.assertEqual(before.get_node(key), after.get_node(key))
+
+
+class RefreshCoordinatorTestCase(TransactionTestCase):
+    """
+    Tests for the ``RefreshCoordinator`` class.  The nodes run in other
+    processes commit their leases, which the transaction of a regular
+    test case would prevent.
+    """
+
+    def setUp(self):
+        super(RefreshCoordinatorTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        cache.clear()
+        RefreshLease.objects.using('leases').all().delete()
+        RefreshNode.objects.using('leases').all().delete()
+        for view in views:
+            register_widget(view.__name__, view)
+        self.names = sorted(view.widget.name for view in views)
+        self.a = RefreshCoordinator('a', using='leases')
+        self.b = RefreshCoordinator('b', using='leases')
+        del calls[:]
+
+    def tearDown(self):
+        for view in views:
+            unregister_widget(view.__name__)
+        super(RefreshCoordinatorTestCase, self).tearDown()
+
+    def _set_leases(self, **fields):
+        for name in self.names:
+            RefreshLease.objects.using('leases').create(widget=name,
+                    **fields)
+
+    def test_refresh_stores_payloads(self):
+        self.assertEqual(self.names, sorted(self.a.run_once()))
+        self.assertEqual(WIDGETS * 2, len(calls))
+        request = HttpRequest()
+        request.GET['format'] = '2'
+        self.assertEqual('{"item": [{"value": 3}]}', views[3](request).content)
+        self.assertEqual(WIDGETS * 2, len(calls))
+
+    def test_not_refreshed_before_interval(self):
+        self.a.run_once()
+        self.assertEqual([], self.a.run_once())
+
+    def test_assigned_by_hash(self):
+        self.a.heartbeat()
+        self.b.heartbeat()
+        self._set_leases(refreshed=time.time() - 10)
+        ring = HashRing(['a', 'b'])
+        refreshed_a = self.a.run_once()
+        refreshed_b = self.b.run_once()
+        self.assertEqual([n for n in self.names if ring.get_node(n) == 'a'],
+                refreshed_a)
+        self.assertEqual([n for n in self.names if ring.get_node(n) == 'b'],
+                refreshed_b)
+        self.assertTrue(refreshed_a and refreshed_b)
+
+    def test_steals_overdue_widgets(self):
+        self.a.heartbeat()
+        self.b.heartbeat()
+        self._set_leases(refreshed=time.time() - 100)
+        self.assertEqual(self.names, sorted(self.a.run_once()))
+
+    def test_failover_to_live_nodes(self):
+        self.b.heartbeat()
+        RefreshNode.objects.using('leases').filter(name='b').update(
+                heartbeat=time.time() - 100)
+        self._set_leases(refreshed=time.time() - 10)
+        self.a.heartbeat()
+        self.assertEqual(['a'], self.a.live_nodes())
+        self.assertEqual(self.names, sorted(self.a.run_once()))
+
+    def test_lease_held_by_other_node(self):
+        self._set_leases(owner='b', expires=time.time() + 60)
+        self.assertEqual([], self.a.run_once())
+        RefreshLease.objects.using('leases').update(expires=time.time() - 1)
+        self.assertEqual(self.names, sorted(self.a.run_once()))
+
+    def test_leave(self):
+        self.a.heartbeat()
+        self._set_leases(owner='a', expires=time.time() + 60)
+        self.a.leave()
+        self.assertEqual([], self.a.live_nodes())
+        self.assertEqual(self.names, sorted(self.b.run_once()))
+
+    def test_failed_refresh_retried(self):
+        failures = []
+        def failing_view(request):
+            failures.append(request)
+            _fail(request)
+        failing = number_widget(refresh_interval=60)(failing_view)
+        register_widget('failing', failing)
+        try:
+            start = time.time()
+            self.assertFalse(failing.widget.name in self.a.run_once())
+            self.assertEqual(1, len(failures))
+            leases = RefreshLease.objects.using('leases').filter(
+                    widget=failing.widget.name)
+            lease = leases.get()
+            self.assertEqual(0, lease.refreshed)
+            self.assertTrue(start + 60 <= lease.expires <= time.time() + 60)
+            # The failing widget backs off for its refresh interval.
+            self.a.run_once()
+            self.assertEqual(1, len(failures))
+            leases.update(expires=time.time() - 1)
+            self.a.run_once()
+            self.assertEqual(2, len(failures))
+        finally:
+            unregister_widget('failing')
+
+    def test_command(self):
+        self.settings_manager.set(GECKOBOARD_LEASE_DATABASE='leases')
+        stdout = StringIO()
+        call_command('geckoboard_refresh', once=True, node='a',
+                stdout=stdout)
+        self.assertEqual(WIDGETS, stdout.getvalue().count('Refreshed'))
+
+    def test_multiple_processes(self):
+        # Children must not share the connection of the parent.
+        connections['leases'].close()
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=_run_node,
+                args=(node, queue)) for node in ('a', 'b')]
+        for process in processes:
+            process.start()
+        results = [queue.get(timeout=30) for process in processes]
+        for process in processes:
+            process.join()
+        self.assertEqual(self.names, sorted(results[0] + results[1]))
+        self.assertEqual(WIDGETS, RefreshLease.objects.using('leases')
+                .filter(refreshed__gt=0).count())
@@ -0,0 +1,179 @@
+"""
+Tests for the Datasets API client.
+"""
+
+import datetime
+import json
+import threading
+from decimal import Decimal
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler  # Python 3
+
+from django.core.cache import cache
+
+from django_geckoboard.datasets import DatasetsClient, DatasetsError, \
+        QuerySetDataset, schema_from_model
+from django_geckoboard.models import DatasetState
+from django_geckoboard.tests.models import Order
+from django_geckoboard.tests.utils import TestCase
+
+
+class FakeDatasetsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_DELETE(self):
+        self._handle()
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        self.server.requests.append((self.command, self.path,
+                self.headers.get('Authorization'),
+                body and json.loads(body.decode('utf-8'))))
+        if self.path.startswith('/datasets/dropped'):
+            # The connection is lost after the request was received.
+            self.close_connection = True
+            return
+        if self.path.startswith('/datasets/broken'):
+            status, content = 400, b'{"error": {"message": "Bad data"}}'
+        else:
+            status, content = 200, b'{}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+
+class DatasetsTestCase(TestCase):
+    """
+    Tests for the Datasets client, using a local fake API server.
+    """
+
+    def setUp(self):
+        super(DatasetsTestCase, self).setUp()
+        cache.clear()
+        self.server = HTTPServer(('127.0.0.1', 0), FakeDatasetsHandler)
+        self.server.requests = []
+        self.server.connections = 0
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.client = DatasetsClient('abc', host='127.0.0.1',
+                port=self.server.server_address[1], secure=False)
+        self.client.max_append_records = 2
+        self.client.max_replace_records = 3
+        start = datetime.datetime(2011, 1, 1)
+        for i in range(7):
+            created = start + datetime.timedelta(days=i)
+            Order.objects.create(customer='customer%d' % i, amount=i,
+                    created=created, updated=created)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        super(DatasetsTestCase, self).tearDown()
+
+    def test_schema_from_model(self):
+        schema = schema_from_model(Order)
+        self.assertEqual(['id', 'customer', 'amount', 'created', 'updated',
+                'note'], list(schema))
+        self.assertEqual('number', schema['amount']['type'])
+        self.assertEqual('string', schema['customer']['type'])
+        self.assertEqual('datetime', schema['created']['type'])
+        self.assertTrue(schema['note']['optional'])
+
+    def test_push_chunks(self):
+        dataset = QuerySetDataset('users', Order.objects.all(),
+                fields=['customer', 'created', 'updated'])
+        self.assertEqual(7, dataset.push(self.client))
+        requests = self.server.requests
+        self.assertEqual(['PUT', 'PUT', 'POST', 'POST'],
+                [r[0] for r in requests])
+        self.assertEqual('/datasets/users', requests[0][1])
+        self.assertEqual('/datasets/users/data', requests[1][1])
+        self.assertEqual([3, 2, 2], [len(r[3]['data']) for r in requests[1:]])
+        self.assertEqual({'customer': 'customer0',
+                'created': '2011-01-01T00:00:00',
+                'updated': '2011-01-01T00:00:00'},
+                requests[1][3]['data'][0])
+        self.assertEqual('Basic YWJjOg==', requests[0][2])
+        self.assertEqual(1, self.server.connections)
+
+    def test_incremental_sync(self):
+        dataset = QuerySetDataset('users', Order.objects.all(),
+                fields=['customer', 'created', 'updated'],
+                updated_field='updated')
+        self.assertEqual(7, dataset.sync(self.client))
+        self.assertEqual(datetime.datetime(2011, 1, 7),
+                dataset.high_water_mark())
+        order = Order.objects.get(customer='customer0')
+        order.updated = datetime.datetime(2011, 2, 1)
+        order.save()
+        self.server.requests = []
+        self.assertEqual(1, dataset.sync(self.client))
+        self.assertEqual('customer0',
+                self.server.requests[0][3]['data'][0]['customer'])
+        self.assertEqual(0, dataset.sync(self.client))
+
+    def test_high_water_mark_durable(self):
+        dataset = QuerySetDataset('users', Order.objects.all(),
+                fields=['customer', 'updated'], updated_field='updated')
+        dataset.sync(self.client)
+        cache.clear()
+        self.assertEqual(datetime.datetime(2011, 1, 7),
+                QuerySetDataset('users', Order.objects.all(),
+                    fields=['customer', 'updated'],
+                    updated_field='updated').high_water_mark())
+        dataset.set_high_water_mark(datetime.datetime(2011, 1, 5))
+        self.server.requests = []
+        self.assertEqual(2, dataset.sync(self.client))
+        dataset.reset_high_water_mark()
+        self.assertEqual(None, dataset.high_water_mark())
+
+    def test_high_water_mark_text(self):
+        dataset = QuerySetDataset('users', Order.objects.all(),
+                fields=['customer', 'amount'], updated_field='amount')
+        dataset.set_high_water_mark(Decimal('12.50'))
+        self.assertEqual(Decimal('12.50'), dataset.high_water_mark())
+        dataset = QuerySetDataset('users', Order.objects.all(),
+                fields=['customer', 'updated'], updated_field='updated')
+        mark = datetime.datetime(2011, 1, 5, 12, 30, 15, 250)
+        dataset.set_high_water_mark(mark)
+        self.assertEqual('2011-01-05 12:30:15.000250',
+                DatasetState.objects.get().high_water_mark)
+        self.assertEqual(mark, dataset.high_water_mark())
+
+    def test_append_not_retried(self):
+        self.assertRaises(Exception, self.client.append, 'dropped',
+                [{'a': 1}])
+        self.assertEqual(1, len(self.server.requests))
+        self.server.requests = []
+        self.assertRaises(Exception, self.client.delete, 'dropped')
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_error(self):
+        try:
+            self.client.delete('broken')
+        except DatasetsError as e:
+            self.assertEqual(400, e.status)
+            self.assertEqual('400: Bad data', str(e))
+        else:
+            self.fail("DatasetsError not raised")
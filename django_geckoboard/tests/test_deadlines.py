@@ -0,0 +1,93 @@
+"""
+Tests for the ``deadline`` decorator option.
+"""
+
+import logging
+import sys
+import threading
+import traceback
+
+from django.core.cache import cache
+from django.http import HttpRequest
+
+from django_geckoboard.bulkheads import BulkheadFull
+from django_geckoboard.decorators import number_widget, REJECTED_HEADER, \
+        STALE_HEADER
+from django_geckoboard.tests.utils import TestCase
+
+
+class DeadlineTestCase(TestCase):
+    """
+    Tests for views rendered with a time budget.
+    """
+
+    def setUp(self):
+        super(DeadlineTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        cache.clear()
+        self.request = HttpRequest()
+        self.request.POST['format'] = '2'
+        self.value = 1
+        self.release = threading.Event()
+        self.release.set()
+
+    def view(self, request):
+        self.release.wait(5)
+        return self.value
+
+    def test_within_deadline(self):
+        widget = number_widget(deadline=5)(self.view)
+        resp = widget(self.request)
+        self.assertEqual('{"item": [{"value": 1}]}', resp.content)
+        self.assertFalse(resp.has_header(STALE_HEADER))
+
+    def test_deadline_exceeded_serves_last_payload(self):
+        widget = number_widget(deadline=0.05)(self.view)
+        widget(self.request)
+        self.value = 2
+        self.release.clear()
+        resp = widget(self.request)
+        self.assertEqual('{"item": [{"value": 1}]}', resp.content)
+        self.assertEqual('0', resp[STALE_HEADER])
+        self.release.set()
+        resp = widget(self.request)
+        self.assertEqual('{"item": [{"value": 2}]}', resp.content)
+
+    def test_deadline_exceeded_without_payload_waits(self):
+        self.release.clear()
+        threading.Timer(0.1, self.release.set).start()
+        widget = number_widget(deadline=0.01)(self.view)
+        resp = widget(self.request)
+        self.assertEqual('{"item": [{"value": 1}]}', resp.content)
+
+    def test_exception_raised(self):
+        def failing_view(request):
+            raise ValueError("view failed")
+        widget = number_widget(deadline=5)(failing_view)
+        self.assertRaises(ValueError, widget, self.request)
+
+    def test_exception_traceback(self):
+        def failing_view(request):
+            raise ValueError("view failed")
+        widget = number_widget(deadline=5)(failing_view)
+        try:
+            widget(self.request)
+        except ValueError:
+            frames = traceback.extract_tb(sys.exc_info()[2])
+        self.assertEqual('failing_view', frames[-1][2])
+
+    def test_bulkhead_full_not_logged(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger('django_geckoboard')
+        logger.addHandler(handler)
+        try:
+            def rejected_view(request):
+                raise BulkheadFull("full")
+            widget = number_widget(deadline=5)(rejected_view)
+            resp = widget(self.request)
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual('bulkhead', resp[REJECTED_HEADER])
+        self.assertEqual([], records)
@@ -2,13 +2,20 @@
 Tests for the Geckoboard decorators.
 """
 
+from django.core.cache import cache
 from django.http import HttpRequest, HttpResponseForbidden
 from collections import OrderedDict 
 
 from django_geckoboard.decorators import widget, number_widget, rag_widget, \
         text_widget, pie_chart, line_chart, geck_o_meter, bullet_graph, TEXT_NONE, \
-        TEXT_INFO, TEXT_WARN, funnel
+        TEXT_INFO, TEXT_WARN, funnel, histogram, leaderboard, map_widget, \
+        geohash
 from django_geckoboard.tests.utils import TestCase
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 import base64
 
 
@@ -433,3 +440,162 @@ class BulletGraphDecoratorTestCase(TestCase):
                 '"orientation": "vertical"'
                 '}',
                 resp.content)
+
+
+class HistogramDecoratorTestCase(TestCase):
+    """
+    Tests for the ``histogram`` decorator.
+    """
+
+    def setUp(self):
+        super(HistogramDecoratorTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        self.request = HttpRequest()
+        self.request.POST['format'] = '2'
+
+    def test_fixed_bins(self):
+        widget = histogram(bins=4)(lambda r: [0, 1, 1, 2, 5, 7, 8])
+        resp = widget(self.request)
+        self.assertEqual('{"item": [3, 1, 1, 2], "settings": '
+                '{"axisx": ["0", "4", "8"], "axisy": ["0", "3"]}}',
+                resp.content)
+
+    def test_range_iterator(self):
+        widget = histogram(bins=2, range=(0, 10))(
+                lambda r: iter([-1, 1, 4, 5, 9, 10, 11]))
+        resp = widget(self.request)
+        self.assertEqual('{"item": [2, 3], "settings": '
+                '{"axisx": ["0", "5", "10"], "axisy": ["0", "3"]}}',
+                resp.content)
+
+    def test_log_bins(self):
+        widget = histogram(bins=3, binning='log', range=(1, 1000),
+                color='ff0000')(lambda r: [1, 5, 50, 60, 500, 999])
+        resp = widget(self.request)
+        self.assertEqual('{"item": [2, 2, 2], "settings": '
+                '{"axisx": ["1", "10", "1000"], "axisy": ["0", "2"], '
+                '"colour": "ff0000"}}', resp.content)
+
+    def test_quantile_bins(self):
+        widget = histogram(bins=2, binning='quantile')(
+                lambda r: (x for x in [1, 2, 3, 4, 100]))
+        resp = widget(self.request)
+        self.assertEqual('{"item": [2, 3], "settings": '
+                '{"axisx": ["1", "3", "100"], "axisy": ["0", "3"]}}',
+                resp.content)
+
+
+class LeaderboardDecoratorTestCase(TestCase):
+    """
+    Tests for the ``leaderboard`` decorator.
+    """
+
+    def setUp(self):
+        super(LeaderboardDecoratorTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        cache.clear()
+        self.request = HttpRequest()
+        self.request.POST['format'] = '2'
+        self.scores = [('anne', 3), ('bob', 9), ('carl', 5), ('dave', 1)]
+
+    def test_top_k_json(self):
+        widget = leaderboard(k=2)(lambda r: iter(self.scores))
+        resp = widget(self.request)
+        self.assertEqual('{"items": [{"label": "bob", "value": 9}, '
+                '{"label": "carl", "value": 5}]}', resp.content)
+
+    def test_top_k_xml(self):
+        request = HttpRequest()
+        request.POST['format'] = '1'
+        widget = leaderboard(k=1)(lambda r: self.scores)
+        resp = widget(request)
+        self.assertEqual('<?xml version="1.0" ?><root><item>'
+                '<label>bob</label><value>9</value></item></root>',
+                resp.content)
+
+    def test_ascending(self):
+        widget = leaderboard(k=2, ascending=True)(lambda r: self.scores)
+        resp = widget(self.request)
+        self.assertEqual('{"items": [{"label": "dave", "value": 1}, '
+                '{"label": "anne", "value": 3}]}', resp.content)
+
+    def test_rank_changes(self):
+        def scores(request):
+            return self.scores
+        widget = leaderboard(k=2, rank_changes=True)(scores)
+        widget(self.request)
+        self.scores.append(('eve', 7))
+        resp = widget(self.request)
+        self.assertEqual('{"items": [{"label": "bob", "value": 9, '
+                '"previous_rank": 1}, {"label": "eve", "value": 7}]}',
+                resp.content)
+        resp = widget(self.request)
+        self.assertEqual('{"items": [{"label": "bob", "value": 9, '
+                '"previous_rank": 1}, {"label": "eve", "value": 7}]}',
+                resp.content)
+
+    def test_rank_changes_per_arguments(self):
+        rankings = {
+            'north': [('anne', 2), ('bob', 1)],
+            'south': [('carl', 2), ('dave', 1)],
+        }
+        def scores(request, region):
+            return rankings[region]
+        widget = leaderboard(rank_changes=True)(scores)
+        widget(self.request, 'north')
+        widget(self.request, 'south')
+        rankings['north'] = [('anne', 1), ('bob', 2)]
+        self.assertEqual('{"items": [{"label": "bob", "value": 2, '
+                '"previous_rank": 2}, {"label": "anne", "value": 1, '
+                '"previous_rank": 1}]}', widget(self.request, 'north').content)
+        self.assertEqual('{"items": [{"label": "carl", "value": 2}, '
+                '{"label": "dave", "value": 1}]}',
+                widget(self.request, 'south').content)
+
+
+class MapDecoratorTestCase(TestCase):
+    """
+    Tests for the ``map_widget`` decorator.
+    """
+
+    def setUp(self):
+        super(MapDecoratorTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        self.request = HttpRequest()
+        self.request.POST['format'] = '2'
+        self.points = [(52.1, 4.1), (52.3, 4.3), (52.5, 4.5), (40.7, -74.0)]
+
+    def test_grid_clusters(self):
+        widget = map_widget(lambda r: iter(self.points))
+        resp = widget(self.request)
+        self.assertEqual('{"points": {"point": ['
+                '{"latitude": "52.3000", "longitude": "4.3000", "size": 10}, '
+                '{"latitude": "40.7000", "longitude": "-74.0000", "size": 3}'
+                ']}}', resp.content)
+
+    def test_grid_cells_from_poles(self):
+        # Cells of 7 degrees start at -90, so 0.5 and -0.5 share a cell.
+        points = [(0.5, 1.0), (-0.5, 1.0)]
+        widget = map_widget(cell_size=7)(lambda r: points)
+        self.assertEqual('{"points": {"point": ['
+                '{"latitude": "0.0000", "longitude": "1.0000", "size": 10}'
+                ']}}', widget(self.request).content)
+        if numpy is not None:
+            array_widget = map_widget(cell_size=7)(
+                    lambda r: numpy.array(points))
+            self.assertEqual(widget(self.request).content,
+                    array_widget(self.request).content)
+
+    def test_geohash_clusters_xml(self):
+        request = HttpRequest()
+        request.POST['format'] = '1'
+        widget = map_widget(clustering='geohash', precision=2, max_points=1,
+                color='ff0000')(lambda r: self.points)
+        resp = widget(request)
+        self.assertEqual('<?xml version="1.0" ?><root><points><point>'
+                '<latitude>52.3000</latitude><longitude>4.3000</longitude>'
+                '<size>10</size><color>ff0000</color>'
+                '</point></points></root>', resp.content)
+
+    def test_geohash(self):
+        self.assertEqual('u4pruydqqvj', geohash(57.64911, 10.40744, 11))
@@ -0,0 +1,146 @@
+"""
+Tests for the HyperLogLog distinct counts.
+"""
+
+import json
+
+from django.core.cache import cache
+from django.http import HttpRequest
+
+from django_geckoboard.hyperloglog import DistinctCounter, HyperLogLog, \
+        distinct_count_widget
+from django_geckoboard.models import DistinctSketch
+from django_geckoboard.tests.utils import TestCase
+
+
+class HyperLogLogTestCase(TestCase):
+    """
+    Tests for the ``HyperLogLog`` sketch.
+    """
+
+    def assertEstimate(self, expected, sketch):
+        # Four standard errors make a failure practically impossible.
+        tolerance = 4 * sketch.error * expected
+        self.assertTrue(abs(sketch.count() - expected) <= tolerance,
+                "%.0f is not within %.0f of %d" % (sketch.count(), tolerance,
+                    expected))
+
+    def test_empty(self):
+        self.assertEqual(0, HyperLogLog().count())
+
+    def test_small_counts_are_exact(self):
+        sketch = HyperLogLog()
+        sketch.update(['a', 'b', 'c', 'a', u'\xe9', 1, b'x'])
+        self.assertEqual(6, round(sketch.count()))
+
+    def test_accuracy(self):
+        for precision in (8, 12):
+            sketch = HyperLogLog(precision)
+            sketch.update(range(50000))
+            sketch.update(range(25000))
+            self.assertEstimate(50000, sketch)
+
+    def test_merge(self):
+        first = HyperLogLog()
+        first.update(range(0, 20000))
+        second = HyperLogLog()
+        second.update(range(10000, 30000))
+        first.merge(second)
+        self.assertEstimate(30000, first)
+        self.assertRaises(ValueError, first.merge, HyperLogLog(10))
+
+    def test_serialization(self):
+        sketch = HyperLogLog(10)
+        sketch.update(range(1000))
+        data = sketch.to_bytes()
+        self.assertEqual(1 + 1024, len(data))
+        copy = HyperLogLog.from_bytes(data)
+        self.assertEqual(10, copy.precision)
+        self.assertEqual(sketch.count(), copy.count())
+
+    def test_invalid_precision(self):
+        self.assertRaises(ValueError, HyperLogLog, 3)
+        self.assertRaises(ValueError, HyperLogLog, 17)
+
+
+class DistinctCounterTestCase(TestCase):
+    """
+    Tests for the ``DistinctCounter`` class.
+    """
+
+    def setUp(self):
+        super(DistinctCounterTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        cache.clear()
+        self.now = 100 * 3600.0 + 1800
+
+    def assertNear(self, expected, count):
+        # Linear counting of a few hundred values in 4096 registers is
+        # off by a few percent at most.
+        self.assertTrue(abs(count - expected) <= 0.03 * expected,
+                "%d is not near %d" % (count, expected))
+
+    def _fill(self, counter):
+        # 300 visitors in the previous hour, 200 of them again this hour
+        # together with 100 new ones.
+        counter.update(range(300), timestamp=self.now - 3600)
+        counter.update(range(100, 400), timestamp=self.now)
+
+    def _check_storage(self, storage):
+        counter = DistinctCounter('visitors', storage=storage)
+        self._fill(counter)
+        current, previous = counter.counts(3600, now=self.now)
+        self.assertNear(300, current)
+        self.assertNear(300, previous)
+        counter.flush()
+        other = DistinctCounter('visitors', storage=storage)
+        self.assertEqual((current, previous),
+                other.counts(3600, now=self.now))
+        self.assertNear(400, other.count(self.now - 3600, self.now))
+        current, previous = other.counts(7200, now=self.now)
+        self.assertNear(400, current)
+        self.assertEqual(0, previous)
+
+    def test_cache_storage(self):
+        self._check_storage('cache')
+
+    def test_database_storage(self):
+        self._check_storage('database')
+        self.assertEqual(2, DistinctSketch.objects.count())
+
+    def test_flushes_merge(self):
+        first = DistinctCounter('visitors', storage='database')
+        second = DistinctCounter('visitors', storage='database')
+        first.update(range(100), timestamp=self.now)
+        second.update(range(50, 150), timestamp=self.now)
+        first.flush()
+        second.flush()
+        self.assertNear(150, DistinctCounter('visitors',
+                storage='database').count(self.now, self.now))
+
+    def test_concurrent_flush(self):
+        counter = DistinctCounter('visitors', storage='database')
+        counter.update(range(10), timestamp=self.now)
+        lock_key = counter._cache_key(counter._bucket(self.now)) + ':lock'
+        cache.add(lock_key, 1, 60)
+        counter.flush()
+        other = DistinctCounter('visitors', storage='database')
+        self.assertEqual(0, other.count(self.now, self.now))
+        self.assertEqual(10, counter.count(self.now, self.now))
+        cache.delete(lock_key)
+        counter.flush()
+        self.assertEqual(10, other.count(self.now, self.now))
+        self.assertEqual({}, counter._local)
+
+    def test_invalid_storage(self):
+        self.assertRaises(ValueError, DistinctCounter, 'visitors',
+                storage='file')
+
+    def test_widget(self):
+        counter = DistinctCounter('visitors')
+        counter.update(range(10))
+        view = distinct_count_widget(counter, 3600)
+        request = HttpRequest()
+        request.POST['format'] = '2'
+        self.assertEqual({'item': [{'value': 10}, {'value': 0}]},
+                json.loads(view(request).content.decode('utf-8')))
@@ -0,0 +1,136 @@
+"""
+Tests for the widget memory budgets.
+"""
+
+import unittest
+import warnings
+
+from django.http import HttpRequest
+
+from django_geckoboard.decorators import number_widget, pie_chart
+from django_geckoboard.memory import MemoryBudgetExceeded, \
+        MemoryBudgetWarning, MemoryTracker, get_tracker, memory_report, \
+        memory_stats, tracemalloc, _can_reset_peak
+from django_geckoboard.tests.utils import TestCase
+
+
+def allocating_view(request):
+    # Allocates about 1 MB that is released when the view returns.
+    blocks = [bytearray(1024) for i in range(1024)]
+    return len(blocks)
+
+def labels_view(request):
+    return [(i, 'label %d' % i) for i in range(1000)]
+
+
+class MemoryTrackerTestCase(TestCase):
+    """
+    Tests for the ``max_memory`` and ``track_memory`` decorator options.
+    """
+
+    def setUp(self):
+        super(MemoryTrackerTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        self.settings_manager.set(GECKOBOARD_MEMORY_BUDGET_ACTION='raise')
+        self.request = HttpRequest()
+        self.request.GET['format'] = '2'
+
+    def test_unknown_action(self):
+        self.assertRaises(ValueError, MemoryTracker, 'widget',
+                action='ignore')
+
+    def test_untracked_widget(self):
+        widget = number_widget(allocating_view)
+        self.assertEqual(None, widget.widget.memory)
+        self.assertEqual('{"item": [{"value": 1024}]}',
+                widget(self.request).content)
+
+    def test_registered(self):
+        widget = number_widget(track_memory=True)(allocating_view)
+        self.assertEqual('{"item": [{"value": 1024}]}',
+                widget(self.request).content)
+        self.assertTrue(get_tracker(widget.widget.name) is
+                widget.widget.memory)
+        self.assertTrue(widget.widget.name in memory_stats())
+
+    @unittest.skipIf(tracemalloc is None, "tracemalloc is not available")
+    def test_phases(self):
+        widget = pie_chart(track_memory=True)(labels_view)
+        widget(self.request)
+        widget(self.request)
+        stats = memory_stats()[widget.widget.name]
+        self.assertEqual(2, stats['computations'])
+        self.assertEqual(0, stats['exceeded'])
+        for phase in ('view', 'convert', 'render'):
+            self.assertTrue(stats['phases'][phase]['max_peak'] > 0, phase)
+        # The labels returned by the view are still in use when it ends.
+        self.assertTrue(stats['phases']['view']['last_net'] > 0)
+        self.assertTrue(stats['max_peak'] >=
+                stats['phases']['view']['max_peak'])
+        self.assertFalse(tracemalloc.is_tracing())
+
+    @unittest.skipIf(tracemalloc is None, "tracemalloc is not available")
+    def test_peak_and_net(self):
+        widget = number_widget(track_memory=True)(allocating_view)
+        widget(self.request)
+        view = memory_stats()[widget.widget.name]['phases']['view']
+        self.assertTrue(view['max_peak'] >= 1024 * 1024)
+        self.assertTrue(view['last_net'] < 64 * 1024)
+
+    @unittest.skipUnless(_can_reset_peak, "budgets need Python 3.9")
+    def test_budget_exceeded(self):
+        widget = number_widget(max_memory=256 * 1024)(allocating_view)
+        try:
+            widget(self.request)
+        except MemoryBudgetExceeded as e:
+            self.assertTrue('more than its budget of 256.0 KB' in str(e),
+                    str(e))
+        else:
+            self.fail("Memory budget not enforced")
+        self.assertEqual(1, get_tracker(widget.widget.name).stats()['exceeded'])
+
+    @unittest.skipIf(tracemalloc is None, "tracemalloc is not available")
+    def test_within_budget(self):
+        widget = number_widget(max_memory=16 * 1024 * 1024)(allocating_view)
+        widget(self.request)
+        self.assertEqual(0, get_tracker(widget.widget.name).stats()['exceeded'])
+
+    @unittest.skipUnless(_can_reset_peak, "budgets need Python 3.9")
+    def test_warn(self):
+        widget = number_widget(max_memory=1024,
+                memory_budget_action='warn')(allocating_view)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            widget(self.request)
+        self.assertEqual(1, len(caught))
+        self.assertTrue(issubclass(caught[0].category, MemoryBudgetWarning))
+
+    @unittest.skipUnless(_can_reset_peak, "budgets need Python 3.9")
+    def test_concurrent_budget_not_checked(self):
+        outer = MemoryTracker('outer', max_bytes=1024)
+        inner = MemoryTracker('inner', max_bytes=1024)
+        with outer.track():
+            with outer.measure('view'):
+                with inner.track():
+                    with inner.measure('view'):
+                        allocating_view(None)
+                allocating_view(None)
+        self.assertEqual(0, outer.stats()['exceeded'])
+        self.assertEqual(0, inner.stats()['exceeded'])
+        self.assertTrue(inner.stats()['max_peak'] >= 1024 * 1024)
+        with inner.track():
+            with inner.measure('view'):
+                allocating_view(None)
+        self.assertEqual(1, inner.stats()['exceeded'])
+
+    @unittest.skipIf(tracemalloc is None, "tracemalloc is not available")
+    def test_report(self):
+        light = pie_chart(track_memory=True)(labels_view)
+        heavy = number_widget(track_memory=True)(allocating_view)
+        light(self.request)
+        heavy(self.request)
+        lines = memory_report().splitlines()
+        names = [line.split()[0] for line in lines[1:]]
+        self.assertTrue(names.index(heavy.widget.name[-40:]) <
+                names.index(light.widget.name[-40:]))
+        self.assertEqual(1, len(memory_report(limit=1).splitlines()) - 1)
@@ -0,0 +1,150 @@
+"""
+Tests for the parallel sub-computations of widget views.
+"""
+
+import threading
+import time
+import unittest
+
+from django.http import HttpRequest
+
+from django_geckoboard.decorators import number_widget, rag_widget
+from django_geckoboard.memory import get_tracker, tracemalloc
+from django_geckoboard.models import RefreshNode
+from django_geckoboard.parallel import Parallel
+from django_geckoboard.querycount import QueryBudgetExceeded, get_budget
+from django_geckoboard.routing import get_widget_database, widget_database
+from django_geckoboard.tests.utils import TestCase, TransactionTestCase
+
+
+def _slow(value, seconds=0.2):
+    time.sleep(seconds)
+    return value
+
+def _fail():
+    raise KeyError('failed')
+
+
+class ParallelTestCase(TestCase):
+    """
+    Tests for the ``Parallel`` class.
+    """
+
+    def test_concurrent(self):
+        queries = Parallel()
+        for name in ('red', 'amber', 'green'):
+            queries.add(name, _slow, name)
+        start = time.time()
+        self.assertEqual(('red', 'amber', 'green'), queries.run())
+        self.assertTrue(time.time() - start < 0.5)
+
+    def test_max_workers(self):
+        queries = Parallel(max_workers=1)
+        threads = []
+        for i in range(3):
+            queries.add(i, lambda: threads.append(threading.current_thread()))
+        queries.run()
+        self.assertEqual([threading.current_thread()] * 3, threads)
+
+    def test_results_by_name(self):
+        queries = Parallel()
+        queries.add('a', _slow, 1, seconds=0)
+        queries.add('b', lambda x, y: x + y, 1, y=2)
+        self.assertEqual([('a', 1), ('b', 3)],
+                list(queries.run_dict().items()))
+        self.assertRaises(ValueError, queries.add, 'a', _fail)
+
+    def test_exception(self):
+        queries = Parallel()
+        done = []
+        queries.add('a', _fail)
+        queries.add('b', lambda: done.append(_slow('b', 0.1)))
+        self.assertRaises(KeyError, queries.run)
+        self.assertEqual(['b'], done)
+
+    def test_nested(self):
+        def inner(value):
+            queries = Parallel()
+            queries.add('x', _slow, value, seconds=0.05)
+            queries.add('y', _slow, value, seconds=0.05)
+            return queries.run()
+        outer = Parallel()
+        for i in range(20):
+            outer.add(i, inner, i)
+        self.assertEqual(tuple((i, i) for i in range(20)), outer.run())
+
+    def test_widget_database(self):
+        queries = Parallel()
+        for i in range(3):
+            queries.add(i, lambda: _slow(get_widget_database(), 0.05))
+        with widget_database('replica'):
+            self.assertEqual(('replica',) * 3, queries.run())
+        self.assertEqual((None,) * 3, queries.run())
+
+
+class ParallelQueriesTestCase(TransactionTestCase):
+    """
+    Tests for parallel queries in widget views.
+
+    Threads share the database through a file, so the test does not run
+    in a transaction.
+    """
+    multi_db = True
+    databases = '__all__'
+
+    def test_widget(self):
+        for name in ('a', 'b', 'c'):
+            RefreshNode.objects.using('leases').create(name=name,
+                    heartbeat=0)
+
+        def count(name):
+            return RefreshNode.objects.using('leases').filter(
+                    name__lte=name).count()
+
+        @rag_widget
+        def view(request):
+            queries = Parallel()
+            for name in ('a', 'b', 'c'):
+                queries.add(name, count, name)
+            red, amber, green = queries.run()
+            return (red, amber, green)
+
+        request = HttpRequest()
+        request.POST['format'] = '2'
+        self.assertTrue(b'"value": 3' in view(request).content)
+
+    def test_query_budget(self):
+        def count(name):
+            return RefreshNode.objects.using('leases').filter(
+                    name=name).count()
+
+        @rag_widget(max_queries=2, query_budget_action='raise')
+        def view(request):
+            queries = Parallel()
+            for name in ('a', 'b', 'c'):
+                queries.add(name, count, name)
+            return queries.run()
+
+        request = HttpRequest()
+        request.POST['format'] = '2'
+        self.assertRaises(QueryBudgetExceeded, view, request)
+        self.assertEqual(3, get_budget(view.widget.name).stats()['max_count'])
+
+    @unittest.skipIf(tracemalloc is None, "tracemalloc is not available")
+    def test_memory_tracking(self):
+        def allocate():
+            blocks = [bytearray(1024) for i in range(1024)]
+            return len(blocks)
+
+        @number_widget(track_memory=True)
+        def view(request):
+            queries = Parallel()
+            queries.add('a', allocate)
+            queries.add('b', allocate)
+            return sum(queries.run())
+
+        request = HttpRequest()
+        request.POST['format'] = '2'
+        view(request)
+        stats = get_tracker(view.widget.name).stats()
+        self.assertTrue(stats['phases']['view']['max_peak'] >= 1024 * 1024)
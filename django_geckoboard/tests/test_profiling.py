@@ -0,0 +1,72 @@
+"""
+Tests for the widget profiling.
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.http import HttpRequest
+
+from django_geckoboard.decorators import widget, number_widget
+from django_geckoboard.profiling import WidgetProfiler
+from django_geckoboard.tests.utils import TestCase
+
+
+def slow_widget(request):
+    return 1
+
+
+class ProfilingTestCase(TestCase):
+    """
+    Tests for the ``profile_*`` decorator options.
+    """
+
+    def setUp(self):
+        super(ProfilingTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        self.settings_manager.set(GECKOBOARD_PROFILE_DIR=self.directory)
+        self.request = HttpRequest()
+        self.request.POST['format'] = '2'
+
+    def tearDown(self):
+        super(ProfilingTestCase, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def test_options_create_decorator(self):
+        decorator = number_widget(profile_rate=1)
+        self.assertEqual({'profile_rate': 1}, decorator.options)
+        resp = decorator(lambda r: 10)(self.request)
+        self.assertEqual('{"item": [{"value": 10}]}', resp.content)
+
+    def test_sampled_request_dumped(self):
+        view = widget(profile_rate=1)(slow_widget)
+        view(self.request)
+        dumps = os.listdir(self.directory)
+        self.assertEqual(1, len(dumps))
+        self.assertTrue(dumps[0].startswith(
+                'django_geckoboard.tests.test_profiling.slow_widget-json-'))
+
+    def test_unsampled_request_not_dumped(self):
+        view = widget(profile_rate=0, profile_threshold=60)(slow_widget)
+        view(self.request)
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_fast_request_not_dumped(self):
+        view = widget(profile_rate=1, profile_threshold=60)(slow_widget)
+        view(self.request)
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_slow_request_arms_profiling(self):
+        profiler = WidgetProfiler('test', threshold=0)
+        profiler.run('xml', slow_widget, None)
+        self.assertEqual([], os.listdir(self.directory))
+        profiler.run('xml', slow_widget, None)
+        self.assertEqual(1, len(os.listdir(self.directory)))
+
+    def test_dumps_rotated(self):
+        profiler = WidgetProfiler('test', sample_rate=1, max_files=2)
+        for i in range(4):
+            profiler.run('xml', slow_widget, None)
+        self.assertEqual(2, len(os.listdir(self.directory)))
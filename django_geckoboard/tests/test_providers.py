@@ -0,0 +1,133 @@
+"""
+Tests for the data providers shared by widgets.
+"""
+
+import threading
+import time
+
+from django.core.cache import cache
+from django.http import HttpRequest
+
+from django_geckoboard.decorators import number_widget, pie_chart
+from django_geckoboard.providers import DataProvider, get_provider, \
+        provider, provider_stats, refresh_cycle, register_provider
+from django_geckoboard.tests.utils import TestCase
+
+
+class DataProviderTestCase(TestCase):
+    """
+    Tests for the ``DataProvider`` class.
+    """
+
+    def setUp(self):
+        super(DataProviderTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        cache.clear()
+        self.calls = []
+
+    def _provider(self, name='stats', **kwargs):
+        def compute(**dependencies):
+            self.calls.append(name)
+            return len(self.calls)
+        data_provider = DataProvider(name, compute, **kwargs)
+        register_provider(data_provider)
+        return data_provider
+
+    def test_ttl(self):
+        stats = self._provider(ttl=60)
+        self.assertEqual(1, stats())
+        self.assertEqual(1, stats())
+        stats._computed -= 61
+        self.assertEqual(2, stats())
+        stats.invalidate()
+        self.assertEqual(3, stats())
+        self.assertEqual(3, stats.stats()['computations'])
+        self.assertEqual(1, stats.stats()['hits'])
+
+    def test_refresh_cycle(self):
+        stats = self._provider(ttl=0)
+        with refresh_cycle():
+            self.assertEqual(1, stats())
+            self.assertEqual(1, stats())
+            with refresh_cycle():
+                self.assertEqual(1, stats())
+        with refresh_cycle():
+            self.assertEqual(2, stats())
+        self.assertEqual(3, stats())
+
+    def test_single_computation(self):
+        def slow():
+            self.calls.append('slow')
+            time.sleep(0.1)
+            return 'value'
+        slow_provider = DataProvider('slow', slow)
+        results = []
+        threads = [threading.Thread(target=lambda:
+                results.append(slow_provider())) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['value'] * 5, results)
+        self.assertEqual(['slow'], self.calls)
+
+    def test_dependencies(self):
+        self._provider('users')
+        @provider(name='report', depends=['users'])
+        def report(users):
+            return users * 10
+        self.assertEqual(10, report())
+        self.assertEqual(10, get_provider('report')())
+        self.assertEqual(['report'],
+                list(provider_stats()['users']['consumers']))
+
+    def test_dependency_cycle(self):
+        @provider(name='first', depends=['second'])
+        def first(second):
+            return second
+        @provider(name='second', depends=['third'])
+        def second(third):
+            return third
+        @provider(name='third', depends=['first'])
+        def third(first):
+            return first
+        try:
+            second()
+        except ValueError as e:
+            self.assertEqual("Data provider dependency cycle: "
+                    "second -> third -> first -> second", str(e))
+        else:
+            self.fail("Dependency cycle not detected")
+        self.assertRaises(ValueError, first)
+
+    def test_shared(self):
+        first = self._provider(shared=True)
+        second = DataProvider('stats', first.func, shared=True)
+        self.assertEqual(1, first())
+        self.assertEqual(1, second())
+        self.assertEqual(['stats'], self.calls)
+
+    def test_unknown_provider(self):
+        self.assertRaises(ValueError, get_provider, 'unknown')
+
+    def test_injection(self):
+        @provider(name='user_types')
+        def user_types():
+            self.calls.append('user_types')
+            return {'staff': 2, 'customers': 8}
+
+        @number_widget(providers=['user_types'])
+        def total(request, user_types):
+            return sum(user_types.values())
+
+        @pie_chart(providers={'types': user_types})
+        def breakdown(request, types):
+            return sorted(types.items())
+
+        request = HttpRequest()
+        self.assertTrue(b'10' in total(request).content)
+        self.assertTrue(b'customers' in breakdown(request).content)
+        self.assertEqual(['user_types'], self.calls)
+        consumers = user_types.stats()['consumers']
+        self.assertEqual(sorted([total.widget.name, breakdown.widget.name]),
+                sorted(consumers))
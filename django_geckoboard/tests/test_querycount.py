@@ -0,0 +1,107 @@
+"""
+Tests for the widget query budgets.
+"""
+
+import datetime
+import warnings
+
+from django.http import HttpRequest
+
+from django_geckoboard.decorators import number_widget, pie_chart
+from django_geckoboard.querycount import QueryBudgetExceeded, \
+        QueryBudgetWarning, QueryCounter, count_queries, normalize_sql, \
+        get_budget, query_stats
+from django_geckoboard.tests.models import Order
+from django_geckoboard.tests.utils import TestCase
+
+
+CUSTOMERS = ['alice', 'bob', 'carol', 'dave', 'eve', 'frank']
+
+
+def order_count(request):
+    return Order.objects.count()
+
+def orders_per_customer(request):
+    # One query per customer: the N+1 pattern the budget should catch.
+    return [(Order.objects.filter(customer=customer).count(), customer)
+            for customer in CUSTOMERS]
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Tests for the ``max_queries`` and ``track_queries`` decorator
+    options.
+    """
+
+    def setUp(self):
+        super(QueryBudgetTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        self.settings_manager.set(GECKOBOARD_QUERY_BUDGET_ACTION='raise')
+        self.request = HttpRequest()
+        self.request.GET['format'] = '2'
+        now = datetime.datetime(2011, 1, 1)
+        for customer in CUSTOMERS:
+            Order.objects.create(customer=customer, amount=1, created=now,
+                    updated=now)
+
+    def test_within_budget(self):
+        widget = number_widget(max_queries=1)(order_count)
+        self.assertEqual('{"item": [{"value": 6}]}',
+                widget(self.request).content)
+        stats = query_stats()[widget.widget.name]
+        self.assertEqual(1, stats['computations'])
+        self.assertEqual(1, stats['queries'])
+        self.assertEqual(0, stats['exceeded'])
+        self.assertTrue(stats['time'] >= 0)
+
+    def test_budget_exceeded(self):
+        widget = pie_chart(max_queries=3, query_repeat_threshold=10)(
+                orders_per_customer)
+        self.assertRaises(QueryBudgetExceeded, widget, self.request)
+        stats = get_budget(widget.widget.name).stats()
+        self.assertEqual(6, stats['max_count'])
+        self.assertEqual(1, stats['exceeded'])
+
+    def test_n_plus_one(self):
+        widget = pie_chart(track_queries=True)(orders_per_customer)
+        try:
+            widget(self.request)
+        except QueryBudgetExceeded as e:
+            self.assertTrue('repeated a statement 6 times' in str(e))
+        else:
+            self.fail("N+1 query not reported")
+        statement, count = query_stats()[widget.widget.name]['repeated'][0]
+        self.assertEqual(6, count)
+        self.assertTrue('"customer" = ?' in statement, statement)
+
+    def test_warn(self):
+        widget = pie_chart(track_queries=True, query_budget_action='warn')(
+                orders_per_customer)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            widget(self.request)
+        self.assertEqual([QueryBudgetWarning],
+                [w.category for w in caught])
+
+    def test_log(self):
+        widget = pie_chart(max_queries=1, query_budget_action='log')(
+                orders_per_customer)
+        widget(self.request)
+        self.assertEqual(1, query_stats()[widget.widget.name]['exceeded'])
+
+    def test_invalid_action(self):
+        self.assertRaises(ValueError, number_widget(max_queries=1,
+                query_budget_action='ignore'), order_count)
+
+    def test_count_queries(self):
+        counter = QueryCounter()
+        with count_queries(counter):
+            Order.objects.count()
+            list(Order.objects.filter(customer='bob'))
+        self.assertEqual(2, counter.count)
+        self.assertEqual([], counter.repeated(2))
+
+    def test_normalize_sql(self):
+        self.assertEqual('SELECT * FROM "t1" WHERE "a" = ? AND "b" IN (...)',
+                normalize_sql('SELECT *  FROM "t1"\nWHERE "a" = \'it\'\'s\' '
+                'AND "b" IN (1, 2.5, %s)'))
@@ -0,0 +1,198 @@
+"""
+Tests for recording and replaying widget view results.
+"""
+
+import binascii
+import datetime
+import os
+import pickle
+import shutil
+import tempfile
+import zlib
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO  # Python 3
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpRequest
+
+from django_geckoboard.decorators import funnel, histogram, leaderboard, \
+        number_widget, text_widget
+from django_geckoboard.management.commands.geckoboard_replay import \
+        Command
+from django_geckoboard.payloads import arguments_digest
+from django_geckoboard.recording import flush_records, get_corpus_dir, \
+        read_corpus, replay_corpus, compare_reports, save_report, _LENGTH
+from django_geckoboard.tests.models import Order
+from django_geckoboard.tests.utils import TestCase
+
+
+def funnel_view(request):
+    return {'items': [(50, 'step 2'), (100, 'step 1')], 'sort': True}
+
+def histogram_view(request):
+    return iter([1, 2, 2, 3])
+
+def queryset_view(request):
+    return Order.objects.all()
+
+def large_view(request):
+    # Random text, which compresses to more than the record limit.
+    return [binascii.hexlify(os.urandom(10000)).decode('ascii')]
+
+def ranking_view(request):
+    return request.ranking
+
+
+class RecordingTestCase(TestCase):
+    """
+    Tests for the ``record_rate`` decorator option and corpus replay.
+    """
+
+    def setUp(self):
+        super(RecordingTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        self.settings_manager.set(GECKOBOARD_RECORD_DIR=self.directory)
+        self.request = HttpRequest()
+        self.request.POST['format'] = '2'
+
+    def tearDown(self):
+        flush_records()
+        shutil.rmtree(self.directory)
+        super(RecordingTestCase, self).tearDown()
+
+    def _corpus_path(self, view):
+        flush_records()
+        return os.path.join(self.directory,
+                'django_geckoboard.tests.test_recording.%s.corpus'
+                % view.__name__)
+
+    def test_record_before_conversion(self):
+        widget = funnel(record_rate=1)(funnel_view)
+        resp = widget(self.request)
+        records = list(read_corpus(self._corpus_path(funnel_view)))
+        self.assertEqual(1, len(records))
+        record = records[0]
+        self.assertEqual('django_geckoboard.decorators.FunnelWidgetDecorator',
+                record['decorator'])
+        self.assertEqual(funnel_view(None),
+                pickle.loads(record['view_result']))
+        self.assertEqual(resp.content, record['json'])
+
+    def test_iterator_not_recorded(self):
+        widget = histogram(bins=3, record_rate=1)(histogram_view)
+        resp = widget(self.request)
+        self.assertEqual('{"item": [1, 2, 1], "settings": '
+                '{"axisx": ["1", "1.66667", "3"], "axisy": ["0", "2"]}}',
+                resp.content)
+        record = next(read_corpus(self._corpus_path(histogram_view)))
+        self.assertEqual(None, record['view_result'])
+        self.assertEqual([1, 2, 1], record['data']['item'])
+
+    def test_queryset_not_recorded(self):
+        Order.objects.create(customer='alice', amount=1,
+                created=datetime.datetime(2011, 1, 1),
+                updated=datetime.datetime(2011, 1, 1))
+        widget = number_widget(approximate_count=True, record_rate=1)(
+                queryset_view)
+        widget(self.request)
+        record = next(read_corpus(self._corpus_path(queryset_view)))
+        self.assertEqual(None, record['view_result'])
+
+    def test_max_bytes(self):
+        self.settings_manager.set(GECKOBOARD_RECORD_MAX_BYTES=1024)
+        widget = text_widget(record_rate=1)(large_view)
+        widget(self.request)
+        self.assertFalse(os.path.exists(self._corpus_path(large_view)))
+
+    def test_replay_lookups(self):
+        widget = leaderboard(rank_changes=True, record_rate=1)(ranking_view)
+        self.request.ranking = [('a', 3), ('b', 2)]
+        widget(self.request)
+        self.request.ranking = [('a', 1), ('b', 5)]
+        self.assertTrue(b'"previous_rank": 2' in widget(self.request).content)
+        # Replay neither depends on nor changes the stored rankings.
+        key = 'django_geckoboard:leaderboard:%s:%s' % (widget.widget.name,
+                arguments_digest())
+        cache.set(key, {'current': ['x'], 'previous': ['y']}, 60)
+        flush_records()
+        report = replay_corpus(repeat=2)
+        self.assertEqual([], report['widgets'][widget.widget.name][
+                'mismatches'])
+        self.assertEqual({'current': ['x'], 'previous': ['y']},
+                cache.get(key))
+
+    def test_not_sampled(self):
+        widget = funnel(record_rate=0.0)(funnel_view)
+        widget(self.request)
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_replay(self):
+        funnel(record_rate=1)(funnel_view)(self.request)
+        histogram(record_rate=1)(histogram_view)(self.request)
+        flush_records()
+        report = replay_corpus(repeat=2)
+        self.assertEqual(2, len(report['widgets']))
+        for widget in report['widgets'].values():
+            self.assertEqual(1, widget['records'])
+            self.assertEqual([], widget['mismatches'])
+            self.assertTrue(widget['time_us'] > 0)
+
+    def test_replay_detects_mismatch(self):
+        funnel(record_rate=1)(funnel_view)(self.request)
+        path = self._corpus_path(funnel_view)
+        record = next(read_corpus(path))
+        record['json'] = '{}'
+        blob = zlib.compress(pickle.dumps(record))
+        with open(path, 'ab') as f:
+            f.write(_LENGTH.pack(len(blob)) + blob)
+        widget = replay_corpus(repeat=1)['widgets'][record['widget']]
+        self.assertEqual([1], widget['mismatches'])
+        command = Command()
+        command.stdout = StringIO()
+        self.assertRaises(CommandError, command.handle, corpus=None,
+                repeat=1, save=None, baseline=None)
+
+    def test_default_directory_is_private(self):
+        self.settings_manager.delete('GECKOBOARD_RECORD_DIR')
+        tempdir = tempfile.tempdir
+        tempfile.tempdir = self.directory
+        try:
+            directory = get_corpus_dir()
+            self.assertEqual(self.directory, os.path.dirname(directory))
+            funnel(record_rate=1)(funnel_view)(self.request)
+            flush_records()
+            self.assertEqual(0o700, os.stat(directory).st_mode & 0o777)
+            self.assertEqual(1, replay_corpus(repeat=1)['widgets'][
+                    funnel(funnel_view).widget.name]['records'])
+            os.chmod(directory, 0o777)
+            self.assertRaises(ImproperlyConfigured, replay_corpus)
+        finally:
+            tempfile.tempdir = tempdir
+
+    def test_compare_reports(self):
+        baseline = {'version': '1.0', 'widgets': {
+                'a': {'time_us': 100.0, 'peak_bytes': None}}}
+        report = {'version': '1.1', 'widgets': {
+                'a': {'time_us': 150.0, 'peak_bytes': 10},
+                'b': {'time_us': 1.0, 'peak_bytes': None}}}
+        self.assertEqual([('a', 'time_us', 100.0, 150.0, 0.5)],
+                compare_reports(report, baseline))
+
+    def test_command(self):
+        funnel(record_rate=1)(funnel_view)(self.request)
+        baseline = os.path.join(self.directory, 'baseline.json')
+        flush_records()
+        save_report(replay_corpus(repeat=1), baseline)
+        report = os.path.join(self.directory, 'report.json')
+        stdout = StringIO()
+        call_command('geckoboard_replay', repeat=1, baseline=baseline,
+                save=report, stdout=stdout)
+        self.assertTrue('Changes from version' in stdout.getvalue())
+        self.assertTrue(os.path.exists(report))
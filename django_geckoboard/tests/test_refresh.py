@@ -0,0 +1,170 @@
+"""
+Tests for the adaptive cache timeouts.
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.http import HttpRequest
+
+from django_geckoboard import refresh
+from django_geckoboard.decorators import number_widget
+from django_geckoboard.refresh import AdaptiveTTL, get_policy, ttl_stats
+from django_geckoboard.shm import get_shared_cache
+from django_geckoboard.tests.utils import TestCase
+
+
+class FakeTime(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class AdaptiveTTLTestCase(TestCase):
+    """
+    Tests for the ``AdaptiveTTL`` class.
+    """
+
+    def setUp(self):
+        super(AdaptiveTTLTestCase, self).setUp()
+        self.clock = FakeTime()
+        self._time = refresh.time
+        refresh.time = self.clock
+
+    def tearDown(self):
+        refresh.time = self._time
+        super(AdaptiveTTLTestCase, self).tearDown()
+
+    def _compute(self, policy, content, seconds=0.01, cost=0.001, polls=1):
+        for i in range(polls):
+            self.clock.now += float(seconds) / polls
+            policy.record_poll()
+        policy.record_computation('key', cost, content)
+
+    def test_initial(self):
+        policy = AdaptiveTTL('test', min_timeout=5, max_timeout=60,
+                initial=30)
+        self.assertEqual(30, policy.timeout())
+        self.assertEqual('initial', policy.stats()['reason'])
+        self.assertEqual(5, AdaptiveTTL('test', min_timeout=5).timeout())
+
+    def test_grows_without_changes(self):
+        policy = AdaptiveTTL('test', min_timeout=5, max_timeout=60)
+        self._compute(policy, b'a')
+        timeouts = []
+        for i in range(4):
+            self._compute(policy, b'a', seconds=policy.timeout())
+            timeouts.append(policy.timeout())
+        self.assertEqual([10, 20, 40, 60], timeouts)
+        self.assertEqual('max_timeout', policy.stats()['reason'])
+
+    def test_follows_change_rate(self):
+        policy = AdaptiveTTL('test', min_timeout=1, max_timeout=600,
+                staleness=0.5)
+        for i in range(20):
+            # The payload changes every 100 seconds, computed every 50.
+            self._compute(policy, ('%d' % (i // 2)).encode('ascii'),
+                    seconds=50)
+        stats = policy.stats()
+        self.assertEqual('change rate', stats['reason'])
+        self.assertTrue(20 < stats['timeout'] < 80, stats['timeout'])
+        self.assertAlmostEqual(0.01, stats['change_rate'], 2)
+
+    def test_shrinks_to_minimum(self):
+        policy = AdaptiveTTL('test', min_timeout=5, max_timeout=600,
+                initial=600)
+        for i in range(40):
+            self._compute(policy, ('%d' % i).encode('ascii'),
+                    seconds=policy.timeout())
+        self.assertEqual(5, policy.timeout())
+        self.assertEqual('min_timeout', policy.stats()['reason'])
+
+    def test_expensive_widget_polled_often(self):
+        policy = AdaptiveTTL('test', min_timeout=1, max_timeout=600,
+                max_load=0.1)
+        for i in range(10):
+            self._compute(policy, ('%d' % i).encode('ascii'), seconds=10,
+                    cost=5, polls=10)
+        self.assertEqual(50, policy.timeout())
+        self.assertEqual('computation cost', policy.stats()['reason'])
+
+    def test_expensive_widget_polled_rarely(self):
+        policy = AdaptiveTTL('test', min_timeout=1, max_timeout=600,
+                max_load=0.1)
+        for i in range(10):
+            self._compute(policy, ('%d' % i).encode('ascii'), seconds=100,
+                    cost=5)
+        self.assertEqual('change rate', policy.stats()['reason'])
+
+    def test_payloads_compared_per_key(self):
+        policy = AdaptiveTTL('test', min_timeout=1, max_timeout=600)
+        for i in range(4):
+            self.clock.now += 10
+            policy.record_computation('xml', 0.01, b'<a/>')
+            policy.record_computation('json', 0.01, b'{}')
+        self.assertEqual(0, policy.stats()['change_rate'])
+
+    def test_payloads_bounded(self):
+        policy = AdaptiveTTL('test')
+        policy.record_computation('first', 0.01, b'{}')
+        for i in range(refresh.MAX_PAYLOADS):
+            policy.record_computation('key %d' % i, 0.01, b'{}')
+            policy.record_computation('first', 0.01, b'{}')
+        policy.record_computation('last', 0.01, b'{}')
+        self.assertEqual(refresh.MAX_PAYLOADS, len(policy._payloads))
+        self.assertTrue('first' in policy._payloads)
+        self.assertFalse('key 0' in policy._payloads)
+
+    def test_invalid_bounds(self):
+        self.assertRaises(ValueError, AdaptiveTTL, 'test', min_timeout=10,
+                max_timeout=5)
+
+
+class AdaptiveCacheDecoratorTestCase(TestCase):
+    """
+    Tests for the ``adaptive_cache`` decorator option.
+    """
+
+    def setUp(self):
+        super(AdaptiveCacheDecoratorTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        self.settings_manager.set(GECKOBOARD_SHARED_CACHE_PATH=os.path.join(
+                self.directory, 'cache'))
+        self.request = HttpRequest()
+        self.request.GET['format'] = '2'
+        self.calls = 0
+
+    def tearDown(self):
+        get_shared_cache().clear()
+        shutil.rmtree(self.directory)
+        super(AdaptiveCacheDecoratorTestCase, self).tearDown()
+
+    def view(self, request):
+        self.calls += 1
+        return self.calls
+
+    def test_cached(self):
+        widget = number_widget(adaptive_cache=True, cache_timeout=60)(
+                self.view)
+        self.assertEqual('{"item": [{"value": 1}]}',
+                widget(self.request).content)
+        self.assertEqual('{"item": [{"value": 1}]}',
+                widget(self.request).content)
+        self.assertEqual(1, self.calls)
+
+    def test_introspection(self):
+        widget = number_widget(adaptive_cache={'min_timeout': 1,
+                'max_timeout': 30})(self.view)
+        widget(self.request)
+        widget(self.request)
+        policy = get_policy(widget.widget.name)
+        self.assertTrue(policy is widget.widget.ttl_policy)
+        stats = ttl_stats()[widget.widget.name]
+        self.assertEqual(1, stats['timeout'])
+        self.assertEqual(2, stats['polls'])
+        self.assertEqual(1, stats['computations'])
@@ -0,0 +1,119 @@
+"""
+Tests for routing widget queries to another database.
+"""
+
+import datetime
+import threading
+
+from django.db import DatabaseError, router
+from django.http import HttpRequest
+
+from django_geckoboard.decorators import number_widget
+from django_geckoboard.routing import WidgetRouter, widget_database, \
+        get_widget_database
+from django_geckoboard.tests.models import Order
+from django_geckoboard.tests.utils import TestCase
+
+
+SLOW_WHERE = ("(WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 "
+        "FROM c WHERE x < 100000000) SELECT count(*) FROM c) > 0")
+
+
+def _create_order(using, customer='replica'):
+    now = datetime.datetime(2011, 1, 1)
+    Order.objects.using(using).create(customer=customer, amount=1,
+            created=now, updated=now)
+
+def order_count(request):
+    return Order.objects.count()
+
+def create_order(request):
+    _create_order(None, 'written')
+    return 1
+
+def slow_count(request):
+    return Order.objects.extra(where=[SLOW_WHERE]).count()
+
+
+class RoutingTestCase(TestCase):
+    """
+    Tests for the ``using`` and ``statement_timeout`` decorator options.
+    """
+
+    multi_db = True  # Django < 2.2
+    databases = '__all__'
+
+    def setUp(self):
+        super(RoutingTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY',
+                'GECKOBOARD_DATABASE')
+        self.request = HttpRequest()
+        self.request.GET['format'] = '2'
+        _create_order('replica')
+
+    def tearDown(self):
+        Order.objects.using('replica').all().delete()
+        super(RoutingTestCase, self).tearDown()
+
+    def test_default_database(self):
+        self.assertEqual('{"item": [{"value": 0}]}',
+                number_widget(order_count)(self.request).content)
+
+    def test_using(self):
+        widget = number_widget(using='replica')(order_count)
+        self.assertEqual('{"item": [{"value": 1}]}',
+                widget(self.request).content)
+        self.assertEqual(0, Order.objects.count())
+
+    def test_setting(self):
+        self.settings_manager.set(GECKOBOARD_DATABASE='replica')
+        self.assertEqual('{"item": [{"value": 1}]}',
+                number_widget(order_count)(self.request).content)
+
+    def test_writes_not_routed(self):
+        number_widget(using='replica')(create_order)(self.request)
+        self.assertEqual(1, Order.objects.filter(customer='written').count())
+        self.assertEqual(0, Order.objects.using('replica')
+                .filter(customer='written').count())
+        with widget_database('replica'):
+            self.assertEqual('default', router.db_for_write(Order))
+
+    def test_router_inactive_outside_view(self):
+        number_widget(using='replica')(order_count)(self.request)
+        self.assertEqual(None, get_widget_database())
+        self.assertEqual('default', router.db_for_read(Order))
+        self.assertEqual(1, len([r for r in router.routers
+                if isinstance(r, WidgetRouter)]))
+
+    def test_thread_local(self):
+        seen = []
+        def other_thread():
+            seen.append(get_widget_database())
+        with widget_database('replica'):
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            thread.join()
+            self.assertEqual('replica', router.db_for_read(Order))
+        self.assertEqual([None], seen)
+
+    def test_nested(self):
+        with widget_database('replica'):
+            with widget_database('default'):
+                self.assertEqual('default', get_widget_database())
+            self.assertEqual('replica', get_widget_database())
+
+    def test_statement_timeout(self):
+        widget = number_widget(using='replica', statement_timeout=0.05)(
+                slow_count)
+        self.assertRaises(DatabaseError, widget, self.request)
+        widget = number_widget(using='replica', statement_timeout=5)(
+                order_count)
+        self.assertEqual('{"item": [{"value": 1}]}',
+                widget(self.request).content)
+
+    def test_statement_timeout_removed(self):
+        with widget_database('replica', statement_timeout=0.05):
+            pass
+        self.assertEqual(1, Order.objects.using('replica')
+                .extra(where=[SLOW_WHERE.replace('100000000', '100000')])
+                .count())
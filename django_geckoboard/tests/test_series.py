@@ -0,0 +1,93 @@
+"""
+Tests for the database-side time series builder.
+"""
+
+import datetime
+import unittest
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.http import HttpRequest
+
+from django_geckoboard.decorators import line_chart
+from django_geckoboard.series import time_series, timezone
+from django_geckoboard.tests.models import Order
+from django_geckoboard.tests.utils import TestCase
+
+
+class TimeSeriesTestCase(TestCase):
+    """
+    Tests for the ``time_series`` function.
+    """
+
+    def setUp(self):
+        super(TimeSeriesTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        self.end = datetime.datetime(2011, 3, 10, 15, 30)
+        for days, amount in [(0, 5), (0, 10), (2, 1), (9, 3), (40, 7)]:
+            created = self.end - datetime.timedelta(days=days)
+            Order.objects.create(customer='test', amount=Decimal(amount),
+                    created=created, updated=created)
+
+    def test_daily_counts(self):
+        def series():
+            return time_series(Order.objects.all(), 'created',
+                    window=5, end=self.end)
+        self.assertNumQueries(1, series)
+        self.assertEqual(([0, 0, 1, 0, 2], ['06 Mar', '08 Mar', '10 Mar'],
+                ['0', '2']), series())
+
+    def test_sum(self):
+        values, x_axis, y_axis = time_series(Order.objects.all(), 'created',
+                window=3, aggregate=Sum('amount'), end=self.end)
+        self.assertEqual([1, 0, 15], values)
+        self.assertEqual(['0', '15'], y_axis)
+
+    def test_weekly_counts(self):
+        values, x_axis, y_axis = time_series(Order.objects.all(), 'created',
+                granularity='week', window=2, labels=2, end=self.end)
+        self.assertEqual([1, 3], values)
+        self.assertEqual(['28 Feb', '07 Mar'], x_axis)
+
+    def test_monthly_counts(self):
+        values, x_axis, y_axis = time_series(Order.objects.all(), 'created',
+                granularity='month', window=3, end=self.end, color='ff0000')[:3]
+        self.assertEqual([1, 0, 4], values)
+        self.assertEqual(['Jan 2011', 'Feb 2011', 'Mar 2011'], x_axis)
+
+    @unittest.skipIf(timezone is None, "time zones are not supported")
+    def test_time_zone(self):
+        self.settings_manager.set(USE_TZ=True, TIME_ZONE='Europe/Paris')
+        Order.objects.all().delete()
+        # Summer time starts in Paris on 27 Mar 2011.
+        for created in [datetime.datetime(2011, 3, 26, 22, 30),
+                datetime.datetime(2011, 3, 26, 23, 30),
+                datetime.datetime(2011, 3, 27, 22, 30)]:
+            created = _utc(created)
+            Order.objects.create(customer='test', amount=Decimal(1),
+                    created=created, updated=created)
+        with timezone.override('Europe/Paris'):
+            values, x_axis, y_axis = time_series(Order.objects.all(),
+                    'created', window=4, labels=2,
+                    end=_utc(datetime.datetime(2011, 3, 28, 12)))
+        self.assertEqual([0, 1, 1, 1], values)
+        self.assertEqual(['25 Mar', '28 Mar'], x_axis)
+
+    def test_filtered_queryset(self):
+        values = time_series(Order.objects.filter(amount__gt=4), 'created',
+                window=1, end=self.end)[0]
+        self.assertEqual([2], values)
+
+    def test_line_chart(self):
+        widget = line_chart(lambda r: time_series(Order.objects.all(),
+                'created', window=3, labels=2, end=self.end))
+        request = HttpRequest()
+        request.POST['format'] = '2'
+        self.assertEqual('{"item": [1, 0, 2], "settings": '
+                '{"axisx": ["08 Mar", "10 Mar"], "axisy": ["0", "2"]}}',
+                widget(request).content)
+
+
+def _utc(dt):
+    utc = getattr(timezone, 'utc', None) or datetime.timezone.utc
+    return dt.replace(tzinfo=utc)
@@ -0,0 +1,156 @@
+"""
+Tests for the shared-memory payload cache.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.http import HttpRequest
+
+from django_geckoboard.decorators import number_widget
+from django_geckoboard.shm import SharedMemoryCache, get_shared_cache, \
+        _FILE_HEADER_SIZE, _SEQUENCE, _namespace
+from django_geckoboard.tests.utils import TestCase
+
+
+def _set_in_child(path, key, value):
+    cache = SharedMemoryCache(path, slots=8, slot_size=256)
+    cache.set(key, value, 60)
+    cache.close()
+
+
+class SharedMemoryCacheTestCase(TestCase):
+    """
+    Tests for the ``SharedMemoryCache`` class.
+    """
+
+    def setUp(self):
+        super(SharedMemoryCacheTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache')
+        self.cache = SharedMemoryCache(self.path, slots=8, slot_size=256)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+        super(SharedMemoryCacheTestCase, self).tearDown()
+
+    def test_set_get(self):
+        self.assertEqual(None, self.cache.get('a'))
+        self.assertTrue(self.cache.set('a', b'value', 60))
+        self.assertEqual(b'value', self.cache.get('a'))
+        self.cache.set('a', b'new value', 60)
+        self.assertEqual(b'new value', self.cache.get('a'))
+
+    def test_expiry(self):
+        self.cache.set('a', b'value', -1)
+        self.assertEqual(None, self.cache.get('a'))
+
+    def test_delete_and_clear(self):
+        self.cache.set('a', b'value', 60)
+        self.cache.set('b', b'value', 60)
+        self.cache.delete('a')
+        self.assertEqual(None, self.cache.get('a'))
+        self.assertEqual(b'value', self.cache.get('b'))
+        self.cache.clear()
+        self.assertEqual(None, self.cache.get('b'))
+
+    def test_value_too_large(self):
+        self.assertFalse(self.cache.set('a', b'x' * 256, 60))
+        self.assertEqual(None, self.cache.get('a'))
+
+    def test_lru_eviction(self):
+        for i in range(8):
+            self.cache.set('key%d' % i, b'value', 60)
+            time.sleep(0.001)
+        self.cache.get('key0')
+        self.cache.set('key8', b'value', 60)
+        self.assertEqual(b'value', self.cache.get('key0'))
+        self.assertEqual(None, self.cache.get('key1'))
+        self.assertEqual(b'value', self.cache.get('key8'))
+
+    def test_recovers_from_crashed_writer(self):
+        self.cache.set('a', b'value', 60)
+        # Leave every slot as a writer that crashed midway would.
+        for slot in range(8):
+            offset = _FILE_HEADER_SIZE + slot * 256
+            sequence = _SEQUENCE.unpack_from(self.cache._map, offset)[0]
+            _SEQUENCE.pack_into(self.cache._map, offset, sequence | 1)
+        self.assertEqual(None, self.cache.get('a'))
+        self.assertTrue(self.cache.set('a', b'new value', 60))
+        self.assertEqual(b'new value', self.cache.get('a'))
+        self.cache.delete('a')
+        self.assertEqual(None, self.cache.get('a'))
+
+    def test_shared_between_processes(self):
+        process = multiprocessing.Process(target=_set_in_child,
+                args=(self.path, 'a', b'from child'))
+        process.start()
+        process.join()
+        self.assertEqual(b'from child', self.cache.get('a'))
+
+    def test_geometry_mismatch(self):
+        self.assertRaises(ValueError, SharedMemoryCache, self.path,
+                slots=16, slot_size=256)
+
+
+class SharedCacheDecoratorTestCase(TestCase):
+    """
+    Tests for the ``cache_timeout`` decorator option.
+    """
+
+    def setUp(self):
+        super(SharedCacheDecoratorTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        self.settings_manager.set(GECKOBOARD_SHARED_CACHE_PATH=os.path.join(
+                self.directory, 'cache'))
+        self.calls = 0
+
+    def tearDown(self):
+        get_shared_cache().clear()
+        shutil.rmtree(self.directory)
+        super(SharedCacheDecoratorTestCase, self).tearDown()
+
+    def view(self, request):
+        self.calls += 1
+        return self.calls
+
+    def test_cached_per_format(self):
+        widget = number_widget(cache_timeout=60)(self.view)
+        json_request = HttpRequest()
+        json_request.GET['format'] = '2'
+        xml_request = HttpRequest()
+        xml_request.GET['format'] = '1'
+        self.assertEqual('{"item": [{"value": 1}]}',
+                widget(json_request).content)
+        self.assertEqual('{"item": [{"value": 1}]}',
+                widget(json_request).content)
+        self.assertEqual('<?xml version="1.0" ?><root><item><value>2</value>'
+                '</item></root>', widget(xml_request).content)
+        self.assertEqual(2, self.calls)
+
+    def test_unusable_cache(self):
+        path = os.path.join(self.directory, 'missing', 'cache')
+        self.settings_manager.set(GECKOBOARD_SHARED_CACHE_PATH=path)
+        try:
+            self.assertEqual(None, get_shared_cache())
+            widget = number_widget(cache_timeout=60)(self.view)
+            request = HttpRequest()
+            request.GET['format'] = '2'
+            self.assertEqual('{"item": [{"value": 1}]}',
+                    widget(request).content)
+            self.assertEqual('{"item": [{"value": 2}]}',
+                    widget(request).content)
+        finally:
+            self.settings_manager.set(GECKOBOARD_SHARED_CACHE_PATH=
+                    os.path.join(self.directory, 'cache'))
+
+    def test_default_path_per_project(self):
+        self.settings_manager.set(SECRET_KEY='first')
+        first = _namespace()
+        self.settings_manager.set(SECRET_KEY='second')
+        self.assertNotEqual(first, _namespace())
@@ -0,0 +1,153 @@
+"""
+Tests for the widget snapshot history.
+"""
+
+import json
+import time
+
+from django.core.cache import cache
+from django.http import HttpRequest
+
+from django_geckoboard import snapshots
+from django_geckoboard.decorators import geck_o_meter, number_widget
+from django_geckoboard.models import WidgetSnapshot
+from django_geckoboard.series import snapshot_series
+from django_geckoboard.snapshots import previous_value, prune_snapshots, \
+        record_snapshot, snapshot_history, snapshot_key
+from django_geckoboard.tests.utils import TestCase
+
+
+class SnapshotsTestCase(TestCase):
+    """
+    Tests for the snapshot history.
+    """
+
+    def setUp(self):
+        super(SnapshotsTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        snapshots._last_snapshots.clear()
+        cache.clear()
+        self.now = time.time()
+
+    def _add(self, name, age, value):
+        WidgetSnapshot.objects.create(widget=name,
+                timestamp=self.now - age, value=value, data='{}')
+
+    def test_record_interval(self):
+        self.assertTrue(record_snapshot('test', {'item': 1}, 1, 60))
+        self.assertFalse(record_snapshot('test', {'item': 2}, 2, 60))
+        snapshot = WidgetSnapshot.objects.get(widget='test')
+        self.assertEqual(1, snapshot.value)
+        self.assertEqual({'item': 1}, json.loads(snapshot.data))
+
+    def test_record_interval_across_processes(self):
+        self.assertTrue(record_snapshot('test', {}, 1, 60))
+        snapshots._last_snapshots.clear()
+        self.assertFalse(record_snapshot('test', {}, 2, 60))
+        self.assertEqual(1, WidgetSnapshot.objects.count())
+
+    def test_record_interval_without_shared_cache(self):
+        self.assertTrue(record_snapshot('test', {}, 1, 60))
+        snapshots._last_snapshots.clear()
+        cache.clear()
+        self.assertFalse(record_snapshot('test', {}, 2, 60))
+        self.assertEqual(1, WidgetSnapshot.objects.count())
+
+    def test_record_non_numeric_value(self):
+        record_snapshot('test', {}, 'n/a', 60)
+        self.assertEqual(None, WidgetSnapshot.objects.get().value)
+
+    def test_previous_value(self):
+        self._add('test', 7200, 10)
+        self._add('test', 3000, 20)
+        self._add('other', 3600, 30)
+        self.assertEqual(10, previous_value('test', 3600))
+        self.assertEqual(None, previous_value('test', 86400))
+
+    def test_history(self):
+        self._add('test', 300, 1)
+        self._add('test', 200, 2)
+        self._add('test', 100, 3)
+        self.assertEqual([2, 3], [v for t, v in
+                snapshot_history('test', self.now - 250)])
+        self.assertEqual([1, 2], [v for t, v in snapshot_history('test',
+                self.now - 400, self.now - 150)])
+
+    def test_prune_deletes_expired(self):
+        for age in (10, 500, 2500):
+            self._add('test', age, age)
+        self.assertEqual(1, prune_snapshots(now=self.now,
+                retention=((1000, 0), (2000, 0))))
+        self.assertEqual([10, 500], sorted(WidgetSnapshot.objects
+                .values_list('value', flat=True)))
+
+    def test_prune_merges_old_buckets(self):
+        now = 10000.0
+        for timestamp, value in [(1000, 1), (1100, 3), (1600, 5),
+                (9000, 7)]:
+            WidgetSnapshot.objects.create(widget='test',
+                    timestamp=timestamp, value=value, data='{}')
+        self.assertEqual(1, prune_snapshots(now=now,
+                retention=((1000, 0), (9500, 500))))
+        self.assertEqual([(1000, 2.0), (1500, 5.0), (9000, 7.0)],
+                list(WidgetSnapshot.objects.order_by('timestamp')
+                    .values_list('timestamp', 'value')))
+        self.assertEqual(2, prune_snapshots(now=now,
+                retention=((1000, 0), (8000, 500))))
+        self.assertEqual([9000.0], list(WidgetSnapshot.objects
+                .values_list('timestamp', flat=True)))
+
+    def test_widget_option(self):
+        @number_widget(snapshot_interval=60)
+        def view(request):
+            return 42
+        view(HttpRequest())
+        view(HttpRequest())
+        self.assertEqual([42], [v for t, v in
+                snapshot_history(view, self.now - 1)])
+
+    def test_widget_arguments(self):
+        @number_widget(snapshot_interval=60, compare_to=3600)
+        def view(request, region):
+            return len(region)
+        name = view.widget.name
+        self._add(snapshot_key(name, ('eu',)), 7200, 30)
+        request = HttpRequest()
+        request.POST['format'] = '2'
+        content = view(request, 'eu').content
+        self.assertEqual({'item': [{'value': 2}, {'value': 30}]},
+                json.loads(content.decode('utf-8')))
+        view(request, 'asia')
+        self.assertEqual([2], [v for t, v in snapshot_history(
+                snapshot_key(name, ('eu',)), self.now - 1)])
+        self.assertEqual([4], [v for t, v in snapshot_history(
+                snapshot_key(name, ('asia',)), self.now - 1)])
+        self.assertEqual([], snapshot_history(view, self.now - 1))
+
+    def test_geck_o_meter_value(self):
+        @geck_o_meter(snapshot_interval=60)
+        def view(request):
+            return (5, 0, 10)
+        view(HttpRequest())
+        self.assertEqual(5, WidgetSnapshot.objects.get().value)
+
+    def test_compare_to(self):
+        @number_widget(compare_to=3600)
+        def view(request):
+            return 42
+        self._add(view.widget.name, 7200, 30)
+        request = HttpRequest()
+        request.POST['format'] = '2'
+        content = view(request).content
+        self.assertEqual({'item': [{'value': 42}, {'value': 30}]},
+                json.loads(content.decode('utf-8')))
+
+    def test_series(self):
+        self._add('test', 3500, 2)
+        self._add('test', 3400, 4)
+        self._add('test', 500, 6)
+        values, x_axis, y_axis = snapshot_series('test', window=3600,
+                points=4, end=self.now)
+        self.assertEqual([3, 3, 3, 6], values)
+        self.assertEqual(3, len(x_axis))
+        self.assertEqual(['3', '6'], y_axis)
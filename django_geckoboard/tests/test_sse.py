@@ -0,0 +1,138 @@
+"""
+Tests for the Server-Sent Events stream of widget payloads.
+"""
+
+import unittest
+
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpRequest
+
+from django_geckoboard import sse
+from django_geckoboard.decorators import number_widget
+from django_geckoboard.registry import register_widget, unregister_widget
+from django_geckoboard.sse import Broadcaster, Subscription, format_event, \
+        widget_events
+from django_geckoboard.tests.utils import TestCase
+
+
+values = []
+
+@number_widget
+def visitors(request):
+    values.append(values[-1])
+    return values[-1]
+
+
+class ManualBroadcaster(Broadcaster):
+    """A broadcaster polled by the tests instead of a thread."""
+
+    def _start(self):
+        pass
+
+
+class SubscriptionTestCase(TestCase):
+    """
+    Tests for the ``Subscription`` class and the event format.
+    """
+
+    def test_coalesces_updates(self):
+        subscription = Subscription(['a', 'b'], '2')
+        subscription.publish('a', b'1')
+        subscription.publish('b', b'2')
+        subscription.publish('a', b'3')
+        self.assertEqual([('b', b'2'), ('a', b'3')], subscription.updates())
+        self.assertEqual([], subscription.updates(0.01))
+
+    def test_format_event(self):
+        self.assertEqual(b'event: visitors\ndata: {"item": 1}\n\n',
+                format_event('visitors', b'{"item": 1}'))
+        self.assertEqual(b'event: x\ndata: <a>\ndata: </a>\n\n',
+                format_event('x', u'<a>\n</a>'))
+
+
+class BroadcasterTestCase(TestCase):
+    """
+    Tests for the ``Broadcaster`` class and the event stream view.
+    """
+
+    def setUp(self):
+        super(BroadcasterTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        self.settings_manager.set(GECKOBOARD_SSE_KEEPALIVE=0.01)
+        register_widget('visitors', visitors)
+        values[:] = [10]
+        self.broadcaster = ManualBroadcaster(interval=10)
+        self._broadcaster = sse._broadcaster
+        sse._broadcaster = self.broadcaster
+
+    def tearDown(self):
+        sse._broadcaster = self._broadcaster
+        unregister_widget('visitors')
+        super(BroadcasterTestCase, self).tearDown()
+
+    def test_single_computation(self):
+        subscriptions = [self.broadcaster.subscribe(['visitors'])
+                for i in range(5)]
+        self.broadcaster.poll_once(now=1000)
+        self.assertEqual(2, len(values))
+        for subscription in subscriptions:
+            updates = subscription.updates(0)
+            self.assertEqual(1, len(updates))
+            self.assertTrue(b'10' in updates[0][1])
+        late = self.broadcaster.subscribe(['visitors'])
+        self.assertEqual(1, len(late.updates(0)))
+
+    def test_changes_only(self):
+        subscription = self.broadcaster.subscribe(['visitors'])
+        self.assertEqual(10, self.broadcaster.poll_once(now=1000))
+        subscription.updates(0)
+        self.broadcaster.poll_once(now=1005)
+        self.assertEqual(2, len(values))
+        self.broadcaster.poll_once(now=1010)
+        self.assertEqual([], subscription.updates(0))
+        values.append(20)
+        self.broadcaster.poll_once(now=1020)
+        self.assertTrue(b'20' in subscription.updates(0)[0][1])
+
+    def test_unsubscribe(self):
+        subscription = self.broadcaster.subscribe(['visitors'])
+        self.broadcaster.unsubscribe(subscription)
+        self.broadcaster.poll_once(now=1000)
+        self.assertEqual([10], values)
+
+    def test_unknown_widget(self):
+        self.assertRaises(ValueError, self.broadcaster.subscribe,
+                ['unknown'])
+
+    @unittest.skipIf(sse.StreamingHttpResponse is None,
+            "Streaming responses need Django 1.5")
+    def test_view(self):
+        request = HttpRequest()
+        request.GET['widgets'] = 'visitors'
+        response = widget_events(request)
+        self.assertEqual('text/event-stream', response['Content-Type'])
+        stream = iter(response)
+        self.assertEqual(b'retry: 5000\n\n', next(stream))
+        self.assertEqual(b': keepalive\n\n', next(stream))
+        self.broadcaster.poll_once()
+        self.assertEqual(b'event: visitors\ndata: {"item": [{"value": 10}]}'
+                b'\n\n', next(stream))
+        stream.close()
+        self.assertEqual({}, self.broadcaster._channels)
+
+    @unittest.skipIf(sse.StreamingHttpResponse is not None,
+            "Streaming responses are available")
+    def test_old_django(self):
+        request = HttpRequest()
+        request.GET['widgets'] = 'visitors'
+        self.assertRaises(ImproperlyConfigured, widget_events, request)
+
+    @unittest.skipIf(sse.StreamingHttpResponse is None,
+            "Streaming responses need Django 1.5")
+    def test_view_errors(self):
+        request = HttpRequest()
+        self.assertEqual(400, widget_events(request).status_code)
+        request.GET['widgets'] = 'unknown'
+        self.assertEqual(400, widget_events(request).status_code)
+        self.settings_manager.set(GECKOBOARD_API_KEY='abc')
+        self.assertEqual(403, widget_events(request).status_code)
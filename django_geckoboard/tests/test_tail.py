@@ -0,0 +1,146 @@
+"""
+Tests for the incremental file tails.
+"""
+
+import os
+import shutil
+import tempfile
+
+from django.http import HttpRequest
+
+from django_geckoboard.decorators import rag_widget, text_widget, TEXT_WARN
+from django_geckoboard.tail import FileTail
+from django_geckoboard.tests.utils import TestCase
+
+
+class FileTailTestCase(TestCase):
+    """
+    Tests for `FileTail`.
+    """
+
+    def setUp(self):
+        super(FileTailTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'app.log')
+        self.tail = FileTail(self.path, pattern='ERROR', max_lines=3,
+                counters={'errors': 'ERROR', 'warnings': r'^WARN'})
+
+    def tearDown(self):
+        self.tail.close()
+        shutil.rmtree(self.directory)
+        super(FileTailTestCase, self).tearDown()
+
+    def append(self, *lines):
+        with open(self.path, 'ab') as f:
+            f.write(''.join(lines).encode('utf-8'))
+
+    def test_missing_file(self):
+        self.assertEqual(0, self.tail.update())
+        self.assertEqual([], self.tail.lines())
+        self.assertEqual(None, self.tail.checkpoint)
+
+    def test_incremental(self):
+        self.append('INFO start\n', 'ERROR one\n')
+        self.assertEqual(2, self.tail.update())
+        offset = self.tail.checkpoint[2]
+        self.assertEqual(os.path.getsize(self.path), offset)
+        self.assertEqual(0, self.tail.update())
+        self.append('WARN slow\n', 'ERROR two\n')
+        self.assertEqual(2, self.tail.update())
+        self.assertEqual([u'ERROR two', u'ERROR one'], self.tail.lines())
+        self.assertEqual({'errors': 2, 'warnings': 1}, self.tail.counts())
+        self.assertEqual(4, self.tail.stats()['lines'])
+
+    def test_partial_line(self):
+        self.append('ERROR par')
+        self.assertEqual(0, self.tail.update())
+        self.append('tial\r\n')
+        self.assertEqual(1, self.tail.update())
+        self.assertEqual([u'ERROR partial'], self.tail.lines())
+
+    def test_ring_buffer(self):
+        self.append(*['ERROR %d\n' % i for i in range(10)])
+        self.assertEqual([u'ERROR 9', u'ERROR 8', u'ERROR 7'],
+                self.tail.lines())
+        self.assertEqual([u'ERROR 9'], self.tail.lines(1))
+        self.assertEqual(10, self.tail.counts()['errors'])
+
+    def test_rotation(self):
+        self.append('ERROR old\n')
+        self.tail.update()
+        self.append('ERROR unread\n', 'ERROR unterminated')
+        os.rename(self.path, self.path + '.1')
+        self.assertEqual(2, self.tail.update())
+        self.append('ERROR new\n')
+        self.assertEqual(1, self.tail.update())
+        self.assertEqual([u'ERROR new', u'ERROR unterminated',
+                u'ERROR unread'], self.tail.lines())
+        self.assertEqual(1, self.tail.stats()['rotations'])
+        self.assertEqual(len('ERROR new\n'), self.tail.checkpoint[2])
+
+    def test_truncation(self):
+        self.append('ERROR before truncation\n')
+        self.tail.update()
+        open(self.path, 'wb').close()
+        self.append('ERROR after\n')
+        self.assertEqual(1, self.tail.update())
+        self.assertEqual(u'ERROR after', self.tail.lines()[0])
+        self.assertEqual(1, self.tail.stats()['truncations'])
+
+    def test_truncation_past_offset(self):
+        self.append('ERROR before truncation\n')
+        self.tail.update()
+        open(self.path, 'wb').close()
+        self.append('ERROR after truncation, longer\n')
+        self.assertEqual(1, self.tail.update())
+        self.assertEqual(u'ERROR after truncation, longer',
+                self.tail.lines()[0])
+        self.assertEqual(1, self.tail.stats()['truncations'])
+
+    def test_checkpoint(self):
+        self.append('ERROR one\n')
+        self.tail.update()
+        checkpoint = self.tail.checkpoint
+        self.append('ERROR two\n')
+        tail = FileTail(self.path, checkpoint=checkpoint)
+        try:
+            self.assertEqual([u'ERROR two'], tail.lines())
+        finally:
+            tail.close()
+        with open(self.path, 'wb') as f:
+            f.write(b'ERROR new\nERROR file\n')
+        tail = FileTail(self.path, checkpoint=checkpoint)
+        try:
+            self.assertEqual([u'ERROR file', u'ERROR new'], tail.lines())
+        finally:
+            tail.close()
+
+    def test_backlog(self):
+        self.append('ERROR skipped\n', 'ERROR kept\n')
+        tail = FileTail(self.path, backlog=len('ERROR kept\n') + 3)
+        try:
+            self.assertEqual([u'ERROR kept'], tail.lines())
+        finally:
+            tail.close()
+
+    def test_widgets(self):
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        request = HttpRequest()
+        request.GET['format'] = '2'
+        self.append('ERROR disk full\n', 'WARN slow request\n')
+
+        @text_widget
+        def errors(request):
+            return [(line, TEXT_WARN) for line in self.tail.lines(1)]
+
+        @rag_widget
+        def levels(request):
+            counts = self.tail.counts()
+            return ((counts['errors'], 'Errors'),
+                    (counts['warnings'], 'Warnings'), (None, None))
+
+        self.assertEqual('{"item": [{"text": "ERROR disk full", '
+                '"type": 1}]}', errors(request).content)
+        self.assertEqual('{"item": [{"value": 1, "text": "Errors"}, '
+                '{"value": 1, "text": "Warnings"}, '
+                '{"value": "", "text": null}]}', levels(request).content)
@@ -0,0 +1,179 @@
+"""
+Tests for the t-digest quantile sketches.
+"""
+
+import json
+import random
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from django.core.cache import cache
+from django.http import HttpRequest
+
+from django_geckoboard.tdigest import QuantileTracker, TDigest, \
+        quantile_widget
+from django_geckoboard.tests.utils import TestCase
+
+
+QUANTILES = (0.01, 0.1, 0.5, 0.9, 0.95, 0.99, 0.999)
+
+
+def _distributions():
+    rnd = random.Random(1)
+    return {
+        'uniform': [rnd.uniform(0, 1000) for i in range(50000)],
+        'exponential': [rnd.expovariate(0.01) for i in range(50000)],
+        'lognormal': [rnd.lognormvariate(3, 1.5) for i in range(50000)],
+    }
+
+def _tolerance(q):
+    """Return the allowed error in rank of the estimate of quantile `q`."""
+    return min(0.001, 0.25 * min(q, 1 - q))
+
+def _rank(ordered, value):
+    """Return the fraction of the samples smaller than `value`."""
+    low = 0
+    high = len(ordered)
+    while low < high:
+        middle = (low + high) // 2
+        if ordered[middle] < value:
+            low = middle + 1
+        else:
+            high = middle
+    return low / float(len(ordered))
+
+
+class TDigestTestCase(TestCase):
+    """
+    Tests for the ``TDigest`` class.
+    """
+
+    def assertAccurate(self, samples, digest):
+        ordered = sorted(samples)
+        for q in QUANTILES:
+            estimate = digest.quantile(q)
+            rank = _rank(ordered, estimate)
+            self.assertTrue(abs(rank - q) <= _tolerance(q),
+                    "quantile %s: %s has rank %s" % (q, estimate, rank))
+
+    def test_accuracy(self):
+        for name, samples in _distributions().items():
+            digest = TDigest()
+            digest.update(samples)
+            self.assertAccurate(samples, digest)
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_accuracy_against_numpy(self):
+        for name, samples in _distributions().items():
+            digest = TDigest()
+            digest.update(samples)
+            for q in QUANTILES:
+                low, high = numpy.percentile(samples, [
+                        100 * (q - _tolerance(q)), 100 * (q + _tolerance(q))])
+                self.assertTrue(low <= digest.quantile(q) <= high,
+                        "quantile %s: %s is not between %s and %s"
+                        % (q, digest.quantile(q), low, high))
+
+    def test_merge(self):
+        samples = _distributions()['exponential']
+        digests = []
+        for i in range(10):
+            digest = TDigest()
+            digest.update(samples[i::10])
+            digests.append(digest)
+        merged = TDigest()
+        for digest in digests:
+            merged.merge(digest)
+        self.assertEqual(len(samples), merged.count)
+        self.assertEqual(min(samples), merged.min)
+        self.assertEqual(max(samples), merged.max)
+        self.assertAccurate(samples, merged)
+
+    def test_bounded_size(self):
+        digest = TDigest(compression=50)
+        digest.update(range(100000))
+        self.assertTrue(len(digest.centroids()) <= 50)
+
+    def test_small_digests(self):
+        digest = TDigest()
+        self.assertEqual(None, digest.quantile(0.5))
+        digest.add(5)
+        self.assertEqual(5, digest.quantile(0.99))
+        digest.update([1, 9])
+        self.assertEqual(1, digest.quantile(0))
+        self.assertEqual(5, digest.quantile(0.5))
+        self.assertEqual(9, digest.quantile(1))
+        self.assertRaises(ValueError, digest.quantile, 1.5)
+
+    def test_serialization(self):
+        digest = TDigest()
+        digest.update(_distributions()['lognormal'])
+        copy = TDigest.from_bytes(digest.to_bytes())
+        self.assertEqual(digest.centroids(), copy.centroids())
+        self.assertEqual((digest.min, digest.max), (copy.min, copy.max))
+        self.assertEqual(digest.quantile(0.95), copy.quantile(0.95))
+        self.assertEqual(None, TDigest.from_bytes(TDigest().to_bytes()).min)
+
+
+class QuantileTrackerTestCase(TestCase):
+    """
+    Tests for the ``QuantileTracker`` class.
+    """
+
+    def setUp(self):
+        super(QuantileTrackerTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        cache.clear()
+        self.now = 1000 * 60.0 + 30
+
+    def test_windows(self):
+        tracker = QuantileTracker('response_time', bucket_size=60)
+        tracker.update(range(1, 101), timestamp=self.now - 60)
+        tracker.update(range(1001, 1101), timestamp=self.now)
+        self.assertEqual((1001, 1100), (tracker.digest(60, self.now).min,
+                tracker.digest(60, self.now).max))
+        tracker.flush()
+        other = QuantileTracker('response_time', bucket_size=60)
+        value, low, high = other.gauge(0.5, 120, now=self.now)
+        self.assertEqual((1, 1100), (low, high))
+        self.assertTrue(100 <= value <= 1001)
+        tracker.add(2000, timestamp=self.now)
+        tracker.flush()
+        self.assertEqual(2000, other.digest(60, self.now).max)
+        self.assertEqual(101, other.digest(60, self.now).count)
+
+    def test_concurrent_flush(self):
+        tracker = QuantileTracker('response_time', bucket_size=60)
+        tracker.update([1, 2, 3], timestamp=self.now)
+        lock_key = tracker._cache_key(tracker._bucket(self.now)) + ':lock'
+        cache.add(lock_key, 1, 60)
+        tracker.flush()
+        other = QuantileTracker('response_time', bucket_size=60)
+        self.assertEqual(0, other.digest(60, self.now).count)
+        self.assertEqual(3, tracker.digest(60, self.now).count)
+        tracker.add(4, timestamp=self.now)
+        cache.delete(lock_key)
+        tracker.flush()
+        self.assertEqual(4, other.digest(60, self.now).count)
+        self.assertEqual(4, tracker.digest(60, self.now).count)
+
+    def test_gauge_limits(self):
+        tracker = QuantileTracker('response_time')
+        self.assertEqual((0, 0, 500), tracker.gauge(0.95, 60, maximum=500))
+        tracker.update([100, 200, 300])
+        self.assertEqual((200, 0, 500),
+                tracker.gauge(0.5, 60, minimum=0, maximum=500))
+
+    def test_widget(self):
+        tracker = QuantileTracker('response_time')
+        tracker.update([100, 200, 300])
+        view = quantile_widget(tracker, 0.5, 60, minimum=0, maximum=500)
+        request = HttpRequest()
+        request.POST['format'] = '2'
+        data = json.loads(view(request).content.decode('utf-8'))
+        self.assertEqual(200, data['item'])
+        self.assertEqual({'value': 500}, data['max'])
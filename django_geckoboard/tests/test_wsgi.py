@@ -0,0 +1,119 @@
+"""
+Tests for the widget dispatcher WSGI application.
+"""
+
+import base64
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+from django_geckoboard.decorators import number_widget
+from django_geckoboard.registry import register_widget, unregister_widget, \
+        get_widget, registered_widgets
+from django_geckoboard.tests.utils import TestCase
+from django_geckoboard.wsgi import WidgetDispatcher
+
+
+@number_widget
+def comments(request):
+    return (10, 5)
+
+@number_widget
+def broken(request):
+    raise RuntimeError("broken")
+
+def not_a_widget(request):
+    pass
+
+def application(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b"django"]
+
+
+class DispatcherTestCase(TestCase):
+    """
+    Tests for serving registered widgets through `WidgetDispatcher`.
+    """
+
+    def setUp(self):
+        super(DispatcherTestCase, self).setUp()
+        self.settings_manager.delete('GECKOBOARD_API_KEY')
+        self.settings_manager.set(DEBUG_PROPAGATE_EXCEPTIONS=False)
+        register_widget('comments', comments)
+        register_widget('/broken/', broken)
+        self.dispatcher = WidgetDispatcher(application)
+
+    def tearDown(self):
+        unregister_widget('comments')
+        unregister_widget('broken')
+        super(DispatcherTestCase, self).tearDown()
+
+    def _call(self, path, dispatcher=None, body=b'', **environ):
+        environ['PATH_INFO'] = path
+        if body:
+            environ.update({
+                'REQUEST_METHOD': 'POST',
+                'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+                'CONTENT_LENGTH': str(len(body)),
+            })
+        environ['wsgi.input'] = BytesIO(body)
+        setup_testing_defaults(environ)
+        result = {}
+        def start_response(status, headers):
+            result['status'] = status
+            result['headers'] = dict(headers)
+        content = b''.join((dispatcher or self.dispatcher)(environ,
+                start_response))
+        return result['status'], result['headers'], content
+
+    def test_registry(self):
+        self.assertTrue(get_widget('/comments/') is comments.widget)
+        self.assertTrue('broken' in registered_widgets())
+        self.assertEqual(None, get_widget('missing'))
+        self.assertRaises(ValueError, register_widget, 'x', not_a_widget)
+
+    def test_xml(self):
+        status, headers, content = self._call('/geckoboard/comments')
+        self.assertEqual('200 OK', status)
+        self.assertEqual('<?xml version="1.0" ?><root><item><value>10</value>'
+                '</item><item><value>5</value></item></root>', content)
+        self.assertEqual(str(len(content)), headers['Content-Length'])
+
+    def test_json_post(self):
+        status, headers, content = self._call('/geckoboard/comments/',
+                body=b'format=2')
+        self.assertEqual('200 OK', status)
+        self.assertEqual('{"item": [{"value": 10}, {"value": 5}]}', content)
+
+    def test_json_get(self):
+        status, headers, content = self._call('/geckoboard/comments/',
+                QUERY_STRING='format=2')
+        self.assertEqual('{"item": [{"value": 10}, {"value": 5}]}', content)
+
+    def test_api_key(self):
+        self.settings_manager.set(GECKOBOARD_API_KEY='abc')
+        status, headers, content = self._call('/geckoboard/comments/')
+        self.assertEqual('403 Forbidden', status)
+        auth = 'Basic %s' % base64.b64encode(b'abc:X').decode('ascii')
+        status, headers, content = self._call('/geckoboard/comments/',
+                HTTP_AUTHORIZATION=auth)
+        self.assertEqual('200 OK', status)
+
+    def test_passes_other_requests(self):
+        for path in ('/geckoboard/missing/', '/comments/', '/'):
+            status, headers, content = self._call(path)
+            self.assertEqual(b"django", content)
+
+    def test_not_found_without_application(self):
+        status, headers, content = self._call('/geckoboard/missing/',
+                dispatcher=WidgetDispatcher())
+        self.assertEqual('404 Not Found', status)
+
+    def test_prefix(self):
+        dispatcher = WidgetDispatcher(application, prefix='dashboard')
+        status, headers, content = self._call('/dashboard/comments/',
+                dispatcher=dispatcher)
+        self.assertEqual('200 OK', status)
+
+    def test_error(self):
+        status, headers, content = self._call('/geckoboard/broken/')
+        self.assertEqual('500 Internal Server Error', status)
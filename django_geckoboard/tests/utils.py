@@ -6,7 +6,8 @@ from django.conf import settings
 from django.core.management import call_command
 from django.db.models import loading
 from django.test.simple import run_tests as django_run_tests
-from django.test.testcases import TestCase as DjangoTestCase
+from django.test.testcases import TestCase as DjangoTestCase, \
+        TransactionTestCase as DjangoTransactionTestCase
 
 
 def run_tests(labels=()):
@@ -30,6 +31,21 @@ class TestCase(DjangoTestCase):
         self.settings_manager.revert()
 
 
+class TransactionTestCase(DjangoTransactionTestCase):
+    """
+    Base test case for tests that need real transactions, for example
+    because they share the database with other processes.
+
+    Includes the settings manager.
+    """
+
+    def setUp(self):
+        self.settings_manager = TestSettingsManager()
+
+    def tearDown(self):
+        self.settings_manager.revert()
+
+
 class TestSettingsManager(object):
     """
     From: http://www.djangosnippets.org/snippets/1011/
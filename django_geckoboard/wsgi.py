@@ -0,0 +1,88 @@
+"""
+WSGI application serving registered widgets without Django middleware.
+
+Geckoboard polls do not need sessions, authentication, CSRF protection
+or messages, but a request routed through the Django handler runs the
+complete middleware stack and URL resolution before it reaches the
+widget view.  `WidgetDispatcher` serves the widgets registered with
+`django_geckoboard.registry` directly and passes all other requests on
+to the Django application.
+"""
+
+import logging
+import sys
+
+try:
+    from httplib import responses
+except ImportError:
+    from http.client import responses  # Python 3
+
+from django.conf import settings
+from django.core import signals
+from django.core.handlers.wsgi import WSGIRequest
+
+from django_geckoboard.decorators import _is_api_key_correct
+from django_geckoboard.registry import get_widget
+
+
+logger = logging.getLogger('django_geckoboard')
+
+
+class WidgetDispatcher(object):
+    """
+    A WSGI application serving registered widgets under `prefix`.
+
+    Requests for a registered widget are checked for the API key and
+    answered by the widget; the Django handler, its middleware and the
+    URLconf are not used.  Other requests are passed on to
+    `application`, or answered with 404 Not Found if there is none.
+    """
+
+    def __init__(self, application=None, prefix='/geckoboard/'):
+        self.application = application
+        self.prefix = '/' + prefix.strip('/') + '/'
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        widget = None
+        if path.startswith(self.prefix):
+            widget = get_widget(path[len(self.prefix):])
+        if widget is None:
+            if self.application is not None:
+                return self.application(environ, start_response)
+            return _respond(start_response, 404, [], b"Not found")
+        # Database connections are closed by the request_finished
+        # signal, as in the Django handler.
+        signals.request_started.send(sender=self.__class__)
+        try:
+            status, headers, content = self._serve(widget, environ)
+        finally:
+            signals.request_finished.send(sender=self.__class__)
+        return _respond(start_response, status, headers, content)
+
+    def _serve(self, widget, environ):
+        try:
+            request = WSGIRequest(environ)
+            if not _is_api_key_correct(request):
+                return 403, [], b"Geckoboard API key incorrect"
+            response = widget._respond(request, (), {})
+        except Exception:
+            if getattr(settings, 'DEBUG_PROPAGATE_EXCEPTIONS', False):
+                raise
+            logger.error("Internal error serving widget %s", widget.name,
+                    exc_info=sys.exc_info())
+            return 500, [], b"Internal server error"
+        return response.status_code, list(response.items()), \
+                response.content
+
+
+def _respond(start_response, status, headers, content):
+    header_names = set(name.lower() for name, value in headers)
+    if 'content-type' not in header_names:
+        headers.append(('Content-Type', 'text/html; charset=%s'
+                % settings.DEFAULT_CHARSET))
+    if 'content-length' not in header_names:
+        headers.append(('Content-Length', str(len(content))))
+    start_response('%d %s' % (status, responses.get(status, 'UNKNOWN')),
+            [(str(name), str(value)) for name, value in headers])
+    return [content]
@@ -46,6 +46,9 @@ setup(
     author_email = django_geckoboard.__email__,
     packages = [
         'django_geckoboard',
+        'django_geckoboard.management',
+        'django_geckoboard.management.commands',
+        'django_geckoboard.migrations',
         'django_geckoboard.tests',
     ],
     keywords = ['django', 'geckoboard'],